@@ -0,0 +1,121 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from glob import glob
+from pathlib import Path
+import os
+import time as tme
+from dotenv import load_dotenv
+import pandas as pd
+
+MODELS = {'model_jalon1': 'ModelJalon1', 'model_jalon2': 'ModelJalon2', 'model_jalon3': 'ModelJalon3'}
+
+# Gurobi environment of a worker process, shared by all the models it builds
+_env = None
+
+
+def init_worker(threads):
+    """Start the Gurobi environment of a worker process with its share of the Threads, the license being checked out once per worker"""
+    import gurobipy as gp
+
+    global _env
+    _env = gp.Env(empty=True)
+    _env.setParam('Threads', threads)
+    _env.start()
+
+
+def solve_instances(model_name, instances, time_limit=None, backend=None):
+    """Solve the instances one after the other in a worker process, the next instance being loaded in a thread while
+    the current one is built and solved (Gurobi releases the GIL while solving). Returns one summary row per instance."""
+    import importlib
+    from utils.utils_instance import load_instance
+
+    model_class = getattr(importlib.import_module(model_name), MODELS[model_name])
+    rows = []
+    with ThreadPoolExecutor(max_workers=1) as loader:
+        pending = loader.submit(load_instance, instances[0])
+        for i, fichier in enumerate(instances):
+            current = pending
+            if i + 1 < len(instances):
+                pending = loader.submit(load_instance, instances[i + 1])
+            row = {'instance': Path(fichier).stem, 'model': model_name, 'worker': os.getpid(), 'threads': _env.getParam('Threads')}
+            start = tme.time()
+            model = None
+            try:
+                instance = current.result()
+                # load time not hidden behind the previous solve
+                row['load_wait_time'] = tme.time() - start
+                model = model_class(backend=backend, fichier=fichier, env=_env, instance=instance)
+                if time_limit is not None:
+                    model.time_limit = time_limit
+                row['build_time'] = model.constraint_variable_time - model.data_loaded_time
+                solve_start = tme.time()
+                model.optimize()
+                row['solve_time'] = tme.time() - solve_start
+                row['status'] = model.solution.status
+                row['objective'] = model.solution.objective
+                results_start = tme.time()
+                model.results_paths = []
+                model.get_results()
+                telemetry_paths = model.save_telemetry()
+                row['results_time'] = tme.time() - results_start
+                row['outputs'] = '; '.join(map(str, model.results_paths + telemetry_paths))
+                if telemetry_paths:
+                    row |= {name: value for name, value in model.telemetry.summary().items() if name.startswith('time_to')}
+            except Exception as error:
+                row['status'] = f'error: {error}'
+            finally:
+                if model is not None:
+                    model.model.dispose()
+            row['total_time'] = tme.time() - start
+            print(f"Batch: {row['instance']} {row['status']} in {row['total_time']:.1f}s (worker {row['worker']})")
+            rows.append(row)
+    return rows
+
+
+def expand_instances(patterns):
+    """Instance files of a list of files and glob patterns, in order and without duplicates"""
+    instances = []
+    for pattern in patterns:
+        for fichier in sorted(glob(pattern)) or [pattern]:
+            if fichier not in instances:
+                instances.append(fichier)
+    return instances
+
+
+def batch(model_name, instances, processes, threads, time_limit=None, backend=None):
+    """Solve every instance with the model in a pool of worker processes, the threads being split between the workers.
+    Returns the summary DataFrame (timings, status, objective and results files of each instance)."""
+    processes = max(1, min(processes, len(instances)))
+    threads_per_worker = max(1, threads // processes)
+    # largest instances first, dealt round robin so that the workers get a similar load
+    ordered = sorted(instances, key=lambda fichier: Path(fichier).stat().st_size if Path(fichier).exists() else 0, reverse=True)
+    chunks = [ordered[worker::processes] for worker in range(processes)]
+    print(f'Batch: {len(instances)} instances, {processes} workers with {threads_per_worker} Gurobi threads each')
+    rows = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(threads_per_worker,)) as pool:
+        futures = [pool.submit(solve_instances, model_name, chunk, time_limit, backend) for chunk in chunks]
+        for future in as_completed(futures):
+            rows += future.result()
+    order = {Path(fichier).stem: i for i, fichier in enumerate(instances)}
+    return pd.DataFrame(sorted(rows, key=lambda row: order[row['instance']]))
+
+
+if __name__ == '__main__':
+    load_dotenv(override=True)
+    parser = argparse.ArgumentParser(description='Solve a set of instances with one model in a pool of processes')
+    parser.add_argument('instances', nargs='*', default=['data/*.xlsx'], help='instance files or glob patterns')
+    parser.add_argument('--model', default='model_jalon3', choices=list(MODELS))
+    parser.add_argument('--processes', type=int, default=2, help='worker processes, each solving its instances one after the other')
+    parser.add_argument('--threads', type=int, default=os.cpu_count(), help='Gurobi threads in total, split evenly between the workers')
+    parser.add_argument('--time-limit', type=float, default=None, help='time limit (s) of each instance, the default of the model if unset')
+    parser.add_argument('--backend', default=None, choices=['gurobi', 'highs', 'cpsat'], help='SOLVER_BACKEND in .env by default')
+    parser.add_argument('--output', default=None, help='summary csv, RESULTS_FOLDER_SAVE_PATH/batch_<model>.csv by default')
+    args = parser.parse_args()
+
+    instances = expand_instances(args.instances)
+    batch_start = tme.time()
+    df = batch(args.model, instances, args.processes, args.threads, args.time_limit, args.backend)
+    output = args.output or f"{os.getenv('RESULTS_FOLDER_SAVE_PATH', 'outputs/results')}/batch_{args.model}.csv"
+    df.to_csv(output, index=False)
+    print(df.to_string(index=False))
+    print(f'Batch of {len(instances)} instances solved in {tme.time()-batch_start:.1f}s, summary saved to {output}')
@@ -0,0 +1,64 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+import time as tme
+
+MODELS = {1: ('model_jalon1', 'ModelJalon1'), 2: ('model_jalon2', 'ModelJalon2'), 3: ('model_jalon3', 'ModelJalon3')}
+
+
+def run_backend(jalon, backend, fichier, time_limit, capacity_mode=None):
+    """Build and solve one instance with one backend, in its own process (highspy and ortools can not be loaded together).
+    capacity_mode: 'slot' or 'event' formulation of the voies and agents capacity of jalon 3, CAPACITY_MODE in .env if None"""
+    import importlib
+
+    row = {'instance': Path(fichier).stem, 'jalon': jalon, 'backend': backend, 'capacity_mode': capacity_mode}
+    start = tme.time()
+    try:
+        module, name = MODELS[jalon]
+        options = {'capacity_mode': capacity_mode} if jalon == 3 else {}
+        model = getattr(importlib.import_module(module), name)(backend=backend, fichier=fichier, **options)
+        model.time_limit = time_limit
+        row['load_time'] = model.data_loaded_time - model.start_program_time
+        row['build_time'] = model.constraint_variable_time - model.data_loaded_time
+        if model.backend.builds_model:
+            model.model.update()
+            row['variables'] = model.model.NumVars
+            row['constraints'] = model.model.NumConstrs + model.model.NumQConstrs
+        solve_start = tme.time()
+        model.optimize()
+        row['solve_time'] = tme.time() - solve_start
+        row['status'] = model.solution.status
+        row['objective'] = model.solution.objective
+    except Exception as error:
+        row['status'] = f'error: {error}'
+    row['total_time'] = tme.time() - start
+    return row
+
+
+def benchmark(jalon, backends, instances, time_limit, capacity_modes=(None,)):
+    """Solve every instance with every backend and capacity mode, one process per run. Returns a DataFrame of the times and objectives."""
+    rows = []
+    for fichier in instances:
+        for backend in backends:
+            for capacity_mode in capacity_modes:
+                print(f'Benchmark: jalon {jalon}, {Path(fichier).stem}, {backend}, capacity {capacity_mode}')
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    rows.append(pool.submit(run_backend, jalon, backend, fichier, time_limit, capacity_mode).result())
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the solver backends (Gurobi, HiGHS, CP-SAT) on the instances')
+    parser.add_argument('--jalon', type=int, default=3, choices=[1, 2, 3])
+    parser.add_argument('--backends', nargs='+', default=['gurobi', 'highs', 'cpsat'])
+    parser.add_argument('--instances', nargs='+', default=sorted(str(path) for path in Path('data').glob('*.xlsx')))
+    parser.add_argument('--time-limit', type=float, default=400)
+    parser.add_argument('--capacity-modes', nargs='+', default=[None], choices=['slot', 'event'], help='jalon 3 only, CAPACITY_MODE in .env by default')
+    parser.add_argument('--output', default='outputs/results/benchmark_backends.csv')
+    args = parser.parse_args()
+
+    df = benchmark(args.jalon, args.backends, args.instances, args.time_limit, args.capacity_modes)
+    df.to_csv(args.output, index=False)
+    print(df.to_string(index=False))
+    print(f'Benchmark saved to {args.output}')
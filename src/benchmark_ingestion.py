@@ -0,0 +1,34 @@
+import argparse
+import pandas as pd
+import time as tme
+from utils.utils_data import SHEETS, read_workbook
+
+
+def read_each_sheet(fichier):
+    """Previous load_data: one read_excel call per sheet, the workbook being parsed again each time"""
+    return {sheet: pd.read_excel(fichier, sheet_name=sheet) for sheet in SHEETS}
+
+
+def best_time(function, fichier, repeat):
+    """Best time over repeat calls, and the result of the last one"""
+    times = []
+    for _ in range(repeat):
+        start = tme.perf_counter()
+        result = function(fichier)
+        times.append(tme.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare one read_excel per sheet with the single pass read_workbook')
+    parser.add_argument('instance', nargs='?', default='data/instance_WPY_realiste_jalon3.xlsx')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    each_time, each = best_time(read_each_sheet, args.instance, args.repeat)
+    single_time, single = best_time(read_workbook, args.instance, args.repeat)
+    print(f'{args.instance}: read_excel per sheet {each_time:.3f}s, read_workbook {single_time:.3f}s ({each_time / single_time:.1f}x)')
+    for sheet in SHEETS:
+        # same rows and values, up to the dtypes and the empty cells (NaN or None)
+        same = each[sheet].shape == single[sheet].shape and (each[sheet].fillna('').astype(str).values == single[sheet].fillna('').astype(str).values).all()
+        print(f'    {sheet}: {len(single[sheet])} rows, {"same values" if same else "DIFFERENT values"}')
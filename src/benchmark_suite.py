@@ -0,0 +1,216 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time as tme
+from dotenv import load_dotenv
+import pandas as pd
+
+MODELS = {'model_jalon1': 'ModelJalon1', 'model_jalon2': 'ModelJalon2', 'model_jalon3': 'ModelJalon3'}
+# instances and the models run on them by default, ModelJalon3 needing the roulements of jalon 3 that mini_instance
+# (roulement1 and roulement2) and instance_WPY_realiste_jalon1 (no 'Roulements agents' sheet) do not have
+CASES = {
+    'data/mini_instance.xlsx': ['model_jalon1', 'model_jalon2'],
+    'data/instance_WPY_simple.xlsx': list(MODELS),
+    'data/instance_WPY_realiste_jalon1.xlsx': ['model_jalon1', 'model_jalon2'],
+    'data/instance_WPY_realiste_jalon2.xlsx': list(MODELS),
+    'data/instance_WPY_realiste_jalon3.xlsx': list(MODELS),
+}
+# settings of .env changing the build or the solve, runs are only compared with the runs of the same settings
+SETTINGS = ['BUILD_MODE', 'CAPACITY_MODE', 'WINDOW_SLACK_MINUTES', 'WARM_START']
+# columns of the history, one row per run, instance, model and phase
+COLUMNS = [
+    'run', 'date', 'commit', 'host', 'python', 'settings', 'instance', 'model', 'phase', 'time', 'repeat',
+    'status', 'objective', 'work',
+]
+
+
+def timed(phases, phase, function, *args):
+    """Call function(*args), add its time to phases[phase] and return its result"""
+    start = tme.perf_counter()
+    result = function(*args)
+    phases.setdefault(phase, []).append(tme.perf_counter() - start)
+    return result
+
+
+def data_phases(fichier, repeat):
+    """Times of load_data and of each utils_data helper of parse_instance on the xlsx file (the compiled bundle is not read),
+    repeat times each. Returns {phase: [times]}."""
+    from utils.utils_data import (
+        MACHINE_SHEETS, load_data, calculate_delta_days, format_trains, format_taches_humaines, unavailable_machines, unavailable_chantiers,
+        correspondance_for_depart, find_max_voies
+    )
+    from utils.utils_instance import ROULEMENTS
+
+    phases = {}
+    for _ in range(repeat):
+        (
+            chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df, taches_humaines_df, roulements_agents_df
+        ) = timed(phases, 'load_data', load_data, fichier, MACHINE_SHEETS)
+        j1, jours, first_day = timed(phases, 'calculate_delta_days', calculate_delta_days, sillons_depart_df, sillons_arrivee_df)
+        trains, trains_arr, trains_dep, minutes, machines, machines_durees, minute_slots, chantiers = timed(
+            phases, 'format_trains', format_trains, machines_df, sillons_arrivee_df, sillons_depart_df, chantiers_df, j1, jours, first_day
+        )
+        timed(phases, 'unavailable_machines', unavailable_machines, machines_df, jours, first_day)
+        timed(phases, 'unavailable_chantiers', unavailable_chantiers, chantiers_df, jours, first_day)
+        timed(phases, 'correspondance_for_depart', correspondance_for_depart, trains_dep, trains_arr, correspondances_df, j1)
+        timed(phases, 'find_max_voies', find_max_voies, chantiers_df)
+        if roulements_agents_df is not None and set(ROULEMENTS) <= set(roulements_agents_df['Roulement']):
+            timed(phases, 'format_taches_humaines', format_taches_humaines, taches_humaines_df, roulements_agents_df, jours, first_day, minute_slots)
+    return phases
+
+
+def model_phases(model_name, fichier, repeat, time_limit, seed, threads, results_folder):
+    """Times of the load, variables, constraints, solve, results and plotting phases of one model on one instance,
+    repeat times each, the solve with a fixed Seed and TimeLimit (and Threads if set). The results and images are written
+    to results_folder. Returns ({phase: [times]}, status, objective, work) of the last repeat."""
+    import importlib
+    from utils.utils_data import MACHINE_SHEETS
+    from utils.utils_instance import load_instance
+
+    model_class = getattr(importlib.import_module(model_name), MODELS[model_name])
+    options = {'use_cache': False} if model_name == 'model_jalon3' else {}
+    # the sheets read by the model, jalon 1 and 2 not needing the human tasks sheets of jalon 3
+    required = None if model_name == 'model_jalon3' else MACHINE_SHEETS
+    phases = {}
+    status = objective = work = None
+    for _ in range(repeat):
+        instance = timed(phases, 'load_instance', load_instance, fichier, required)
+        model = model_class(backend='gurobi', fichier=fichier, instance=instance, **options)
+        phases.setdefault('variables', []).append(model.variables_defined_time - model.data_loaded_time)
+        phases.setdefault('constraints', []).append(model.constraint_variable_time - model.variables_defined_time)
+        model.time_limit = time_limit
+        model.model.setParam('Seed', seed)
+        if threads is not None:
+            model.model.setParam('Threads', threads)
+        model.results_folder_save_path = results_folder
+        model.plot = False
+        timed(phases, 'solve', model.optimize)
+        status, objective = model.solution.status, model.solution.objective
+        # deterministic work units of the solve, not changed by the load of the machine
+        work = model.model.Work
+        if model.solution.found:
+            timed(phases, 'get_results', model.get_results)
+            if hasattr(model, 'plot_results'):
+                timed(phases, 'plot_results', model.plot_results)
+        model.model.dispose()
+    return phases, status, objective, work
+
+
+def run_case(instance, model_name, repeat, time_limit, seed, threads, results_folder):
+    """Rows (phase, time, status, objective, work) of one instance and one model ('data' for the data phases), the
+    median time over the repeats, in its own process so that the cases do not share memory nor caches"""
+    status = objective = work = None
+    try:
+        if model_name == 'data':
+            phases = data_phases(instance, repeat)
+        else:
+            phases, status, objective, work = model_phases(model_name, instance, repeat, time_limit, seed, threads, results_folder)
+    except Exception as error:
+        return [{'phase': 'error', 'status': f'error: {error}'}]
+    return [
+        {
+            'phase': phase, 'time': statistics.median(times), 'repeat': len(times),
+            'status': status, 'objective': objective if phase == 'solve' else None, 'work': work if phase == 'solve' else None,
+        } for phase, times in phases.items()
+    ]
+
+
+def run_context(time_limit, seed, threads):
+    """Run id, date, commit, host and settings of a benchmark run"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        if subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip():
+            commit += '-dirty'
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    settings = {name: os.getenv(name) for name in SETTINGS} | {'time_limit': time_limit, 'seed': seed, 'threads': threads}
+    date = datetime.now()
+    return {
+        'run': date.strftime('%Y%m%d-%H%M%S'), 'date': date.isoformat(timespec='seconds'), 'commit': commit,
+        'host': platform.node(), 'python': platform.python_version(), 'settings': json.dumps(settings, sort_keys=True),
+    }
+
+
+def benchmark(cases, repeat, time_limit, seed, threads, results_folder):
+    """Run the data phases of every instance and the phases of its models ({instance: models}). Returns the rows of the run."""
+    context = run_context(time_limit, seed, threads)
+    rows = []
+    for fichier, models in cases.items():
+        for model_name in ['data'] + models:
+            print(f'Benchmark suite: {Path(fichier).stem}, {model_name}')
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                case = pool.submit(run_case, fichier, model_name, repeat, time_limit, seed, threads, results_folder).result()
+            rows += [context | {'instance': Path(fichier).stem, 'model': model_name} | row for row in case]
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def find_regressions(history, run, threshold, min_delta, window):
+    """Phases of run slower than the median of the last window runs of the history with the same host, settings,
+    instance, model and phase, by more than threshold (relative) and min_delta (seconds). Returns a DataFrame."""
+    rows = []
+    keys = ['host', 'settings', 'instance', 'model', 'phase']
+    previous = history[history['time'].notna()]
+    for row in run[run['time'].notna()].itertuples(index=False):
+        same = previous[(previous[keys] == [getattr(row, key) for key in keys]).all(axis=1)]
+        last_runs = same.sort_values('date').tail(window)
+        if last_runs.empty:
+            continue
+        baseline = last_runs['time'].median()
+        if row.time > baseline * (1 + threshold) and row.time - baseline > min_delta:
+            rows.append({
+                'instance': row.instance, 'model': row.model, 'phase': row.phase, 'time': row.time, 'baseline': baseline,
+                'slowdown': row.time / baseline if baseline > 0 else float('inf'), 'runs': len(last_runs),
+            })
+    return pd.DataFrame(rows, columns=['instance', 'model', 'phase', 'time', 'baseline', 'slowdown', 'runs'])
+
+
+if __name__ == '__main__':
+    load_dotenv(override=True)
+    parser = argparse.ArgumentParser(description='Time every phase of ModelJalon1/2/3 on the data/ instances and check them against the previous runs')
+    parser.add_argument('--instances', nargs='+', default=None, help='instances run with every model of --models, the instances of CASES by default')
+    parser.add_argument('--models', nargs='+', default=None, choices=list(MODELS), help='models run, all the models an instance of CASES can run by default')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every phase, the median time being kept')
+    parser.add_argument('--time-limit', type=float, default=60, help='TimeLimit (s) of every solve')
+    parser.add_argument('--seed', type=int, default=0, help='Gurobi Seed of every solve')
+    parser.add_argument('--threads', type=int, default=None, help='Gurobi Threads of every solve, the Gurobi default if unset')
+    parser.add_argument('--history', default='outputs/benchmarks/history.csv', help='csv the runs are appended to')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown to the median of the previous runs counted as a regression')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='seconds a phase must lose to be a regression, below it is noise')
+    parser.add_argument('--window', type=int, default=5, help='previous runs the baseline is the median of')
+    parser.add_argument('--no-save', action='store_true', help='check the run against the history without appending it')
+    args = parser.parse_args()
+
+    history_path = Path(args.history)
+    results_folder = history_path.parent / 'results'
+    results_folder.mkdir(parents=True, exist_ok=True)
+    if args.instances is None:
+        cases = {fichier: [model for model in models if args.models is None or model in args.models] for fichier, models in CASES.items()}
+    else:
+        cases = {fichier: args.models or list(MODELS) for fichier in args.instances}
+    start = tme.time()
+    df = benchmark(cases, args.repeat, args.time_limit, args.seed, args.threads, str(results_folder))
+    print(df[['instance', 'model', 'phase', 'time', 'status', 'objective']].to_string(index=False))
+    print(f'Benchmark suite run in {tme.time()-start:.1f}s')
+
+    history = pd.read_csv(history_path) if history_path.exists() else pd.DataFrame(columns=COLUMNS)
+    regressions = find_regressions(history, df, args.threshold, args.min_delta, args.window)
+    if not args.no_save:
+        pd.concat([history, df], ignore_index=True).to_csv(history_path, index=False)
+        print(f'Run {df["run"].iloc[0]} appended to {history_path}')
+    errors = df[df['phase'] == 'error']
+    if not errors.empty:
+        print(f'{len(errors)} cases failed:')
+        print(errors[['instance', 'model', 'status']].to_string(index=False))
+    if not regressions.empty:
+        print(f'{len(regressions)} phases slower than the previous runs by more than {100*args.threshold:g}%:')
+        print(regressions.to_string(index=False))
+    if not errors.empty or not regressions.empty:
+        sys.exit(1)
+    print('No regression')
@@ -0,0 +1,21 @@
+import argparse
+from pathlib import Path
+import time as tme
+from utils.utils_data import MACHINE_SHEETS
+from utils.utils_instance import parse_instance, compile_instance, read_bundle
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the xlsx instances into the binary bundles read by load_instance')
+    parser.add_argument('instances', nargs='*', default=sorted(str(path) for path in Path('data').glob('*.xlsx')))
+    args = parser.parse_args()
+
+    for fichier in args.instances:
+        start = tme.time()
+        # the human tasks sheets are compiled if the instance has them
+        instance = parse_instance(fichier, MACHINE_SHEETS)
+        parse_time = tme.time() - start
+        folder = compile_instance(fichier, instance)
+        start = tme.time()
+        read_bundle(folder)
+        print(f'{fichier}: parsed in {parse_time:.3f}s, compiled to {folder}, read back in {tme.time() - start:.3f}s')
@@ -0,0 +1,54 @@
+import argparse
+import json
+from pathlib import Path
+import time as tme
+from utils.utils_data import SHEETS
+from utils.utils_generator import generate_sheets
+from utils.utils_instance import parse_sheets, compile_instance
+from utils.utils_results import write_xlsx
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic instances of the realistic instance scaled up, as xlsx and/or compiled bundles')
+    parser.add_argument('--scales', nargs='+', type=float, default=[2, 10, 100], help='trains a day, voies and agents of the realistic instance multiplied by')
+    parser.add_argument('--days', type=int, default=7, help='days of arrivals, the departures running one day later')
+    parser.add_argument('--start', default='08/08/2022', help='first day (dd/mm/YYYY)')
+    parser.add_argument('--arrivals-per-departure', nargs=2, type=int, default=[1, 4], metavar=('MIN', 'MAX'))
+    parser.add_argument('--wagons', nargs=2, type=int, default=[1, 3], metavar=('MIN', 'MAX'), help='wagons of an arrival train in a departure train')
+    parser.add_argument('--max-delay-days', type=int, default=2, help='days a wagon waits at most between its arrival and departure trains')
+    parser.add_argument('--unavailability', type=float, default=0.1, help='probability of each shift of a machine or a chantier to be unavailable')
+    parser.add_argument('--voies-scale', type=float, default=None, help='voies multiplied by, the scale by default')
+    parser.add_argument('--agents-scale', type=float, default=None, help='agents of the rosters multiplied by, the scale by default')
+    parser.add_argument('--machine-duration', type=int, default=15, help='minutes of a DEB, FOR or DEG')
+    parser.add_argument('--rosters', default=None, help='json file of {roulement: [jours de la semaine, nombre agents, cycles horaires, connaissances chantiers]}')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--formats', nargs='+', default=['xlsx'], choices=['xlsx', 'bundle'], help='bundle writes the compiled instance read by load_instance')
+    parser.add_argument('--output-dir', default='data')
+    args = parser.parse_args()
+
+    rosters = None
+    if args.rosters:
+        with open(args.rosters) as file:
+            rosters = {roulement: tuple(roster) for roulement, roster in json.load(file).items()}
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    for scale in args.scales:
+        fichier = Path(args.output_dir) / f'synthetic_x{scale:g}.xlsx'
+        start = tme.time()
+        sheets = generate_sheets(
+            scale, days=args.days, start=args.start, arrivals_per_departure=args.arrivals_per_departure, wagons=args.wagons,
+            max_delay_days=args.max_delay_days, unavailability=args.unavailability, voies_scale=args.voies_scale, agents_scale=args.agents_scale,
+            machine_duration=args.machine_duration, rosters=rosters, seed=args.seed
+        )
+        times = [f'generated in {tme.time() - start:.2f}s']
+        if 'xlsx' in args.formats:
+            start = tme.time()
+            write_xlsx({sheet: (sheets[sheet], False) for sheet in SHEETS}, str(fichier))
+            times.append(f'xlsx written in {tme.time() - start:.2f}s')
+        if 'bundle' in args.formats:
+            start = tme.time()
+            folder = compile_instance(fichier, parse_sheets([sheets[sheet] for sheet in SHEETS]))
+            times.append(f'compiled to {folder} in {tme.time() - start:.2f}s')
+        print(
+            f"{fichier}: {len(sheets['Sillons arrivee'])} arrival and {len(sheets['Sillons depart'])} departure trains, "
+            f"{len(sheets['Correspondances'])} wagons, {', '.join(times)}"
+        )
@@ -0,0 +1,171 @@
+import heapq
+import math
+import pandas as pd
+from model_jalon1 import ModelJalon1
+from model_jalon2 import ModelJalon2
+from utils.utils_data import MACHINE_SHEETS
+from utils.utils_instance import load_instance
+from utils.utils_results import machine_tasks_frame, write_results
+from utils.utils_window import machine_windows, unavailable_intervals
+from utils.utils_warmstart import is_free, MachineTimeline, SlotCounter
+from utils.display_gantt import display_gantt
+from utils.display_sankey import display_sankey
+from pathlib import Path
+from dotenv import load_dotenv
+import os
+import time as tme
+
+
+class ListScheduler:
+    """Schedule of the machine tasks of jalon 1 / jalon 2 without solver (no Gurobi license needed).
+
+    Event-driven list scheduling: an arrival train is released at its earliest DEB, a departure train once the DEB of
+    all its required arrival trains is placed. Released trains are taken by release time and their tasks put at the
+    earliest start of the 15 minutes grid meeting the constraints of ModelJalon1 (delays 3 to 6, unavailabilities,
+    one train at a time per machine) and, if capacity is set, the max_voies of ModelJalon2. The schedule is feasible but
+    not optimised (jalon 2 minimises the FOR voies). If a train can not be placed in its time window, the MIP of the
+    jalon is solved instead."""
+    def __init__(self, jalon=1, capacity=None):
+        """jalon: 1 or 2, the model used as fallback and for the results format. capacity: check max_voies (default for jalon 2)"""
+        self.start_program_time = tme.time()
+        load_dotenv(override=True)
+        self.results_folder_save_path = os.getenv('RESULTS_FOLDER_SAVE_PATH')
+        self.fichier = os.getenv('FILE_INSTANCE')
+        self.window_slack = int(os.getenv('WINDOW_SLACK_MINUTES')) if os.getenv('WINDOW_SLACK_MINUTES') else None
+        self.jalon = jalon
+        self.capacity = jalon == 2 if capacity is None else capacity
+        self.epsilon = 1
+        self._load_data()
+        self.data_loaded_time = tme.time()
+
+    def _load_data(self):
+        """Load and process input data, as ModelJalon1 and ModelJalon2."""
+        instance = load_instance(self.fichier, MACHINE_SHEETS)
+        self.j1, self.jours, self.first_day = instance.j1, instance.jours, instance.first_day
+        (
+            self.trains, self.trains_arr, self.trains_dep, self.minutes,
+            self.machines, self.machines_durees, self.minute_slots, self.chantiers
+        ) = (
+            instance.trains, instance.trains_arr, instance.trains_dep, instance.minutes,
+            instance.machines, instance.machines_durees, instance.minute_slots, instance.chantiers
+        )
+        self.unavailable_periods = instance.unavailable_periods
+        self.unavailable_periods_chantiers = instance.unavailable_periods_chantiers
+        self.trains_requis_dict = instance.trains_requis_dict
+        self.max_voies = instance.max_voies
+        print('Data loaded')
+
+    def schedule(self):
+        """Place DEB, FOR and DEG of every train. Returns {'a', 'b', 'c': {train: minute}}, None if a train does not fit in its window."""
+        windows = dict(zip(['a', 'b', 'c'], machine_windows(
+            self.trains_arr, self.trains_dep, self.trains_requis_dict, max(self.minutes), self.machines_durees[0], 60, 165, 35, self.window_slack
+        )))
+        unavailability = {
+            resource: unavailable_intervals(periods) for resource, periods in (self.unavailable_periods | self.unavailable_periods_chantiers).items()
+        }
+        timelines = {machine: MachineTimeline(14 + self.epsilon) for machine in ['DEB', 'FOR', 'DEG']}
+        nb_slots = len(self.minute_slots)
+        self.voies = [SlotCounter(nb_slots, capacity) for capacity in self.max_voies]
+        rec, for_, dep = self.voies
+        values = {'a': {}, 'b': {}, 'c': {}}
+
+        def fits(machine, chantier, start):
+            return (
+                timelines[machine].fits(start)
+                and is_free(start, unavailability.get(machine, []), 0, self.epsilon)
+                and is_free(start, unavailability.get(chantier, []), 0, self.epsilon)
+            )
+
+        def grid(lo, hi):
+            return range(15 * math.ceil(lo / 15), hi + 1, 15)
+
+        # departure trains waiting for the DEB of their required arrival trains
+        waiting = {train: set(trains_requis) for train, trains_requis in self.trains_requis_dict.items() if trains_requis}
+        arr_to_dep = {}
+        for train, trains_requis in waiting.items():
+            for train_arr in trains_requis:
+                arr_to_dep.setdefault(train_arr, []).append(train)
+        events = [(windows['a'][train][0], train) for train in self.trains_arr]
+        events += [(windows['b'][train][0], train) for train in self.trains_dep if train not in waiting]
+        heapq.heapify(events)
+
+        while events:
+            release, train = heapq.heappop(events)
+            if train[0] == 'ARR':
+                a = next((
+                    a for a in grid(release, windows['a'][train][1])
+                    if fits('DEB', 'WPY_REC', a) and (not self.capacity or rec.fits(train[2], a + 15))
+                ), None)
+                if a is None:
+                    print(f'No start found for DEB of {train}')
+                    return None
+                values['a'][train] = a
+                timelines['DEB'].add(a)
+                rec.add(train[2], a + 15)
+                for train_dep in arr_to_dep.get(train, []):
+                    waiting[train_dep].discard(train)
+                    if not waiting[train_dep]:
+                        release = max([windows['b'][train_dep][0]] + [values['a'][train_arr] + self.machines_durees[0] for train_arr in self.trains_requis_dict[train_dep]])
+                        heapq.heappush(events, (release, train_dep))
+            else:
+                found = None
+                for b in grid(release, windows['b'][train][1]):
+                    if not fits('FOR', 'WPY_FOR', b):
+                        continue
+                    # latest DEG, a train waits in chantier FOR (more voies) rather than in chantier DEP
+                    found = next((
+                        (b, c) for c in reversed(grid(max(b + 165, windows['c'][train][0]), windows['c'][train][1]))
+                        if fits('DEG', 'WPY_FOR', c) and (not self.capacity or (for_.fits(b, c + 15) and dep.fits(c, train[2])))
+                    ), None)
+                    if found:
+                        break
+                if found is None:
+                    print(f'No start found for FOR and DEG of {train}')
+                    return None
+                b, c = found
+                values['b'][train], values['c'][train] = b, c
+                timelines['FOR'].add(b)
+                timelines['DEG'].add(c)
+                for_.add(b, c + 15)
+                dep.add(c, train[2])
+        return values
+
+    def get_results(self, values):
+        """Save the schedule in the results file of the jalon, same sheets as ModelJalon1/ModelJalon2.get_results."""
+        df_results = machine_tasks_frame(
+            self.trains_arr, self.trains_dep,
+            [values['a'][train] for train in self.trains_arr], [values['b'][train] for train in self.trains_dep], [values['c'][train] for train in self.trains_dep],
+            self.machines, self.machines_durees, self.j1
+        )
+        file_name = Path(self.fichier).stem
+        results_file_path = f'{self.results_folder_save_path}/results_{file_name}_jalon{self.jalon}'
+        written = write_results({"Taches machine": (df_results, False)}, results_file_path)
+        print(f'Results saved to {", ".join(map(str, written))}')
+        if self.jalon == 2:
+            # arrival trains are also counted in chantier FOR by ModelJalon2 (from arrival to the end of DEB)
+            arr_for = SlotCounter(len(self.minute_slots), None)
+            for train in self.trains_arr:
+                arr_for.add(train[2], values['a'][train] + 15)
+            for_count = self.voies[1].counts + arr_for.counts
+            voies = [
+                {
+                    'Taux max voies (%)': 100*used/total,
+                    'Nombre max voies occupées': used,
+                    'Nombre total voies dispo': total,
+                }
+                for used, total in zip([self.voies[0].counts.max(), for_count.max(), self.voies[2].counts.max()], self.max_voies)
+            ]
+            write_results({"Voies utilisation": (pd.DataFrame(voies, index=self.chantiers), True)}, f'{self.results_folder_save_path}/results_{file_name}_voies_jalon2')
+            display_gantt(results_file_path, f"{self.results_folder_save_path}/gantt_{file_name}_jalon2.png")
+            display_sankey(self.fichier, f"{self.results_folder_save_path}/sankey_{file_name}_jalon2.png")
+        return df_results
+
+    def run_optimization(self):
+        """Schedule the trains, and solve the MIP of the jalon only if the list scheduling fails."""
+        values = self.schedule()
+        self.optimisation_time = tme.time()
+        print(f'Time taken for: Data Loading = {self.data_loaded_time-self.start_program_time}s, Scheduling = {1000*(self.optimisation_time-self.data_loaded_time):.1f}ms')
+        if values is None:
+            print(f'List scheduling failed, solving ModelJalon{self.jalon}')
+            return (ModelJalon1 if self.jalon == 1 else ModelJalon2)().run_optimization()
+        return self.get_results(values)
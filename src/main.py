@@ -1,7 +1,14 @@
+from dotenv import load_dotenv
+import os
 from model_jalon1 import ModelJalon1
 from model_jalon2 import ModelJalon2
 from model_jalon3 import ModelJalon3
+from rolling_horizon import RollingHorizonJalon3
 
 if __name__ == '__main__':
-    ModelJalon3().run_optimization() # Choose the model you want to run
+    load_dotenv(override=True)
+    if os.getenv('HORIZON', 'full') == 'rolling':
+        RollingHorizonJalon3().run_optimization() # ModelJalon3 solved day window after day window
+    else:
+        ModelJalon3().run_optimization() # Choose the model you want to run
     print(f"Model created successfully for instance.")
@@ -1,9 +1,12 @@
 from gurobipy import Model, GRB, quicksum
 import pandas as pd
-from utils.utils_data import (
-    format_trains, add_time_reference, unavailable_machines, correspondance_for_depart, unavailable_chantiers, find_max_voies
-)
-from utils.utils_date import minute_to_date2
+from utils.utils_data import MACHINE_SHEETS
+from utils.utils_instance import load_instance
+from utils.utils_results import machine_tasks_frame, write_results
+from utils.utils_window import machine_windows, overlapping_pairs, unavailable_intervals, split_unavailability
+from utils.utils_bigm import BigM
+from utils.utils_backend import get_backend
+from utils.utils_telemetry import solver_telemetry
 from utils.display_gantt import display_gantt
 from utils.display_sankey import display_sankey
 from pathlib import Path
@@ -13,53 +16,97 @@ import time as tme
 
 class ModelJalon2:
     """Optimization model for Jalon 2."""
-    def __init__(self):
-        """Initialize the optimization model."""
+    jalon = 2
+
+    def __init__(self, backend=None, fichier=None, env=None, instance=None):
+        """Initialize the optimization model.
+        backend: 'gurobi', 'highs' or 'cpsat' (see utils_backend), defaults to SOLVER_BACKEND in .env
+        fichier: instance file, defaults to FILE_INSTANCE in .env
+        env: gurobipy Env the model is created in (Threads and license shared by the models of a batch worker), default Env if None
+        instance: Instance of fichier already loaded (prefetched by the batch runner), read with load_instance if None"""
         self.start_program_time = tme.time()
         load_dotenv(override=True)
         self.model_name = os.getenv('MODEL_NAME')
         self.model_save_path = os.getenv('MODEL_SAVE_PATH')
         self.results_folder_save_path = os.getenv('RESULTS_FOLDER_SAVE_PATH')
-        self.fichier = os.getenv('FILE_INSTANCE')
+        self.fichier = fichier or os.getenv('FILE_INSTANCE')
+        self.backend = get_backend(backend or os.getenv('SOLVER_BACKEND', 'gurobi'))
+        # progress of the Gurobi solve recorded by a callback, TELEMETRY in .env
+        self.telemetry = solver_telemetry()
+        self.time_limit = None
+        self.window_slack = int(os.getenv('WINDOW_SLACK_MINUTES')) if os.getenv('WINDOW_SLACK_MINUTES') else None
+        self.epsilon = 1
+        self.instance = instance
+        # gantt and sankey images saved by get_results, plot_results called apart when False (benchmark suite)
+        self.plot = True
 
-        self.model = Model(self.model_name)
+        self.model = Model(self.model_name, env=env)
         self.model.setParam("OutputFlag", 0)
         self._load_data()
         self.data_loaded_time = tme.time()
         self._define_variables()
-        self._define_constraints()
-        self.constraint_variable_time = tme.time()
-        self._define_objective_function()
+        self.variables_defined_time = tme.time()
+        if self.backend.builds_model:
+            self._define_constraints()
+            self.constraint_variable_time = tme.time()
+            self._define_objective_function()
+        else:
+            # CP-SAT builds its own model from the time windows
+            self.constraint_variable_time = tme.time()
     
     def _load_data(self):
         """Load and process input data."""
-        (
-            self.chantiers_df, self.machines_df, self.sillons_arrivee_df,
-            self.sillons_depart_df, self.correspondances_df, self.j1, self.jours, self.first_day
-        ) = add_time_reference(self.fichier)
-        
+        # parsed xlsx, or its compiled bundle when it is fresher (utils_instance), without the human tasks sheets of jalon 3
+        instance = self.instance or load_instance(self.fichier, MACHINE_SHEETS)
+        self.j1, self.jours, self.first_day = instance.j1, instance.jours, instance.first_day
         (
             self.trains, self.trains_arr, self.trains_dep, self.minutes,
             self.machines, self.machines_durees, self.minute_slots, self.chantiers
-        ) = format_trains(
-            self.machines_df, self.sillons_arrivee_df, self.sillons_depart_df, self.chantiers_df,
-            self.j1, self.jours, self.first_day
+        ) = (
+            instance.trains, instance.trains_arr, instance.trains_dep, instance.minutes,
+            instance.machines, instance.machines_durees, instance.minute_slots, instance.chantiers
         )
         
-        self.unavailable_periods, self.start_times = unavailable_machines(self.machines_df, self.jours, self.first_day)
-        self.unavailable_periods_chantiers, self.start_times_chantiers = unavailable_chantiers(self.chantiers_df, self.jours, self.first_day)
-        self.trains_requis_dict = correspondance_for_depart(self.trains_dep, self.trains_arr, self.correspondances_df, self.j1)
-        self.max_voies = find_max_voies(self.chantiers_df)
+        self.unavailable_periods, self.start_times = instance.unavailable_periods, instance.start_times
+        self.unavailable_periods_chantiers, self.start_times_chantiers = instance.unavailable_periods_chantiers, instance.start_times_chantiers
+        self.trains_requis_dict = instance.trains_requis_dict
+        self.max_voies = instance.max_voies
         print('Data loaded')
 
     def _define_variables(self):
         """Define model variables."""
         
+        def define_time_windows():
+            """Compute the time window of each machine task from the delays of constraints 3 to 6, used to bound the start times and prune the machine disjunctions."""
+            horizon = max(self.minutes)
+            self.deb_windows, self.for_windows, self.deg_windows = machine_windows(
+                self.trains_arr, self.trains_dep, self.trains_requis_dict, horizon, self.machines_durees[0], 60, 165, 35, self.window_slack
+            )
+
+            # unavailable periods cutting a window on one side only tighten it, the others get a binary (key -> period)
+            machine_intervals = {machine: unavailable_intervals(periods) for machine, periods in self.unavailable_periods.items()}
+            chantier_intervals = {chantier: unavailable_intervals(periods) for chantier, periods in self.unavailable_periods_chantiers.items()}
+
+            def unavail_periods(windows, intervals, resource):
+                conflicts = split_unavailability(windows, intervals.get(resource, []), self.epsilon, horizon)
+                return {key + (occurrence, start, resource): (start, end) for key, (start, end, occurrence, _) in conflicts}
+
+            self.d_periods = unavail_periods(self.deb_windows, machine_intervals, 'DEB')
+            self.e_periods = unavail_periods(self.for_windows, machine_intervals, 'FOR')
+            self.f_periods = unavail_periods(self.deg_windows, machine_intervals, 'DEG')
+            self.chant_d_periods = unavail_periods(self.deb_windows, chantier_intervals, 'WPY_REC')
+            self.chant_e_periods = unavail_periods(self.for_windows, chantier_intervals, 'WPY_FOR')
+            self.chant_f_periods = unavail_periods(self.deg_windows, chantier_intervals, 'WPY_FOR')
+
+            self.deb_pairs = overlapping_pairs(self.trains_arr, self.deb_windows, self.epsilon)
+            self.for_pairs = overlapping_pairs(self.trains_dep, self.for_windows, self.epsilon)
+            self.deg_pairs = overlapping_pairs(self.trains_dep, self.deg_windows, self.epsilon)
+
         def define_decision_variables():
             """Define decision variables for the optimization model."""
-            self.a = self.model.addVars(self.trains_arr, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="a")
-            self.b = self.model.addVars(self.trains_dep, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="b")
-            self.c = self.model.addVars(self.trains_dep, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="c")
+            self.a = self.model.addVars(self.trains_arr, lb={t: w[0] for t, w in self.deb_windows.items()}, ub={t: w[1] for t, w in self.deb_windows.items()}, vtype=GRB.INTEGER, name="a")
+            self.b = self.model.addVars(self.trains_dep, lb={t: w[0] for t, w in self.for_windows.items()}, ub={t: w[1] for t, w in self.for_windows.items()}, vtype=GRB.INTEGER, name="b")
+            self.c = self.model.addVars(self.trains_dep, lb={t: w[0] for t, w in self.deg_windows.items()}, ub={t: w[1] for t, w in self.deg_windows.items()}, vtype=GRB.INTEGER, name="c")
         
         def define_auxiliary_variables():
             """Define auxiliary variables for the optimization model. To ensure that a,b,c are all 15 minutes."""
@@ -74,22 +121,22 @@ class ModelJalon2:
 
         def define_binary_variables():
             """Define binary variables for the optimization model."""
-            self.d = self.model.addVars(self.trains_arr, 2, self.start_times, vtype=GRB.BINARY, name="d")
-            self.e = self.model.addVars(self.trains_dep, 2, self.start_times, vtype=GRB.BINARY, name="e")
-            self.f = self.model.addVars(self.trains_dep, 2, self.start_times, vtype=GRB.BINARY, name="f")
+            self.d = self.model.addVars(list(self.d_periods), vtype=GRB.BINARY, name="d")
+            self.e = self.model.addVars(list(self.e_periods), vtype=GRB.BINARY, name="e")
+            self.f = self.model.addVars(list(self.f_periods), vtype=GRB.BINARY, name="f")
 
-            self.g_before = self.model.addVars(self.trains_arr, self.trains_arr, range(15), vtype=GRB.BINARY, name="g_before")
-            self.g_after = self.model.addVars(self.trains_arr, self.trains_arr, range(15), vtype=GRB.BINARY, name="g_after")
+            self.g_before = self.model.addVars(self.deb_pairs, vtype=GRB.BINARY, name="g_before")
+            self.g_after = self.model.addVars(self.deb_pairs, vtype=GRB.BINARY, name="g_after")
 
-            self.k_before = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="k_before")
-            self.k_after = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="k_after")
+            self.k_before = self.model.addVars(self.for_pairs, vtype=GRB.BINARY, name="k_before")
+            self.k_after = self.model.addVars(self.for_pairs, vtype=GRB.BINARY, name="k_after")
 
-            self.l_before = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="l_before")
-            self.l_after = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="l_after")
+            self.l_before = self.model.addVars(self.deg_pairs, vtype=GRB.BINARY, name="l_before")
+            self.l_after = self.model.addVars(self.deg_pairs, vtype=GRB.BINARY, name="l_after")
             
-            self.chant_d = self.model.addVars(self.trains_arr, 2, self.start_times_chantiers, vtype=GRB.BINARY, name="chant_d")
-            self.chant_e = self.model.addVars(self.trains_dep, 2, self.start_times_chantiers, vtype=GRB.BINARY, name="chant_e")
-            self.chant_f = self.model.addVars(self.trains_dep, 2, self.start_times_chantiers, vtype=GRB.BINARY, name="chant_f")
+            self.chant_d = self.model.addVars(list(self.chant_d_periods), vtype=GRB.BINARY, name="chant_d")
+            self.chant_e = self.model.addVars(list(self.chant_e_periods), vtype=GRB.BINARY, name="chant_e")
+            self.chant_f = self.model.addVars(list(self.chant_f_periods), vtype=GRB.BINARY, name="chant_f")
             
             self.rec_occup = self.model.addVars(self.trains_arr, self.minute_slots, vtype=GRB.BINARY, name="rec_occup")
             self.for_occup = self.model.addVars(self.trains, self.minute_slots, vtype=GRB.BINARY, name="for_occup")
@@ -102,100 +149,68 @@ class ModelJalon2:
             self.dep_x = self.model.addVars(self.trains_dep, self.minute_slots, vtype=GRB.BINARY, name="dep_x")
             self.dep_y = self.model.addVars(self.trains_dep, self.minute_slots, vtype=GRB.BINARY, name="dep_y")
 
-        define_decision_variables()
-        define_auxiliary_variables()
-        define_binary_variables()
+        define_time_windows()
+        if self.backend.builds_model:
+            define_decision_variables()
+            define_auxiliary_variables()
+            define_binary_variables()
         print('Variables defined')
 
     def _define_constraints(self):
         """Define constraints for the optimization model."""
         self.M = max(self.minutes)+1
-        self.epsilon = 1
+        # smallest valid M of each disjunctive row, from the time windows of its variables
+        self.big_m = BigM(self.M)
     
         def define_unavailability_machines_constraints():
-            """Constraint 1.1: Ensure machines respect unavailable periods."""
-            for machine, periods in self.unavailable_periods.items():
-                for (start_time, end_time) in periods:        
-                    # Loop through trains only once per unavailable period
-                    for t in self.trains: 
-                        if t[0] == 'ARR' and machine == 'DEB':
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.d[t[0], t[1], t[2], 0, start_time[0], machine]))
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.d[t[0], t[1], t[2], 0, start_time[0], machine])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.d[t[0], t[1], t[2], 1,start_time[1], machine]))
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.d[t[0], t[1], t[2], 1,start_time[1], machine])
-                        elif t[0] == 'DEP' and machine == 'FOR':
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.e[t[0], t[1], t[2], 0, start_time[0], machine]))
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.e[t[0], t[1], t[2], 0, start_time[0], machine])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.e[t[0], t[1], t[2], 1,start_time[1], machine]))
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.e[t[0], t[1], t[2], 1,start_time[1], machine])
-                        elif t[0] == 'DEP' and machine == 'DEG':
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.f[t[0], t[1], t[2], 0, start_time[0], machine]))
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.f[t[0], t[1], t[2], 0, start_time[0], machine])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.f[t[0], t[1], t[2], 1,start_time[1], machine]))
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.f[t[0], t[1], t[2], 1,start_time[1], machine])
+            """Constraint 1.1: Ensure machines respect unavailable periods. Periods only cutting one side of a window are already bounds of the start times."""
+            for start, binaries, periods, windows in [
+                (self.a, self.d, self.d_periods, self.deb_windows),
+                (self.b, self.e, self.e_periods, self.for_windows),
+                (self.c, self.f, self.f_periods, self.deg_windows),
+            ]:
+                for key, (start_time, end_time) in periods.items():
+                    t = key[:3]
+                    lo, hi = windows[t]
+                    self.model.addConstr(start[t] <= start_time - self.epsilon + self.big_m('unavail_machine', hi - start_time + self.epsilon) * (1 - binaries[key]))
+                    self.model.addConstr(start[t] >= end_time + self.epsilon - self.big_m('unavail_machine', end_time + self.epsilon - lo) * binaries[key])
 
             print('1.1: Unavailability machine constraint defined')
 
         def define_unavailability_chantier_constraints():
-            """Constraint 1.2: Ensure chantier respect unavailable periods."""
-            for chantier, periods in self.unavailable_periods_chantiers.items():
-                for (start_time, end_time) in periods:        
-                    # Loop through trains only once per unavailable period
-                    for t in self.trains: 
-                        if t[0] == 'ARR' and chantier == 'WPY_REC':
-                            # Machine DEB
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.chant_d[t[0], t[1], t[2], 0, start_time[0], chantier]))
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.chant_d[t[0], t[1], t[2], 0, start_time[0], chantier])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.chant_d[t[0], t[1], t[2], 1, start_time[1], chantier]))
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.chant_d[t[0], t[1], t[2], 1, start_time[1], chantier])
-                        
-                        elif t[0] == 'DEP' and chantier == 'WPY_FOR':
-                            # Machine FOR
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.chant_e[t[0], t[1], t[2], 0, start_time[0], chantier]))
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.chant_e[t[0], t[1], t[2], 0, start_time[0], chantier])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.chant_e[t[0], t[1], t[2], 1, start_time[1], chantier]))
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.chant_e[t[0], t[1], t[2], 1, start_time[1], chantier])
-                            
-                            # Machine DEG
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.chant_f[t[0], t[1], t[2], 0, start_time[0], chantier]))
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.chant_f[t[0], t[1], t[2], 0, start_time[0], chantier])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.chant_f[t[0], t[1], t[2], 1, start_time[1], chantier]))
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.chant_f[t[0], t[1], t[2], 1, start_time[1], chantier])
+            """Constraint 1.2: Ensure chantier respect unavailable periods. Periods only cutting one side of a window are already bounds of the start times."""
+            for start, binaries, periods, windows in [
+                (self.a, self.chant_d, self.chant_d_periods, self.deb_windows),
+                (self.b, self.chant_e, self.chant_e_periods, self.for_windows),
+                (self.c, self.chant_f, self.chant_f_periods, self.deg_windows),
+            ]:
+                for key, (start_time, end_time) in periods.items():
+                    t = key[:3]
+                    lo, hi = windows[t]
+                    self.model.addConstr(start[t] <= start_time - self.epsilon + self.big_m('unavail_chantier', hi - start_time + self.epsilon) * (1 - binaries[key]))
+                    self.model.addConstr(start[t] >= end_time + self.epsilon - self.big_m('unavail_chantier', end_time + self.epsilon - lo) * binaries[key])
 
             print("Constraint 1.2: Unavailability chantier constraints defined")
                     
 
         def define_single_train_per_machine_constraints():
-            """Constraint 2: Ensure each machine processes one train at a time."""
-            for machine in self.machines:
-                for i in range(len(self.trains)):
-                    for j in range(i + 1, len(self.trains)):
-                        train1 = self.trains[i]
-                        train2 = self.trains[j]
-                        for time in [0, 14]:
-                            if train1[0] == 'ARR' and train2[0] == 'ARR' and machine == 'DEB':
-                                # Train1 before Train2
-                                self.model.addConstr(self.a[train1[0], train1[1], train1[2]] <= self.a[train2[0], train2[1], train2[2]] - time - self.epsilon + self.M * (1 - self.g_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time])) 
-                                # Train1 after Train2
-                                self.model.addConstr(self.a[train1[0], train1[1], train1[2]] >= self.a[train2[0], train2[1], train2[2]] + time + self.epsilon - self.M * (1 - self.g_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time]))
-                                # Ensure either before or after
-                                self.model.addConstr(self.g_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] + self.g_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] == 1)
-
-                            elif train1[0] == 'DEP' and train2[0] == 'DEP' and machine == 'FOR':
-                                self.model.addConstr(self.b[train1[0], train1[1], train1[2]] <= self.b[train2[0], train2[1], train2[2]] - time - self.epsilon + self.M * (1 - self.k_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time])) 
-                                self.model.addConstr(self.b[train1[0], train1[1], train1[2]] >= self.b[train2[0], train2[1], train2[2]] + time + self.epsilon - self.M * (1 - self.k_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time]))
-                                self.model.addConstr(self.k_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] + self.k_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] == 1)
-
-                            elif train1[0] == 'DEP' and train2[0] == 'DEP' and machine == 'DEG':
-                                self.model.addConstr(self.c[train1[0], train1[1], train1[2]] <= self.c[train2[0], train2[1], train2[2]] - time - self.epsilon + self.M * (1 - self.l_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time])) 
-                                self.model.addConstr(self.c[train1[0], train1[1], train1[2]] >= self.c[train2[0], train2[1], train2[2]] + time + self.epsilon - self.M * (1 - self.l_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time]))
-                                self.model.addConstr(self.l_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] + self.l_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] == 1)
+            """Constraint 2: Ensure each machine processes one train at a time. Only the pairs of trains whose time windows overlap have a disjunction, the others are ordered by their bounds."""
+            for machine, start, before, after, windows in [
+                ('DEB', self.a, self.g_before, self.g_after, self.deb_windows),
+                ('FOR', self.b, self.k_before, self.k_after, self.for_windows),
+                ('DEG', self.c, self.l_before, self.l_after, self.deg_windows),
+            ]:
+                if machine not in self.machines:
+                    continue
+                for key in before.keys():
+                    train1, train2, time = key[:3], key[3:6], key[6]
+                    (lo1, hi1), (lo2, hi2) = windows[train1], windows[train2]
+                    # Train1 before Train2
+                    self.model.addConstr(start[train1] <= start[train2] - time - self.epsilon + self.big_m('single_train_per_machine', hi1 - lo2 + time + self.epsilon) * (1 - before[key]))
+                    # Train1 after Train2
+                    self.model.addConstr(start[train1] >= start[train2] + time + self.epsilon - self.big_m('single_train_per_machine', hi2 - lo1 + time + self.epsilon) * (1 - after[key]))
+                    # Ensure either before or after
+                    self.model.addConstr(before[key] + after[key] == 1)
 
             print('2: One train processed by a machine constraint defined')
 
@@ -220,7 +235,7 @@ class ModelJalon2:
             """Constraint 5: Ensure 'FOR' starts only after all required 'DEB' processes finish."""
             for dep_train, arr_trains in self.trains_requis_dict.items():
                 for arr_train in arr_trains:
-                    self.model.addConstr(self.b[dep_train[0], dep_train[1], dep_train[2]] >= self.a[arr_train[0], arr_train[1], arr_train[2]] + 15, name=f"constraint_FOR_DEB_{dep_train[1]}_{arr_train[1]}")
+                    self.model.addConstr(self.b[dep_train[0], dep_train[1], dep_train[2]] >= self.a[arr_train[0], arr_train[1], arr_train[2]] + self.machines_durees[0], name=f"constraint_FOR_DEB_{dep_train[1]}_{arr_train[1]}")
             print('5: FOR after DEB constraint defined')
 
         def define_for_before_deg_constraint():
@@ -261,17 +276,17 @@ class ModelJalon2:
                     )
                     # t <= (a+15)*occup + M(1-occup)
                     self.model.addConstr(
-                        minute <= (self.a[train[0],train[1],train[2]]+15)/15*self.rec_occup[train[0],train[1],train[2], minute] + self.M*(1-self.rec_occup[train[0],train[1],train[2], minute]),
+                        minute <= (self.a[train[0],train[1],train[2]]+15)/15*self.rec_occup[train[0],train[1],train[2], minute] + self.big_m('rec_occup', minute)*(1-self.rec_occup[train[0],train[1],train[2], minute]),
                         name=f"rec_occup_after_{train}_{minute}"
                     )
                     # t-tarr <= M*x
                     self.model.addConstr(
-                        (minute - train[2]/15) <= self.M*self.rec_x[train[0],train[1],train[2], minute],
+                        (minute - train[2]/15) <= self.big_m('rec_occup', minute - train[2]/15)*self.rec_x[train[0],train[1],train[2], minute],
                         name=f"rec_occup_after_harr_{train}_{minute}"
                     )
                     # (a+15)-t <= M*y
                     self.model.addConstr(
-                        (self.a[train[0],train[1],train[2]]+15)/15 - minute <= self.M*self.rec_y[train[0],train[1],train[2], minute],
+                        (self.a[train[0],train[1],train[2]]+15)/15 - minute <= self.big_m('rec_occup', (self.deb_windows[train][1]+15)/15 - minute)*self.rec_y[train[0],train[1],train[2], minute],
                         name=f"rec_occup_before_harr_{train}_{minute}"
                     )
                     # occup >= x+y-1
@@ -292,17 +307,17 @@ class ModelJalon2:
                     )
                     # t <= (a+15)*occup + M(1-occup)
                     self.model.addConstr(
-                        minute <= (self.a[train[0],train[1],train[2]]+15)/15*self.for_occup[train[0],train[1],train[2], minute] + self.M*(1-self.for_occup[train[0],train[1],train[2], minute]),
+                        minute <= (self.a[train[0],train[1],train[2]]+15)/15*self.for_occup[train[0],train[1],train[2], minute] + self.big_m('for_occup', minute)*(1-self.for_occup[train[0],train[1],train[2], minute]),
                         name=f"for_occup_after_{train}_{minute}"
                     )
                     # t-tarr <= M*x
                     self.model.addConstr(
-                        (minute - train[2]/15) <= self.M*self.for_x[train[0],train[1],train[2], minute],
+                        (minute - train[2]/15) <= self.big_m('for_occup', minute - train[2]/15)*self.for_x[train[0],train[1],train[2], minute],
                         name=f"for_occup_after_harr_{train}_{minute}"
                     )
                     # (a+15)-t <= M*y
                     self.model.addConstr(
-                        (self.a[train[0],train[1],train[2]]+15)/15 - minute <= self.M*self.for_y[train[0],train[1],train[2], minute],
+                        (self.a[train[0],train[1],train[2]]+15)/15 - minute <= self.big_m('for_occup', (self.deb_windows[train][1]+15)/15 - minute)*self.for_y[train[0],train[1],train[2], minute],
                         name=f"for_occup_before_harr_{train}_{minute}"
                     )
                     # occup >= x+y-1
@@ -318,17 +333,17 @@ class ModelJalon2:
                     )
                     # t <= (c+15)*occup + M(1-occup)
                     self.model.addConstr(
-                        minute <= (self.c[train[0],train[1],train[2]]+15)/15*self.for_occup[train[0],train[1],train[2], minute] + self.M*(1-self.for_occup[train[0],train[1],train[2], minute]),
+                        minute <= (self.c[train[0],train[1],train[2]]+15)/15*self.for_occup[train[0],train[1],train[2], minute] + self.big_m('for_occup', minute)*(1-self.for_occup[train[0],train[1],train[2], minute]),
                         name=f"for_occup_after_{train}_{minute}"
                     )
                     # t-b <= M*x
                     self.model.addConstr(
-                        (minute - self.b[train[0],train[1],train[2]]/15) <= self.M*self.for_x[train[0],train[1],train[2], minute],
+                        (minute - self.b[train[0],train[1],train[2]]/15) <= self.big_m('for_occup', minute - self.for_windows[train][0]/15)*self.for_x[train[0],train[1],train[2], minute],
                         name=f"for_occup_after_harr_{train}_{minute}"
                     )
                     # (c+15)-t <= M*y
                     self.model.addConstr(
-                        (self.c[train[0],train[1],train[2]]+15)/15 - minute <= self.M*self.for_y[train[0],train[1],train[2], minute],
+                        (self.c[train[0],train[1],train[2]]+15)/15 - minute <= self.big_m('for_occup', (self.deg_windows[train][1]+15)/15 - minute)*self.for_y[train[0],train[1],train[2], minute],
                         name=f"for_occup_before_harr_{train}_{minute}"
                     )
                     # occup >= x+y-1
@@ -349,17 +364,17 @@ class ModelJalon2:
                     )
                     # t <= tdep*occup + M(1-occup)
                     self.model.addConstr(
-                        minute <= train[2]/15*self.dep_occup[train[0],train[1],train[2], minute] + self.M*(1-self.dep_occup[train[0],train[1],train[2], minute]),
+                        minute <= train[2]/15*self.dep_occup[train[0],train[1],train[2], minute] + self.big_m('dep_occup', minute)*(1-self.dep_occup[train[0],train[1],train[2], minute]),
                         name=f"dep_occup_after_{train}_{minute}"
                     )
                     # t-c <= M*x
                     self.model.addConstr(
-                        (minute - self.c[train[0],train[1],train[2]]/15) <= self.M*self.dep_x[train[0],train[1],train[2], minute],
+                        (minute - self.c[train[0],train[1],train[2]]/15) <= self.big_m('dep_occup', minute - self.deg_windows[train][0]/15)*self.dep_x[train[0],train[1],train[2], minute],
                         name=f"dep_occup_after_harr_{train}_{minute}"
                     )
                     # tdep-t <= M*y
                     self.model.addConstr(
-                        train[2]/15 - minute <= self.M*self.dep_y[train[0],train[1],train[2], minute],
+                        train[2]/15 - minute <= self.big_m('dep_occup', train[2]/15 - minute)*self.dep_y[train[0],train[1],train[2], minute],
                         name=f"dep_occup_before_harr_{train}_{minute}"
                     )
                     # occup >= x+y-1
@@ -417,6 +432,7 @@ class ModelJalon2:
         define_task_time_slots_constraint()
 
         print('Constraints defined')
+        self.big_m.report()
     
     def _define_objective_function(self):
         """Define the objective function for the optimization model.
@@ -424,89 +440,84 @@ class ModelJalon2:
         self.model.setObjective(self.for_max, GRB.MINIMIZE)
         print('Objective function defined')
 
+    def solution_variables(self):
+        """Variables read by get_results, by name"""
+        return {'a': self.a, 'b': self.b, 'c': self.c, 'rec_max': self.rec_max, 'for_max': self.for_max, 'dep_max': self.dep_max}
+
     def optimize(self):
-        """Optimize the model."""
-        self.model.optimize()
+        """Optimize the model with the backend."""
+        self.solution = self.backend.solve(self, self.time_limit)
         print('Optimization complete')
 
     def save_model(self):
         """Save the model to a file."""
-        self.model.write(self.model_save_path)
-        print(f'Model saved to {self.model_save_path}')
+        path = self.backend.write(self, self.model_save_path)
+        print(f'Model saved to {path}')
+
+    def save_telemetry(self):
+        """Save the progress time series and summary of the solve next to the results, if TELEMETRY is set."""
+        if self.telemetry is None or self.backend.name != 'gurobi':
+            return []
+        written = self.telemetry.save(f'{self.results_folder_save_path}/telemetry_{Path(self.fichier).stem}_jalon2')
+        print(f'Telemetry saved to {", ".join(map(str, written))}')
+        return written
+
+    def plot_results(self):
+        """Save the gantt of the machine tasks and the sankey of the correspondances of the last results."""
+        file_name = Path(self.fichier).stem
+        gantt_image_save_path = f"{self.results_folder_save_path}/gantt_{file_name}_jalon2.png"
+        sankey_image_save_path = f"{self.results_folder_save_path}/sankey_{file_name}_jalon2.png"
+        display_gantt(self.results_file_path, gantt_image_save_path)
+        display_sankey(self.fichier, sankey_image_save_path)
 
     def get_results(self):
         """Extract and return results after optimization."""
-        if self.model.status == GRB.OPTIMAL:
-            results = []
-            for train in self.trains:
-                if train[0] == 'ARR':
-                    jour, horaire = minute_to_date2(self.model.getVarByName(f'a[{train[0]},{train[1]},{train[2]}]').X, self.j1)
-                    results.append({
-                        'Id tâche': f'{self.machines[0]}_{train[1]}_{jour}',
-                        'Type de tâche': self.machines[0],
-                        'Jour': jour,
-                        'Heure début': horaire,
-                        'Durée': self.machines_durees[0],
-                        'Sillon': train[1]
-                    })
-                elif train[0] == 'DEP':
-                    jour, horaire = minute_to_date2(self.model.getVarByName(f'b[{train[0]},{train[1]},{train[2]}]').X, self.j1)
-                    results.append({
-                        'Id tâche': f'{self.machines[1]}_{train[1]}_{jour}',
-                        'Type de tâche': self.machines[1],
-                        'Jour': jour,
-                        'Heure début': horaire,
-                        'Durée': self.machines_durees[1],
-                        'Sillon': train[1]
-                    })
-                    jour, horaire = minute_to_date2(self.model.getVarByName(f'c[{train[0]},{train[1]},{train[2]}]').X, self.j1)
-                    results.append({
-                        'Id tâche': f'{self.machines[2]}_{train[1]}_{jour}',
-                        'Type de tâche': self.machines[2],
-                        'Jour': jour,
-                        'Heure début': horaire,
-                        'Durée': self.machines_durees[2],
-                        'Sillon': train[1]
-                    })
+        if self.solution.found:
+            # start times read in bulk, all converted to dates in one call
+            df_results = machine_tasks_frame(
+                self.trains_arr, self.trains_dep,
+                self.solution.values_of('a', self.trains_arr), self.solution.values_of('b', self.trains_dep), self.solution.values_of('c', self.trains_dep),
+                self.machines, self.machines_durees, self.j1
+            )
             voies =[{
-                'Taux max voies (%)': 100*self.rec_max.x/self.max_voies[0],
-                'Nombre max voies occupées': self.rec_max.x,
+                'Taux max voies (%)': 100*self.solution.value('rec_max')/self.max_voies[0],
+                'Nombre max voies occupées': self.solution.value('rec_max'),
                 'Nombre total voies dispo': self.max_voies[0],
             },
             {
-                'Taux max voies (%)': 100*self.for_max.x/self.max_voies[1],
-                'Nombre max voies occupées': self.for_max.x,
+                'Taux max voies (%)': 100*self.solution.value('for_max')/self.max_voies[1],
+                'Nombre max voies occupées': self.solution.value('for_max'),
                 'Nombre total voies dispo': self.max_voies[1],  
             },
             {
-                'Taux max voies (%)': 100*self.dep_max.x/self.max_voies[2],
-                'Nombre max voies occupées': self.dep_max.x,
+                'Taux max voies (%)': 100*self.solution.value('dep_max')/self.max_voies[2],
+                'Nombre max voies occupées': self.solution.value('dep_max'),
                 'Nombre total voies dispo': self.max_voies[2],  
             }
             ]
 
 
             # Create a DataFrame from the results
-            df_results = pd.DataFrame(results)
             df_voies = pd.DataFrame(voies,index =self.chantiers)
             sheet_names = ["Taches machine","Voies utilisation"]
             
             file_name = Path(self.fichier).stem
-            results_file_path = f'{self.results_folder_save_path}/results_{file_name}_jalon2.xlsx'
+            results_file_path = f'{self.results_folder_save_path}/results_{file_name}_jalon2'
             
-            df_results.to_excel(results_file_path,sheet_name=sheet_names[0], index=False)
-            df_voies.to_excel(f'{self.results_folder_save_path}/results_{file_name}_voies_jalon2.xlsx',sheet_name=sheet_names[1], index=True)
-            print(f'Results saved to {results_file_path}')
+            written = write_results({sheet_names[0]: (df_results, False)}, results_file_path)
+            written += write_results({sheet_names[1]: (df_voies, True)}, f'{self.results_folder_save_path}/results_{file_name}_voies_jalon2')
+            self.results_paths = written
+            print(f'Results saved to {", ".join(map(str, written))}')
             
-            gantt_image_save_path = f"{self.results_folder_save_path}/gantt_{file_name}_jalon2.png"
-            sankey_image_save_path = f"{self.results_folder_save_path}/sankey_{file_name}_jalon2.png"
-            display_gantt(results_file_path, gantt_image_save_path)
-            display_sankey(self.fichier, sankey_image_save_path)
+            self.results_file_path = results_file_path
+            if self.plot:
+                self.plot_results()
             return df_results
         else:
             print("No optimal solution found")
-            self.model.computeIIS()
-            self.model.write('outputs/models/infeasible.ilp')
+            if self.backend.name == 'gurobi':
+                self.model.computeIIS()
+                self.model.write('outputs/models/infeasible.ilp')
             return None
         
     def run_optimization(self):
@@ -515,5 +526,6 @@ class ModelJalon2:
         self.optimisation_time = tme.time()
         self.save_model()
         df_results = self.get_results()
+        self.save_telemetry()
         print(f'Time taken for: Data Loading = {self.data_loaded_time-self.start_program_time}s, Variables and Constraints = {self.constraint_variable_time-self.data_loaded_time}s, Optimisation = {self.optimisation_time-self.constraint_variable_time}s')
         return df_results
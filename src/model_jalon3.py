@@ -1,77 +1,230 @@
 from gurobipy import Model, GRB, quicksum
 import pandas as pd
 import numpy as np
-from utils.utils_data import (
-    format_trains, add_time_reference, unavailable_machines, correspondance_for_depart, unavailable_chantiers, find_max_voies, format_taches_humaines
+from utils.utils_instance import load_instance, TrainTable
+from utils.utils_date import minutes_to_date, minutes_to_date2
+from utils.utils_results import machine_tasks_frame, write_results
+from utils.utils_matrix import add_occupation_rows, add_slot_sum_rows, add_pair_rows
+from utils.utils_bigm import BigM
+from utils.utils_event import EventOverlaps, EnvelopeCovers
+from utils.utils_envelope import EnvelopeSlots
+from utils.utils_cache import ModelCache, model_variables
+from utils.utils_backend import get_backend
+from utils.utils_telemetry import solver_telemetry
+from utils.utils_profile import BuildProfiler
+from utils.utils_warmstart import greedy_schedule, incumbent_callback
+from utils.utils_window import (
+    machine_windows, task_windows, slot_windows, add_window_vars, overlapping_pairs, unavailable_intervals, split_unavailability
 )
-from utils.utils_date import minute_to_date2
 from utils.display_gantt import display_gantt
 from utils.display_sankey import display_sankey
 from pathlib import Path
 from dotenv import load_dotenv
+import math
 import os
 import time as tme
 
 class ModelJalon3:
-    def __init__(self):
-        """Initialize the optimization model."""
+    jalon = 3
+
+    def __init__(self, build_mode=None, trains=None, fixed=None, backend=None, fichier=None, capacity_mode=None, env=None, instance=None, profile=False, dry_run=False, use_cache=True, used_envelopes=None):
+        """Initialize the optimization model.
+        build_mode: 'tupledict' (one addConstr per row) or 'matrix' (bulk addMConstr), defaults to BUILD_MODE in .env
+        capacity_mode: 'slot' (voies and agents counted on every 15 minutes slot) or 'event' (counted at the start of each
+            stay and task, see utils_event), defaults to CAPACITY_MODE in .env
+        trains: only model these trains (all the trains of the instance if None), used by the rolling horizon
+        fixed: {variable name: {key: value}} of variables fixed to a value, e.g. trains already committed by a previous window
+        used_envelopes: {'REC'|'FOR'|'DEP'|'REC_DEP'|'FOR_DEP': envelope indexes} already used by trains outside the model
+            (committed by a previous window), reused for free: they are not counted in the objective
+        backend: 'gurobi', 'highs' or 'cpsat' (see utils_backend), defaults to SOLVER_BACKEND in .env
+        fichier: instance file, defaults to FILE_INSTANCE in .env
+        env: gurobipy Env the model is created in (Threads and license shared by the models of a batch worker), default Env if None
+        instance: Instance of fichier already loaded (prefetched by the batch runner), read with load_instance if None
+        profile: record the time, memory and model size added by each builder in self.profiler (utils_profile)
+        dry_run: only load the data and compute the time windows, nothing is added to the gurobipy model (estimate_build,
+            results of the rolling horizon)
+        use_cache: read and save the built model in MODEL_CACHE_DIR, False to always build it (benchmark suite)"""
         self.start_program_time = tme.time()
         load_dotenv(override=True)
         self.model_name = os.getenv('MODEL_NAME')
         self.model_save_path = os.getenv('MODEL_SAVE_PATH')
         self.results_folder_save_path = os.getenv('RESULTS_FOLDER_SAVE_PATH')
-        self.fichier = os.getenv('FILE_INSTANCE')
-
-        self.model = Model(self.model_name)
+        self.fichier = fichier or os.getenv('FILE_INSTANCE')
+        self.backend = get_backend(backend or os.getenv('SOLVER_BACKEND', 'gurobi'))
+        # progress of the Gurobi solve recorded by a callback, TELEMETRY in .env
+        self.telemetry = solver_telemetry()
+        self.build_mode = build_mode or os.getenv('BUILD_MODE', 'matrix')
+        self.capacity_mode = capacity_mode or os.getenv('CAPACITY_MODE', 'slot')
+        self.window_slack = int(os.getenv('WINDOW_SLACK_MINUTES')) if os.getenv('WINDOW_SLACK_MINUTES') else None
+        self.epsilon = 0
+        self.train_subset = set(trains) if trains is not None else None
+        self.fixed = fixed or {}
+        self.used_envelopes = used_envelopes or {}
+        self.time_limit = 400
+        self.warm_start = os.getenv('WARM_START', 'none')
+        # built models are cached for the whole instance only, the rolling horizon windows being built once each
+        cache_folder = os.getenv('MODEL_CACHE_DIR')
+        self.model_cache = ModelCache(cache_folder) if use_cache and cache_folder and self.backend.builds_model and trains is None and not fixed and not used_envelopes else None
+        self.cached = False
+        self.env = env
+        self.instance = instance
+        # gantt and sankey images saved by get_results, plot_results called apart when False (benchmark suite)
+        self.plot = True
+        self.dry_run = dry_run
+
+        self.model = Model(self.model_name, env=env)
+        self.profiler = BuildProfiler(self.model, profile)
         self._load_data()
         self.data_loaded_time = tme.time()
+        if self.model_cache is not None:
+            self._load_cached_model()
         self._define_variables()
-        self._define_constraints()
-        self.constraint_variable_time = tme.time()
-        self._define_objective_function()
+        self.variables_defined_time = tme.time()
+        if self.backend.builds_model and not self.cached and not self.dry_run:
+            self._define_constraints()
+            self.constraint_variable_time = tme.time()
+            self._define_objective_function()
+            if self.model_cache is not None:
+                path = self.model_cache.save(self.cache_key, self.model, model_variables(self))
+                print(f'Model cached to {path}')
+        else:
+            # CP-SAT builds its own model from the time windows, a cached model is already built, a dry run builds nothing
+            self.constraint_variable_time = tme.time()
+
+    def _load_cached_model(self):
+        """Read the model built by a previous run from the cache if the instance, the settings and the code are unchanged."""
+        self.cache_key = self.model_cache.key(
+            self.fichier,
+            {'model_name': self.model_name, 'build_mode': self.build_mode, 'capacity_mode': self.capacity_mode, 'window_slack': self.window_slack},
+            [Path(__file__)] + sorted(Path(__file__).parent.glob('utils/*.py'))
+        )
+        cached = self.model_cache.load(self.cache_key, self.env)
+        if cached is None:
+            return
+        self.model, variables = cached
+        for name, value in variables.items():
+            setattr(self, name, value)
+        self.cached = True
+        print(f'Model read from cache {self.cache_key[:12]}')
     
     def _load_data(self):
         """Load and process input data."""
-        (
-            self.chantiers_df, self.machines_df, self.sillons_arrivee_df,
-            self.sillons_depart_df, self.correspondances_df, self.taches_humaines_df, self.roulements_agents_df,
-            self.j1, self.jours, self.first_day
-        ) = add_time_reference(self.fichier)
-        
+        # parsed xlsx, or its compiled bundle when it is fresher (utils_instance)
+        instance = self.instance or load_instance(self.fichier)
+        self.j1, self.jours, self.first_day = instance.j1, instance.jours, instance.first_day
         (
             self.trains, self.trains_arr, self.trains_dep, self.minutes,
             self.machines, self.machines_durees, self.minute_slots, self.chantiers
-        ) = format_trains(
-            self.machines_df, self.sillons_arrivee_df, self.sillons_depart_df, self.chantiers_df,
-            self.j1, self.jours, self.first_day
+        ) = (
+            instance.trains, instance.trains_arr, instance.trains_dep, instance.minutes,
+            instance.machines, instance.machines_durees, instance.minute_slots, instance.chantiers
         )
+        if self.train_subset is not None:
+            self.trains_arr = [train for train in self.trains_arr if train in self.train_subset]
+            self.trains_dep = [train for train in self.trains_dep if train in self.train_subset]
+            self.trains = self.trains_arr + self.trains_dep
         
-        self.unavailable_periods, self.start_times = unavailable_machines(self.machines_df, self.jours, self.first_day)
-        self.unavailable_periods_chantiers, self.start_times_chantiers = unavailable_chantiers(self.chantiers_df, self.jours, self.first_day)
-        self.trains_requis_dict = correspondance_for_depart(self.trains_dep, self.trains_arr, self.correspondances_df, self.j1)
-        self.max_voies = find_max_voies(self.chantiers_df)
+        self.unavailable_periods, self.start_times = instance.unavailable_periods, instance.start_times
+        self.unavailable_periods_chantiers, self.start_times_chantiers = instance.unavailable_periods_chantiers, instance.start_times_chantiers
+        self.trains_requis_dict = {
+            train: [train_arr for train_arr in trains_requis if train_arr in self.train_subset]
+            for train, trains_requis in instance.trains_requis_dict.items() if train in self.train_subset
+        } if self.train_subset is not None else instance.trains_requis_dict
+        self.max_voies = instance.max_voies
+        self.roulements = instance.roulements
         (self.arr_taches, self.dep_taches, self.envelopes_agents, self.nombre_agents, self.max_agents, self.arr_taches_dict,self.dep_taches_dict
-        ) = format_taches_humaines(self.taches_humaines_df, self.roulements_agents_df, self.jours, self.first_day, self.minute_slots)
-        self.arr_orders = np.array(self.arr_taches[:,0]).astype(int)
-        self.dep_orders = np.array(self.dep_taches[:,0]).astype(int)
-        self.arr_durees = np.array(self.arr_taches[:,1]).astype(int)
-        self.dep_durees = np.array(self.dep_taches[:,1]).astype(int)
+        ) = (instance.arr_taches, instance.dep_taches, instance.envelopes_agents, instance.nombre_agents, instance.max_agents, instance.arr_taches_dict, instance.dep_taches_dict)
+        # typed trains (integer ids) and tasks, see utils_instance
+        self.train_table = TrainTable.from_trains(self.trains_arr, self.trains_dep) if self.train_subset is not None else instance.train_table
+        self.tasks = instance.tasks
+        self.arr_orders, self.dep_orders = self.tasks.arr_orders, self.tasks.dep_orders
+        self.arr_durees, self.dep_durees = self.tasks.arr_durees, self.tasks.dep_durees
         self.orders = np.concatenate((self.arr_orders, self.dep_orders))
+        self.envelope_slots = EnvelopeSlots(self.envelopes_agents, len(self.minute_slots))
         print('Data loaded')
 
     def _define_variables(self):
         """Define model variables."""
         
+        def define_time_windows(self):
+            """Compute the time window each train and task can be in, used to bound the start times and size the per-slot variables."""
+            horizon = max(self.minutes)
+            nb_slots = len(self.minute_slots)
+            self.deb_windows, self.for_windows, self.deg_windows = machine_windows(
+                self.trains_arr, self.trains_dep, self.trains_requis_dict, horizon, self.machines_durees[0],
+                sum(self.arr_durees[:-1]), sum(self.dep_durees[:2]), sum(self.dep_durees[2:]), self.window_slack
+            )
+            # fixed start times are windows of one value
+            for windows, name in [(self.deb_windows, 'a'), (self.for_windows, 'b'), (self.deg_windows, 'c')]:
+                windows.update({train: (value, value) for train, value in self.fixed.get(name, {}).items() if train in windows})
+
+            # unavailable periods cutting a window on one side only tighten it, the others get a binary (key -> period)
+            self.machine_intervals = machine_intervals = {machine: unavailable_intervals(periods) for machine, periods in self.unavailable_periods.items()}
+            self.chantier_intervals = chantier_intervals = {chantier: unavailable_intervals(periods) for chantier, periods in self.unavailable_periods_chantiers.items()}
+
+            def unavail_periods(windows, intervals, resource):
+                conflicts = split_unavailability(windows, intervals.get(resource, []), self.epsilon, horizon)
+                return {key + (occurrence, start, resource): (start, end) for key, (start, end, occurrence, _) in conflicts}
+
+            def task_unavail_periods(windows, durees, intervals, resource, orders):
+                keys = [key for key in windows if key[3] in orders]
+                durations = {key: durees[key[3]-1] for key in keys}
+                conflicts = split_unavailability(windows, intervals.get(resource, []), self.epsilon, horizon, durations, keys)
+                return {key + (period, resource, occurrence): (start, end, durations[key]) for key, (start, end, occurrence, period) in conflicts}
+
+            self.d_periods = unavail_periods(self.deb_windows, machine_intervals, 'DEB')
+            self.e_periods = unavail_periods(self.for_windows, machine_intervals, 'FOR')
+            self.f_periods = unavail_periods(self.deg_windows, machine_intervals, 'DEG')
+            self.chant_d_periods = unavail_periods(self.deb_windows, chantier_intervals, 'WPY_REC')
+            self.chant_e_periods = unavail_periods(self.for_windows, chantier_intervals, 'WPY_FOR')
+            self.chant_f_periods = unavail_periods(self.deg_windows, chantier_intervals, 'WPY_FOR')
+            self.th_arr_windows = task_windows(
+                self.trains_arr, self.arr_orders, self.arr_durees,
+                {train: train[2] for train in self.trains_arr},
+                {train: self.deb_windows[train][1] + self.arr_durees[-1] for train in self.trains_arr}, horizon
+            )
+            self.th_dep_windows = task_windows(
+                self.trains_dep, self.dep_orders, self.dep_durees,
+                {train: self.for_windows[train][0] for train in self.trains_dep},
+                {train: train[2] for train in self.trains_dep}, horizon
+            )
+            for windows, name in [(self.th_arr_windows, 'th_arr'), (self.th_dep_windows, 'th_dep')]:
+                windows.update({key: (value, value) for key, value in self.fixed.get(name, {}).items() if key in windows})
+            self.th_arr_periods = task_unavail_periods(self.th_arr_windows, self.arr_durees, chantier_intervals, 'WPY_REC', self.arr_orders)
+            self.th_dep_periods = task_unavail_periods(self.th_dep_windows, self.dep_durees, chantier_intervals, 'WPY_FOR', self.dep_orders[:-1]) \
+                | task_unavail_periods(self.th_dep_windows, self.dep_durees, chantier_intervals, 'WPY_DEP', self.dep_orders[-1:])
+
+            # departure train whose FOR ends the stay of an arrival train in chantier FOR
+            self.arr_to_dep = {}
+            for train_dep, trains_requis in self.trains_requis_dict.items():
+                for train in trains_requis:
+                    self.arr_to_dep.setdefault(train, train_dep)
+
+            # machine disjunctions only for the pairs of trains whose windows overlap
+            self.deb_pairs = overlapping_pairs(self.trains_arr, self.deb_windows, self.epsilon)
+            self.for_pairs = overlapping_pairs(self.trains_dep, self.for_windows, self.epsilon)
+            self.deg_pairs = overlapping_pairs(self.trains_dep, self.deg_windows, self.epsilon)
+
+            # slots each train can occupy a chantier, same bounds as the occupation relation constraints
+            self.rec_slots = slot_windows({train: (train[2], self.deb_windows[train][1] + 15) for train in self.trains_arr}, nb_slots)
+            self.for_slots = slot_windows(
+                {train: (self.deb_windows[train][0], self.for_windows[self.arr_to_dep[train]][1]) for train in self.trains_arr if train in self.arr_to_dep}
+                | {train: (self.for_windows[train][0], self.deg_windows[train][1] + 15) for train in self.trains_dep}, nb_slots
+            )
+            self.dep_slots = slot_windows({train: (self.deg_windows[train][0], train[2]) for train in self.trains_dep}, nb_slots)
+            self.task_arr_slots = slot_windows({key: (lo, hi + self.arr_durees[key[3]-1]) for key, (lo, hi) in self.th_arr_windows.items()}, nb_slots)
+            self.task_dep_slots = slot_windows({key: (lo, hi + self.dep_durees[key[3]-1]) for key, (lo, hi) in self.th_dep_windows.items()}, nb_slots)
+
         def define_decision_variables(self):
             """Define decision variables for the optimization model."""
-            # machine starting times, a=DEB,b=FOR,c=DEG
-            self.a = self.model.addVars(self.trains_arr, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="a")
-            self.b = self.model.addVars(self.trains_dep, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="b")
-            self.c = self.model.addVars(self.trains_dep, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="c")
+            # machine starting times, a=DEB,b=FOR,c=DEG, bounded by the time windows of the trains
+            self.a = self.model.addVars(self.trains_arr, lb={t: w[0] for t, w in self.deb_windows.items()}, ub={t: w[1] for t, w in self.deb_windows.items()}, vtype=GRB.INTEGER, name="a")
+            self.b = self.model.addVars(self.trains_dep, lb={t: w[0] for t, w in self.for_windows.items()}, ub={t: w[1] for t, w in self.for_windows.items()}, vtype=GRB.INTEGER, name="b")
+            self.c = self.model.addVars(self.trains_dep, lb={t: w[0] for t, w in self.deg_windows.items()}, ub={t: w[1] for t, w in self.deg_windows.items()}, vtype=GRB.INTEGER, name="c")
 
             # task starting times, th_arr and th_dep depending on whether a task acts on an arrival train or departure
-            self.th_arr = self.model.addVars(self.trains_arr, self.arr_orders, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="th_arr")
-            self.th_dep = self.model.addVars(self.trains_dep, self.dep_orders, lb=0, ub=max(self.minutes), vtype=GRB.INTEGER, name="th_dep")
+            self.th_arr = self.model.addVars(self.trains_arr, self.arr_orders, lb={k: w[0] for k, w in self.th_arr_windows.items()}, ub={k: w[1] for k, w in self.th_arr_windows.items()}, vtype=GRB.INTEGER, name="th_arr")
+            self.th_dep = self.model.addVars(self.trains_dep, self.dep_orders, lb={k: w[0] for k, w in self.th_dep_windows.items()}, ub={k: w[1] for k, w in self.th_dep_windows.items()}, vtype=GRB.INTEGER, name="th_dep")
 
             # max chantier voies occupation for the whole simulation period
             self.rec_max = self.model.addVar(vtype=GRB.INTEGER, name="REC_Max_voies")
@@ -95,21 +248,22 @@ class ModelJalon3:
             self.th_arr_int = self.model.addVars(self.trains_arr,self.arr_orders, vtype=GRB.INTEGER, name="aint")
             self.th_dep_int = self.model.addVars(self.trains_dep,self.dep_orders, vtype=GRB.INTEGER, name="bint")
 
-            # if a train is in a chantier, for every minute
-            self.rec_occup = self.model.addVars(self.trains_arr, self.minute_slots, vtype=GRB.BINARY, name="rec_occup")
-            self.for_occup = self.model.addVars(self.trains, self.minute_slots, vtype=GRB.BINARY, name="for_occup")
-            self.dep_occup = self.model.addVars(self.trains_dep, self.minute_slots, vtype=GRB.BINARY, name="dep_occup")
+            if self.capacity_mode == 'slot':
+                # if a train is in a chantier, for every slot of its time window (0 outside)
+                self.rec_occup = add_window_vars(self.model, self.rec_slots, "rec_occup")
+                self.for_occup = add_window_vars(self.model, self.for_slots, "for_occup")
+                self.dep_occup = add_window_vars(self.model, self.dep_slots, "dep_occup")
 
-            # check if task is in progress for every minute
-            self.task_in_progress_arr = self.model.addVars(self.trains_arr, self.arr_orders, self.minute_slots, vtype=GRB.BINARY, name="task_in_progress_arr")
-            self.task_in_progress_dep = self.model.addVars(self.trains_dep, self.dep_orders, self.minute_slots, vtype=GRB.BINARY, name="task_in_progress_dep")
+                # check if task is in progress for every slot of its time window (0 outside)
+                self.task_in_progress_arr = add_window_vars(self.model, self.task_arr_slots, "task_in_progress_arr")
+                self.task_in_progress_dep = add_window_vars(self.model, self.task_dep_slots, "task_in_progress_dep")
 
-            # check if an envelope is being used for every minute
-            self.envelope_active_REC = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_REC")
-            self.envelope_active_FOR = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_FOR")
-            self.envelope_active_DEP = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_DEP")
-            self.envelope_active_REC_DEP = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_REC_DEP")
-            self.envelope_active_FOR_DEP = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_FOR_DEP")
+                # check if an envelope is being used for every minute
+                self.envelope_active_REC = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_REC")
+                self.envelope_active_FOR = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_FOR")
+                self.envelope_active_DEP = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_DEP")
+                self.envelope_active_REC_DEP = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_REC_DEP")
+                self.envelope_active_FOR_DEP = self.model.addVars(self.minute_slots, vtype=GRB.BINARY, name="envelope_active_FOR_DEP")
 
             # 1 if envelope used, 0 if not
             self.envelope_used_REC = self.model.addVars(len(self.envelopes_agents['roulement_reception']), vtype=GRB.BINARY, name="envelope_used_REC")
@@ -122,35 +276,36 @@ class ModelJalon3:
 
         def define_extra_variables(self):
             """Define binary variables for the optimization model."""
-            # variables for machine unavailability
-            self.d = self.model.addVars(self.trains_arr, 2, self.start_times, vtype=GRB.BINARY, name="d")
-            self.e = self.model.addVars(self.trains_dep, 2, self.start_times, vtype=GRB.BINARY, name="e")
-            self.f = self.model.addVars(self.trains_dep, 2, self.start_times, vtype=GRB.BINARY, name="f")
+            # variables for machine unavailability, only for the periods cutting the window of a train
+            self.d = self.model.addVars(list(self.d_periods), vtype=GRB.BINARY, name="d")
+            self.e = self.model.addVars(list(self.e_periods), vtype=GRB.BINARY, name="e")
+            self.f = self.model.addVars(list(self.f_periods), vtype=GRB.BINARY, name="f")
 
             # variables for machine treating one train at a time
-            self.g_before = self.model.addVars(self.trains_arr, self.trains_arr, range(15), vtype=GRB.BINARY, name="g_before")
-            self.g_after = self.model.addVars(self.trains_arr, self.trains_arr, range(15), vtype=GRB.BINARY, name="g_after")
-            self.k_before = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="k_before")
-            self.k_after = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="k_after")
-            self.l_before = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="l_before")
-            self.l_after = self.model.addVars(self.trains_dep, self.trains_dep, range(15), vtype=GRB.BINARY, name="l_after")
+            self.g_before = self.model.addVars(self.deb_pairs, vtype=GRB.BINARY, name="g_before")
+            self.g_after = self.model.addVars(self.deb_pairs, vtype=GRB.BINARY, name="g_after")
+            self.k_before = self.model.addVars(self.for_pairs, vtype=GRB.BINARY, name="k_before")
+            self.k_after = self.model.addVars(self.for_pairs, vtype=GRB.BINARY, name="k_after")
+            self.l_before = self.model.addVars(self.deg_pairs, vtype=GRB.BINARY, name="l_before")
+            self.l_after = self.model.addVars(self.deg_pairs, vtype=GRB.BINARY, name="l_after")
             
-            # variables for chantier unavailability
-            self.chant_d = self.model.addVars(self.trains_arr, 2, self.start_times_chantiers, vtype=GRB.BINARY, name="chant_d")
-            self.chant_e = self.model.addVars(self.trains_dep, 2, self.start_times_chantiers, vtype=GRB.BINARY, name="chant_e")
-            self.chant_f = self.model.addVars(self.trains_dep, 2, self.start_times_chantiers, vtype=GRB.BINARY, name="chant_f")
-
-            # to help determine chantier occupation
-            self.rec_x = self.model.addVars(self.trains_arr, self.minute_slots, vtype=GRB.BINARY, name="rec_x")
-            self.rec_y = self.model.addVars(self.trains_arr, self.minute_slots, vtype=GRB.BINARY, name="rec_y")
-            self.for_x = self.model.addVars(self.trains, self.minute_slots, vtype=GRB.BINARY, name="for_x")
-            self.for_y = self.model.addVars(self.trains, self.minute_slots, vtype=GRB.BINARY, name="for_y")
-            self.dep_x = self.model.addVars(self.trains_dep, self.minute_slots, vtype=GRB.BINARY, name="dep_x")
-            self.dep_y = self.model.addVars(self.trains_dep, self.minute_slots, vtype=GRB.BINARY, name="dep_y")
+            # variables for chantier unavailability, only for the periods cutting the window of a train
+            self.chant_d = self.model.addVars(list(self.chant_d_periods), vtype=GRB.BINARY, name="chant_d")
+            self.chant_e = self.model.addVars(list(self.chant_e_periods), vtype=GRB.BINARY, name="chant_e")
+            self.chant_f = self.model.addVars(list(self.chant_f_periods), vtype=GRB.BINARY, name="chant_f")
+
+            if self.capacity_mode == 'slot':
+                # to help determine chantier occupation
+                self.rec_x = add_window_vars(self.model, self.rec_slots, "rec_x")
+                self.rec_y = add_window_vars(self.model, self.rec_slots, "rec_y")
+                self.for_x = add_window_vars(self.model, self.for_slots, "for_x")
+                self.for_y = add_window_vars(self.model, self.for_slots, "for_y")
+                self.dep_x = add_window_vars(self.model, self.dep_slots, "dep_x")
+                self.dep_y = add_window_vars(self.model, self.dep_slots, "dep_y")
 
             # to help determine th_arr unavailability in the chantiers
-            self.th_arr_unavail = self.model.addVars(self.trains_arr, self.arr_orders, self.start_times_chantiers, 2, vtype=GRB.BINARY, name="th_arr_unavail")
-            self.th_dep_unavail = self.model.addVars(self.trains_dep, self.dep_orders, self.start_times_chantiers, 2, vtype=GRB.BINARY, name="th_dep_unavail")
+            self.th_arr_unavail = self.model.addVars(list(self.th_arr_periods), vtype=GRB.BINARY, name="th_arr_unavail")
+            self.th_dep_unavail = self.model.addVars(list(self.th_dep_periods), vtype=GRB.BINARY, name="th_dep_unavail")
 
             # to help determine envelope_taches
             self.envelope_taches_REC_x = self.model.addVars(len(self.envelopes_agents['roulement_reception']),self.trains_arr,self.arr_orders, vtype=GRB.BINARY, name="envelope_taches_REC")
@@ -164,134 +319,94 @@ class ModelJalon3:
             self.envelope_taches_FOR_DEP_x = self.model.addVars(len(self.envelopes_agents['roulement_formation_depart']),self.trains,self.dep_orders, vtype=GRB.BINARY, name="envelope_taches_FOR_DEP")
             self.envelope_taches_FOR_DEP_y = self.model.addVars(len(self.envelopes_agents['roulement_formation_depart']),self.trains,self.dep_orders, vtype=GRB.BINARY, name="envelope_taches_FOR_DEP")
 
-            # to help determine task_in_progress
-            self.task_in_progress_arr_x = self.model.addVars(self.trains_arr, self.arr_orders, self.minute_slots, vtype=GRB.BINARY, name="task_in_progress_arr_x")
-            self.task_in_progress_arr_y = self.model.addVars(self.trains_arr, self.arr_orders, self.minute_slots, vtype=GRB.BINARY, name="task_in_progress_arr_y")
-            self.task_in_progress_dep_x = self.model.addVars(self.trains_dep, self.dep_orders, self.minute_slots, vtype=GRB.BINARY, name="task_in_progress_dep_x")
-            self.task_in_progress_dep_y = self.model.addVars(self.trains_dep, self.dep_orders, self.minute_slots, vtype=GRB.BINARY, name="task_in_progress_dep_y")
-
-        define_decision_variables(self)
-        define_auxiliary_variables(self)
-        define_extra_variables(self)
+            if self.capacity_mode == 'slot':
+                # to help determine task_in_progress
+                self.task_in_progress_arr_x = add_window_vars(self.model, self.task_arr_slots, "task_in_progress_arr_x")
+                self.task_in_progress_arr_y = add_window_vars(self.model, self.task_arr_slots, "task_in_progress_arr_y")
+                self.task_in_progress_dep_x = add_window_vars(self.model, self.task_dep_slots, "task_in_progress_dep_x")
+                self.task_in_progress_dep_y = add_window_vars(self.model, self.task_dep_slots, "task_in_progress_dep_y")
+
+        run = self.profiler.run
+        run(define_time_windows, self, phase='variables')
+        if not self.backend.builds_model or self.cached or self.dry_run:
+            return
+        run(define_decision_variables, self, phase='variables')
+        run(define_auxiliary_variables, self, phase='variables')
+        run(define_extra_variables, self, phase='variables')
+        # other fixed variables (envelope assignments of committed trains)
+        for name, values in self.fixed.items():
+            variables = getattr(self, name)
+            for key, value in values.items():
+                if key in variables:
+                    variables[key].LB = variables[key].UB = value
         print('Variables defined')
 
     def _define_constraints(self):
         """Define constraints for the optimization model."""
         self.M = max(self.minutes)+1
-        self.epsilon = 0
+        # smallest valid M of each disjunctive row, from the time windows of its variables
+        self.big_m = BigM(self.M)
     
         def define_unavailability_machines_constraints():
-            """Constraint 1.1: Ensure machines respect unavailable periods."""
-            for machine, periods in self.unavailable_periods.items():
-                for (start_time, end_time) in periods:    
-                    # Loop through trains only once per unavailable period
-                    for t in self.trains: 
-                        if t[0] == 'ARR' and machine == 'DEB':
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.d[t[0], t[1], t[2], 0, start_time[0], machine]))
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.d[t[0], t[1], t[2], 0, start_time[0], machine])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.d[t[0], t[1], t[2], 1,start_time[1], machine]))
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.d[t[0], t[1], t[2], 1,start_time[1], machine])
-                        elif t[0] == 'DEP' and machine == 'FOR':
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.e[t[0], t[1], t[2], 0, start_time[0], machine]))
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.e[t[0], t[1], t[2], 0, start_time[0], machine])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.e[t[0], t[1], t[2], 1,start_time[1], machine]))
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.e[t[0], t[1], t[2], 1,start_time[1], machine])
-                        elif t[0] == 'DEP' and machine == 'DEG':
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.f[t[0], t[1], t[2], 0, start_time[0], machine]))
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.f[t[0], t[1], t[2], 0, start_time[0], machine])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.f[t[0], t[1], t[2], 1,start_time[1], machine]))
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.f[t[0], t[1], t[2], 1,start_time[1], machine])
+            """Constraint 1.1: Ensure machines respect unavailable periods. Periods only cutting one side of a window are already bounds of the start times."""
+            for start, binaries, periods, windows in [
+                (self.a, self.d, self.d_periods, self.deb_windows),
+                (self.b, self.e, self.e_periods, self.for_windows),
+                (self.c, self.f, self.f_periods, self.deg_windows),
+            ]:
+                for key, (start_time, end_time) in periods.items():
+                    t = key[:3]
+                    lo, hi = windows[t]
+                    self.model.addConstr(start[t] <= start_time - self.epsilon + self.big_m('unavail_machine', hi - start_time + self.epsilon) * (1 - binaries[key]))
+                    self.model.addConstr(start[t] >= end_time + self.epsilon - self.big_m('unavail_machine', end_time + self.epsilon - lo) * binaries[key])
 
             print('1.1: Unavailability machine constraint defined')
 
         def define_unavailability_chantier_constraints():
-            """Constraint 1.2: Ensure chantier respect unavailable periods."""
-            for chantier, periods in self.unavailable_periods_chantiers.items():
-                for (start_time, end_time) in periods:
-                    print(start_time,end_time)           
-                    # Loop through trains only once per unavailable period
-                    for t in self.trains: 
-                        if t[0] == 'ARR' and chantier == 'WPY_REC':
-                            # Machine DEB
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.chant_d[t[0], t[1], t[2], 0, start_time[0], chantier]))
-                            self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.chant_d[t[0], t[1], t[2], 0, start_time[0], chantier])
-                            for task in self.arr_taches:
-                                self.model.addConstr(self.th_arr[t[0],t[1],t[2],task[0]] + task[1] <= start_time[0] - self.epsilon + self.M * (1 - self.th_arr_unavail[t[0],t[1],t[2],task[0],start_time[0],chantier,0]))
-                                self.model.addConstr(self.th_arr[t[0],t[1],t[2],task[0]] >= end_time[0] + self.epsilon - self.M * self.th_arr_unavail[t[0],t[1],t[2],task[0],start_time[0],chantier,0])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.chant_d[t[0], t[1], t[2], 1, start_time[1], chantier]))
-                                self.model.addConstr(self.a[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.chant_d[t[0], t[1], t[2], 1, start_time[1], chantier])
-                                for task in self.arr_taches:
-                                    self.model.addConstr(self.th_arr[t[0],t[1],t[2],task[0]] + task[1] <= start_time[0] - self.epsilon + self.M * (1 - self.th_arr_unavail[t[0],t[1],t[2],task[0],start_time[0],chantier,1]))
-                                    self.model.addConstr(self.th_arr[t[0],t[1],t[2],task[0]] >= end_time[0] + self.epsilon - self.M * self.th_arr_unavail[t[0],t[1],t[2],task[0],start_time[0],chantier,1])
-                        
-                        elif t[0] == 'DEP' and chantier == 'WPY_FOR':
-                            # Machine FOR
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.chant_e[t[0], t[1], t[2], 0, start_time[0], chantier]))
-                            self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.chant_e[t[0], t[1], t[2], 0, start_time[0], chantier])
-                            for task in self.dep_taches[:-1]:
-                                self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] + int(task[1]) <= start_time[0] - self.epsilon + self.M * (1 - self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,0]))
-                                self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] >= end_time[0] + self.epsilon - self.M * self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,0])
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.chant_e[t[0], t[1], t[2], 1, start_time[1], chantier]))
-                                self.model.addConstr(self.b[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.chant_e[t[0], t[1], t[2], 1, start_time[1], chantier])
-                                for task in self.dep_taches[:-1]:
-                                    self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] + int(task[1]) <= start_time[0] - self.epsilon + self.M * (1 - self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,1]))
-                                    self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] >= end_time[0] + self.epsilon - self.M * self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,1])
-                            
-                            # Machine DEG
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[0] - self.epsilon + self.M * (1 - self.chant_f[t[0], t[1], t[2], 0, start_time[0], chantier]))
-                            self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[0] + self.epsilon - self.M * self.chant_f[t[0], t[1], t[2], 0, start_time[0], chantier])
-                        
-
-                            if start_time[1] != 0:
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] <= start_time[1] - self.epsilon + self.M * (1 - self.chant_f[t[0], t[1], t[2], 1, start_time[1], chantier]))
-                                self.model.addConstr(self.c[t[0], t[1], t[2]] >= end_time[1] + self.epsilon - self.M * self.chant_f[t[0], t[1], t[2], 1, start_time[1], chantier])
-                            
-                            
-                        elif t[0] == 'DEP' and chantier == 'WPY_DEP':
-
-                            task = self.dep_taches[-1]
-                            self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] + int(task[1]) <= start_time[0] - self.epsilon + self.M * (1 - self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,0]))
-                            self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] >= end_time[0] + self.epsilon - self.M * self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,0])
-
-                            if start_time[1] != 0:
-                                
-                                task = self.dep_taches[-1]
-                                self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] + int(task[1]) <= start_time[0] - self.epsilon + self.M * (1 - self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,1]))
-                                self.model.addConstr(self.th_dep[t[0],t[1],t[2],int(task[0])] >= end_time[0] + self.epsilon - self.M * self.th_dep_unavail[t[0],t[1],t[2],int(task[0]),start_time[0],chantier,1])
+            """Constraint 1.2: Ensure chantier respect unavailable periods. Periods only cutting one side of a window are already bounds of the start times."""
+            for start, binaries, periods, windows in [
+                (self.a, self.chant_d, self.chant_d_periods, self.deb_windows),
+                (self.b, self.chant_e, self.chant_e_periods, self.for_windows),
+                (self.c, self.chant_f, self.chant_f_periods, self.deg_windows),
+            ]:
+                for key, (start_time, end_time) in periods.items():
+                    t = key[:3]
+                    lo, hi = windows[t]
+                    self.model.addConstr(start[t] <= start_time - self.epsilon + self.big_m('unavail_chantier', hi - start_time + self.epsilon) * (1 - binaries[key]))
+                    self.model.addConstr(start[t] >= end_time + self.epsilon - self.big_m('unavail_chantier', end_time + self.epsilon - lo) * binaries[key])
+
+            # human tasks in the chantier
+            for th, binaries, periods, windows in [
+                (self.th_arr, self.th_arr_unavail, self.th_arr_periods, self.th_arr_windows),
+                (self.th_dep, self.th_dep_unavail, self.th_dep_periods, self.th_dep_windows),
+            ]:
+                for key, (start_time, end_time, duree) in periods.items():
+                    task = key[:4]
+                    lo, hi = windows[task]
+                    self.model.addConstr(th[task] + duree <= start_time - self.epsilon + self.big_m('unavail_tasks', hi + duree - start_time + self.epsilon) * (1 - binaries[key]))
+                    self.model.addConstr(th[task] >= end_time + self.epsilon - self.big_m('unavail_tasks', end_time + self.epsilon - lo) * binaries[key])
 
             print("Constraint 1.2: Unavailability chantier constraints defined")
                     
 
         def define_single_train_per_machine_constraints():
-            """Constraint 2: Ensure each machine processes one train at a time."""
-            for machine in self.machines:
-                for i in range(len(self.trains)):
-                    for j in range(i + 1, len(self.trains)):
-                        train1 = self.trains[i]
-                        train2 = self.trains[j]
-                        for time in [0, 14]:
-                            if train1[0] == 'ARR' and train2[0] == 'ARR' and machine == 'DEB':
-                                # Train1 before Train2
-                                self.model.addConstr(self.a[train1[0], train1[1], train1[2]] <= self.a[train2[0], train2[1], train2[2]] - time - self.epsilon + self.M * (1 - self.g_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time])) 
-                                # Train1 after Train2
-                                self.model.addConstr(self.a[train1[0], train1[1], train1[2]] >= self.a[train2[0], train2[1], train2[2]] + time + self.epsilon - self.M * (1 - self.g_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time]))
-                                # Ensure either before or after
-                                self.model.addConstr(self.g_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] + self.g_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] == 1)
-
-                            elif train1[0] == 'DEP' and train2[0] == 'DEP' and machine == 'FOR':
-                                self.model.addConstr(self.b[train1[0], train1[1], train1[2]] <= self.b[train2[0], train2[1], train2[2]] - time - self.epsilon + self.M * (1 - self.k_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time])) 
-                                self.model.addConstr(self.b[train1[0], train1[1], train1[2]] >= self.b[train2[0], train2[1], train2[2]] + time + self.epsilon - self.M * (1 - self.k_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time]))
-                                self.model.addConstr(self.k_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] + self.k_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] == 1)
-
-                            elif train1[0] == 'DEP' and train2[0] == 'DEP' and machine == 'DEG':
-                                self.model.addConstr(self.c[train1[0], train1[1], train1[2]] <= self.c[train2[0], train2[1], train2[2]] - time - self.epsilon + self.M * (1 - self.l_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time])) 
-                                self.model.addConstr(self.c[train1[0], train1[1], train1[2]] >= self.c[train2[0], train2[1], train2[2]] + time + self.epsilon - self.M * (1 - self.l_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time]))
-                                self.model.addConstr(self.l_before[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] + self.l_after[train1[0], train1[1], train1[2], train2[0], train2[1], train2[2], time] == 1)
+            """Constraint 2: Ensure each machine processes one train at a time. Only the pairs of trains whose time windows overlap have a disjunction, the others are ordered by their bounds."""
+            for machine, start, before, after, windows in [
+                ('DEB', self.a, self.g_before, self.g_after, self.deb_windows),
+                ('FOR', self.b, self.k_before, self.k_after, self.for_windows),
+                ('DEG', self.c, self.l_before, self.l_after, self.deg_windows),
+            ]:
+                if machine not in self.machines:
+                    continue
+                for key in before.keys():
+                    train1, train2, time = key[:3], key[3:6], key[6]
+                    (lo1, hi1), (lo2, hi2) = windows[train1], windows[train2]
+                    # Train1 before Train2
+                    self.model.addConstr(start[train1] <= start[train2] - time - self.epsilon + self.big_m('single_train_per_machine', hi1 - lo2 + time + self.epsilon) * (1 - before[key]))
+                    # Train1 after Train2
+                    self.model.addConstr(start[train1] >= start[train2] + time + self.epsilon - self.big_m('single_train_per_machine', hi2 - lo1 + time + self.epsilon) * (1 - after[key]))
+                    # Ensure either before or after
+                    self.model.addConstr(before[key] + after[key] == 1)
 
             print('2: One train processed by a machine constraint defined')
 
@@ -299,7 +414,7 @@ class ModelJalon3:
             """Constraint 5: Ensure 'FOR' starts only after all required 'DEB' processes finish."""
             for dep_train, arr_trains in self.trains_requis_dict.items():
                 for arr_train in arr_trains:
-                    self.model.addConstr(self.b[dep_train[0], dep_train[1], dep_train[2]] >= self.a[arr_train[0], arr_train[1], arr_train[2]] + 15, name=f"constraint_FOR_DEB_{dep_train[1]}_{arr_train[1]}")
+                    self.model.addConstr(self.b[dep_train[0], dep_train[1], dep_train[2]] >= self.a[arr_train[0], arr_train[1], arr_train[2]] + self.machines_durees[0], name=f"constraint_FOR_DEB_{dep_train[1]}_{arr_train[1]}")
             print('5: FOR after DEB constraint defined')
         
         def define_task_time_slots_constraint():
@@ -320,67 +435,67 @@ class ModelJalon3:
 
         def define_REC_occupation_relation_constraints(self):
             """Constraint 8.1: Relate binary variables for occupation to the start time of each machine"""
-            for minute in self.minute_slots:
-                for train in self.trains_arr:
-                    # Chantier REC
-                    # tarr*occup <= t
+            for key in self.rec_occup.keys():
+                train, minute = key[:3], key[3]
+                # Chantier REC
+                # tarr*occup <= t
+                self.model.addConstr(
+                    train[2]/15*self.rec_occup[train[0],train[1],train[2], minute] <= minute,
+                    name=f"rec_occup_before_{train}_{minute}"
+                )
+                # t <= (a+15)*occup + M(1-occup)
+                self.model.addConstr(
+                    minute <= (self.a[train[0],train[1],train[2]]+15)/15*self.rec_occup[train[0],train[1],train[2], minute] + self.big_m('rec_occup', minute)*(1-self.rec_occup[train[0],train[1],train[2], minute]),
+                    name=f"rec_occup_after_{train}_{minute}"
+                )
+                # t-tarr <= M*x
+                self.model.addConstr(
+                    (minute - train[2]/15) <= self.big_m('rec_occup', minute - train[2]/15)*self.rec_x[train[0],train[1],train[2], minute],
+                    name=f"rec_occup_after_harr_{train}_{minute}"
+                )
+                # (a+15)-t <= M*y
+                self.model.addConstr(
+                    (self.a[train[0],train[1],train[2]]+15)/15 - minute <= self.big_m('rec_occup', (self.deb_windows[train][1]+15)/15 - minute)*self.rec_y[train[0],train[1],train[2], minute],
+                    name=f"rec_occup_before_harr_{train}_{minute}"
+                )
+                # occup >= x+y-1
+                self.model.addConstr(
+                    self.rec_occup[train[0],train[1],train[2], minute] >= self.rec_x[train[0],train[1],train[2], minute] + self.rec_y[train[0],train[1],train[2], minute] - 1,
+                )
+            print("8.1: Occupation variables REC related to start time defined.")
+        
+        def define_FOR_occupation_relation_constraints(self):
+            """Constraint 8.2: Relate binary variables for occupation to the start time of each machine"""
+            for key in self.for_occup.keys():
+                train, minute = key[:3], key[3]
+                if train[0] == 'ARR':
+                    train_dep = self.arr_to_dep[train]
+                    # Chantier FOR
+                    # a*occup <= t
                     self.model.addConstr(
-                        train[2]/15*self.rec_occup[train[0],train[1],train[2], minute] <= minute,
-                        name=f"rec_occup_before_{train}_{minute}"
+                        self.a[train[0],train[1],train[2]]/15*self.for_occup[train[0],train[1],train[2], minute] <= minute,
+                        name=f"for_occup_before_{train}_{minute}"
                     )
-                    # t <= (a+15)*occup + M(1-occup)
+                    # t <= b*occup + M(1-occup)
                     self.model.addConstr(
-                        minute <= (self.a[train[0],train[1],train[2]]+15)/15*self.rec_occup[train[0],train[1],train[2], minute] + self.M*(1-self.rec_occup[train[0],train[1],train[2], minute]),
-                        name=f"rec_occup_after_{train}_{minute}"
+                        minute <= (self.b[train_dep[0],train_dep[1],train_dep[2]])/15*self.for_occup[train[0],train[1],train[2], minute] + self.big_m('for_occup', minute)*(1-self.for_occup[train[0],train[1],train[2], minute]),
+                        name=f"for_occup_after_{train}_{minute}"
                     )
-                    # t-tarr <= M*x
+                    # t-a <= M*x
                     self.model.addConstr(
-                        (minute - train[2]/15) <= self.M*self.rec_x[train[0],train[1],train[2], minute],
-                        name=f"rec_occup_after_harr_{train}_{minute}"
+                        (minute - self.a[train[0],train[1],train[2]]/15) <= self.big_m('for_occup', minute - self.deb_windows[train][0]/15)*self.for_x[train[0],train[1],train[2], minute],
+                        name=f"for_occup_after_harr_{train}_{minute}"
                     )
-                    # (a+15)-t <= M*y
+                    # b-t <= M*y
                     self.model.addConstr(
-                        (self.a[train[0],train[1],train[2]]+15)/15 - minute <= self.M*self.rec_y[train[0],train[1],train[2], minute],
-                        name=f"rec_occup_before_harr_{train}_{minute}"
+                        (self.b[train_dep[0],train_dep[1],train_dep[2]])/15 - minute <= self.big_m('for_occup', self.for_windows[train_dep][1]/15 - minute)*self.for_y[train[0],train[1],train[2], minute],
+                        name=f"for_occup_before_harr_{train}_{minute}"
                     )
                     # occup >= x+y-1
                     self.model.addConstr(
-                        self.rec_occup[train[0],train[1],train[2], minute] >= self.rec_x[train[0],train[1],train[2], minute] + self.rec_y[train[0],train[1],train[2], minute] - 1,
+                        self.for_occup[train[0],train[1],train[2], minute] >= self.for_x[train[0],train[1],train[2], minute] + self.for_y[train[0],train[1],train[2], minute] - 1,
                     )
-            print("8.1: Occupation variables REC related to start time defined.")
-        
-        def define_FOR_occupation_relation_constraints(self):
-            """Constraint 8.2: Relate binary variables for occupation to the start time of each machine"""
-            for minute in self.minute_slots:
-                for train in self.trains_arr:
-                    train_dep = next((k for k, v in self.trains_requis_dict.items() if train in v), None)
-                    if train_dep is not None:
-                        # Chantier FOR
-                        # a*occup <= t
-                        self.model.addConstr(
-                            self.a[train[0],train[1],train[2]]/15*self.for_occup[train[0],train[1],train[2], minute] <= minute,
-                            name=f"for_occup_before_{train}_{minute}"
-                        )
-                        # t <= b*occup + M(1-occup)
-                        self.model.addConstr(
-                            minute <= (self.b[train_dep[0],train_dep[1],train_dep[2]])/15*self.for_occup[train[0],train[1],train[2], minute] + self.M*(1-self.for_occup[train[0],train[1],train[2], minute]),
-                            name=f"for_occup_after_{train}_{minute}"
-                        )
-                        # t-a <= M*x
-                        self.model.addConstr(
-                            (minute - self.a[train[0],train[1],train[2]]/15) <= self.M*self.for_x[train[0],train[1],train[2], minute],
-                            name=f"for_occup_after_harr_{train}_{minute}"
-                        )
-                        # b-t <= M*y
-                        self.model.addConstr(
-                            (self.b[train_dep[0],train_dep[1],train_dep[2]])/15 - minute <= self.M*self.for_y[train[0],train[1],train[2], minute],
-                            name=f"for_occup_before_harr_{train}_{minute}"
-                        )
-                        # occup >= x+y-1
-                        self.model.addConstr(
-                            self.for_occup[train[0],train[1],train[2], minute] >= self.for_x[train[0],train[1],train[2], minute] + self.for_y[train[0],train[1],train[2], minute] - 1,
-                        )
-                for train in self.trains_dep:
+                else:
                     # Chantier FOR
                     # b*occup <= t
                     self.model.addConstr(
@@ -389,17 +504,17 @@ class ModelJalon3:
                     )
                     # t <= (c+15)*occup + M(1-occup)
                     self.model.addConstr(
-                        minute <= (self.c[train[0],train[1],train[2]]+15)/15*self.for_occup[train[0],train[1],train[2], minute] + self.M*(1-self.for_occup[train[0],train[1],train[2], minute]),
+                        minute <= (self.c[train[0],train[1],train[2]]+15)/15*self.for_occup[train[0],train[1],train[2], minute] + self.big_m('for_occup', minute)*(1-self.for_occup[train[0],train[1],train[2], minute]),
                         name=f"for_occup_after_{train}_{minute}"
                     )
                     # t-b <= M*x
                     self.model.addConstr(
-                        (minute - self.b[train[0],train[1],train[2]]/15) <= self.M*self.for_x[train[0],train[1],train[2], minute],
+                        (minute - self.b[train[0],train[1],train[2]]/15) <= self.big_m('for_occup', minute - self.for_windows[train][0]/15)*self.for_x[train[0],train[1],train[2], minute],
                         name=f"for_occup_after_harr_{train}_{minute}"
                     )
                     # (c+15)-t <= M*y
                     self.model.addConstr(
-                        (self.c[train[0],train[1],train[2]]+15)/15 - minute <= self.M*self.for_y[train[0],train[1],train[2], minute],
+                        (self.c[train[0],train[1],train[2]]+15)/15 - minute <= self.big_m('for_occup', (self.deg_windows[train][1]+15)/15 - minute)*self.for_y[train[0],train[1],train[2], minute],
                         name=f"for_occup_before_harr_{train}_{minute}"
                     )
                     # occup >= x+y-1
@@ -410,49 +525,49 @@ class ModelJalon3:
 
         def define_DEP_occupation_relation_constraints(self):
             """Constraint 8.3: Relate binary variables for occupation to the start time of each machine"""
-            for minute in self.minute_slots:
-                for train in self.trains_dep:
-                    # Chantier DEP
-                    # c*occup <= t
-                    self.model.addConstr(
-                        self.c[train[0],train[1],train[2]]/15*self.dep_occup[train[0],train[1],train[2], minute] <= minute,
-                        name=f"dep_occup_before_{train}_{minute}"
-                    )
-                    # t <= tdep*occup + M(1-occup)
-                    self.model.addConstr(
-                        minute <= train[2]/15*self.dep_occup[train[0],train[1],train[2], minute] + self.M*(1-self.dep_occup[train[0],train[1],train[2], minute]),
-                        name=f"dep_occup_after_{train}_{minute}"
-                    )
-                    # t-c <= M*x
-                    self.model.addConstr(
-                        (minute - self.c[train[0],train[1],train[2]]/15) <= self.M*self.dep_x[train[0],train[1],train[2], minute],
-                        name=f"dep_occup_after_harr_{train}_{minute}"
-                    )
-                    # tdep-t <= M*y
-                    self.model.addConstr(
-                        train[2]/15 - minute <= self.M*self.dep_y[train[0],train[1],train[2], minute],
-                        name=f"dep_occup_before_harr_{train}_{minute}"
-                    )
-                    # occup >= x+y-1
-                    self.model.addConstr(
-                        self.dep_occup[train[0],train[1],train[2], minute] >= self.dep_x[train[0],train[1],train[2], minute] + self.dep_y[train[0],train[1],train[2], minute] - 1,
-                    )
+            for key in self.dep_occup.keys():
+                train, minute = key[:3], key[3]
+                # Chantier DEP
+                # c*occup <= t
+                self.model.addConstr(
+                    self.c[train[0],train[1],train[2]]/15*self.dep_occup[train[0],train[1],train[2], minute] <= minute,
+                    name=f"dep_occup_before_{train}_{minute}"
+                )
+                # t <= tdep*occup + M(1-occup)
+                self.model.addConstr(
+                    minute <= train[2]/15*self.dep_occup[train[0],train[1],train[2], minute] + self.big_m('dep_occup', minute)*(1-self.dep_occup[train[0],train[1],train[2], minute]),
+                    name=f"dep_occup_after_{train}_{minute}"
+                )
+                # t-c <= M*x
+                self.model.addConstr(
+                    (minute - self.c[train[0],train[1],train[2]]/15) <= self.big_m('dep_occup', minute - self.deg_windows[train][0]/15)*self.dep_x[train[0],train[1],train[2], minute],
+                    name=f"dep_occup_after_harr_{train}_{minute}"
+                )
+                # tdep-t <= M*y
+                self.model.addConstr(
+                    train[2]/15 - minute <= self.big_m('dep_occup', train[2]/15 - minute)*self.dep_y[train[0],train[1],train[2], minute],
+                    name=f"dep_occup_before_harr_{train}_{minute}"
+                )
+                # occup >= x+y-1
+                self.model.addConstr(
+                    self.dep_occup[train[0],train[1],train[2], minute] >= self.dep_x[train[0],train[1],train[2], minute] + self.dep_y[train[0],train[1],train[2], minute] - 1,
+                )
             print("8.3: Occupation variables DEP related to start time defined.")
         
         def max_voies_constraint(self):
-            """Constraint 9: Ensure that no more than max_voies are used at any time."""
+            """Constraint 9: Ensure that no more than max_voies are used at any time. Slots outside the time window of a train count as 0."""
             for minute in self.minute_slots:
                 self.model.addConstr(
-                    quicksum(self.rec_occup[train[0], train[1], train[2], minute] for train in self.trains_arr) <= self.max_voies[0],
-                    name=f"max_voies_constraint_{minute}"
+                    self.rec_occup.sum('ARR', '*', '*', minute) <= self.max_voies[0],
+                    name=f"max_voies_constraint_rec_{minute}"
                 )
                 self.model.addConstr(
-                    quicksum(self.for_occup[train[0], train[1], train[2], minute] for train in self.trains_dep) <= self.max_voies[1],
-                    name=f"max_voies_constraint_{minute}"
+                    self.for_occup.sum('DEP', '*', '*', minute) <= self.max_voies[1],
+                    name=f"max_voies_constraint_for_{minute}"
                 )
                 self.model.addConstr(
-                    quicksum(self.dep_occup[train[0], train[1], train[2], minute] for train in self.trains_dep) <= self.max_voies[2],
-                    name=f"max_voies_constraint_{minute}"
+                    self.dep_occup.sum('DEP', '*', '*', minute) <= self.max_voies[2],
+                    name=f"max_voies_constraint_dep_{minute}"
                 )
             print("9: Maximum voies constraint defined.")
 
@@ -460,15 +575,15 @@ class ModelJalon3:
             """Constraint 10: Calculate the maximum number of voies used."""
             for minute in self.minute_slots:
                 self.model.addConstr(
-                    self.rec_max >= quicksum(self.rec_occup[train[0], train[1], train[2], minute] for train in self.trains_arr),
+                    self.rec_max >= self.rec_occup.sum('*', '*', '*', minute),
                     name=f"rec_max_constraint_{minute}"
                 )
                 self.model.addConstr(
-                    self.for_max >= quicksum(self.for_occup[train[0], train[1], train[2], minute] for train in self.trains),
+                    self.for_max >= self.for_occup.sum('*', '*', '*', minute),
                     name=f"for_max_constraint_{minute}"
                 )
                 self.model.addConstr(
-                    self.dep_max >= quicksum(self.dep_occup[train[0], train[1], train[2], minute] for train in self.trains_dep),
+                    self.dep_max >= self.dep_occup.sum('*', '*', '*', minute),
                     name=f"dep_max_constraint_{minute}"
                 )
             print("10: Maximum voies used calculated.")
@@ -553,8 +668,9 @@ class ModelJalon3:
                             th = self.th_dep
                             duree_set = self.dep_durees
                         
-                        self.model.addConstr(th[train[0],train[1],train[2],order] >= start_time - self.M*(1-envelope_tache[i,train[0],train[1],train[2],order]))
-                        self.model.addConstr(th[train[0],train[1],train[2],order]+duree_set[order-1] <= end_time + self.M*(1-envelope_tache[i,train[0],train[1],train[2],order]))
+                        lo, hi = (self.th_arr_windows if th is self.th_arr else self.th_dep_windows)[train + (order,)]
+                        self.model.addConstr(th[train[0],train[1],train[2],order] >= start_time - self.big_m('task_placement', start_time - lo)*(1-envelope_tache[i,train[0],train[1],train[2],order]))
+                        self.model.addConstr(th[train[0],train[1],train[2],order]+duree_set[order-1] <= end_time + self.big_m('task_placement', hi + duree_set[order-1] - end_time)*(1-envelope_tache[i,train[0],train[1],train[2],order]))
 
 
         def define_all_placements(self):
@@ -564,6 +680,40 @@ class ModelJalon3:
             define_task_placement(self,self.envelope_taches_REC_DEP,'roulement_reception_depart',self.dep_orders, self.trains, self.th_arr, self.arr_durees)
             define_task_placement(self,self.envelope_taches_FOR_DEP,'roulement_formation_depart',self.dep_orders, self.trains_dep, self.th_dep, self.dep_durees)
 
+        def define_all_placements_matrix(self):
+            """21.1 (matrix build): same rows as define_all_placements, added in bulk."""
+            th_vars, envelope_vars, starts, ends, durees, lows, highs = [], [], [], [], [], [], []
+            for envelope_tache, roulement, order_set, train_set in [
+                (self.envelope_taches_REC, 'roulement_reception', self.arr_orders, self.trains_arr),
+                (self.envelope_taches_FOR, 'roulement_formation', self.dep_orders[:-1], self.trains_dep),
+                (self.envelope_taches_DEP, 'roulement_depart', [self.dep_orders[-1]], self.trains_dep),
+                (self.envelope_taches_REC_DEP, 'roulement_reception_depart', self.dep_orders, self.trains),
+                (self.envelope_taches_FOR_DEP, 'roulement_formation_depart', self.dep_orders, self.trains_dep),
+            ]:
+                for i, (start_time, end_time) in enumerate(self.envelopes_agents[roulement]):
+                    for order in order_set:
+                        order = int(order)
+                        for train in train_set:
+                            # reception_depart: orders 1 to 3 of the arrival trains and 4 of the departure trains
+                            if roulement == 'roulement_reception_depart' and (order == 4 if train[0] == 'ARR' else order in (1, 2, 3)):
+                                continue
+                            th, windows, duree_set = (self.th_arr, self.th_arr_windows, self.arr_durees) if train[0] == 'ARR' else (self.th_dep, self.th_dep_windows, self.dep_durees)
+                            key = train + (order,)
+                            th_vars.append(th[key])
+                            envelope_vars.append(envelope_tache[(i,) + key])
+                            starts.append(start_time)
+                            ends.append(end_time)
+                            durees.append(duree_set[order-1])
+                            lo, hi = windows[key]
+                            lows.append(lo)
+                            highs.append(hi)
+            starts, ends, durees, lows, highs = (np.array(values, dtype=float) for values in (starts, ends, durees, lows, highs))
+            # th >= start - M(1-envelope_tache), th + duree <= end + M(1-envelope_tache)
+            M = self.big_m('task_placement', starts - lows)
+            add_pair_rows(self.model, th_vars, envelope_vars, -M, GRB.GREATER_EQUAL, starts - M, 'task_placement_start')
+            M = self.big_m('task_placement', highs + durees - ends)
+            add_pair_rows(self.model, th_vars, envelope_vars, M, GRB.LESS_EQUAL, ends + M - durees, 'task_placement_end')
+
 
         def define_assign_task_to_envelope(self):
             """21.2: Force each task to be assigned to exactly one envelope"""
@@ -609,123 +759,123 @@ class ModelJalon3:
         
         def define_task_in_progress_rec_relation_constraint(self):
             """22.1: REC For every minute and task, set task_in_progress to 1 if task is in progress at that minute."""  
-            for minute in self.minute_slots:
-                for train in self.trains_arr:
-                    for order in self.arr_orders:
-                        # Chantier REC
-                        start_time = self.th_arr[train[0],train[1],train[2],order]
-                        end_time = self.th_arr[train[0],train[1],train[2],order] + self.arr_durees[order-1]
-                        task_in_progress = self.task_in_progress_arr[train[0],train[1],train[2],order,minute]
-                        # th*in_progress <= minute
-                        self.model.addConstr(
-                            start_time*task_in_progress <= minute,
-                            name=f"task_in_prog_rec_1_{minute}_{train}_{order}"
-                        )
-                        # minute <= th+duree*in_progress + M(1-in_progress)
-                        self.model.addConstr(
-                            minute <= (end_time)*task_in_progress + self.M*(1-task_in_progress),
-                            name=f"task_in_prog_rec_2_{minute}_{train}_{order}"
-                        )
-                        # minute-th <= M*x
-                        self.model.addConstr(
-                            (minute - end_time) <= self.M*self.task_in_progress_arr_x[train[0],train[1],train[2],order,minute],
-                            name=f"task_in_prog_rec_3_{minute}_{train}_{order}"
-                        )
-                        # end_time-task <= M*y
-                        self.model.addConstr(
-                            end_time - minute <= self.M*self.task_in_progress_arr_y[train[0],train[1],train[2],order,minute],
-                            name=f"task_in_prog_rec_4_{minute}_{train}_{order}"
-                        )
-                        # in_progress >= x+y-1
-                        self.model.addConstr(
-                            task_in_progress >= self.task_in_progress_arr_x[train[0],train[1],train[2],order,minute] + self.task_in_progress_arr_y[train[0],train[1],train[2],order,minute] - 1,
-                            name=f"task_in_prog_rec_5_{minute}_{train}_{order}"
-                        )
+            for key in self.task_in_progress_arr.keys():
+                train, order, minute = key[:3], key[3], key[4]
+                # Chantier REC
+                family, (lo, hi) = 'task_in_prog_rec', self.th_arr_windows[key[:4]]
+                start_time = self.th_arr[train[0],train[1],train[2],order]
+                end_time = self.th_arr[train[0],train[1],train[2],order] + self.arr_durees[order-1]
+                task_in_progress = self.task_in_progress_arr[train[0],train[1],train[2],order,minute]
+                # th*in_progress <= minute
+                self.model.addConstr(
+                    start_time*task_in_progress <= minute,
+                    name=f"task_in_prog_rec_1_{minute}_{train}_{order}"
+                )
+                # minute <= th+duree*in_progress + M(1-in_progress)
+                self.model.addConstr(
+                    minute <= (end_time)*task_in_progress + self.big_m(family, minute)*(1-task_in_progress),
+                    name=f"task_in_prog_rec_2_{minute}_{train}_{order}"
+                )
+                # minute-th <= M*x
+                self.model.addConstr(
+                    (minute - end_time) <= self.big_m(family, minute - lo - self.arr_durees[order-1])*self.task_in_progress_arr_x[train[0],train[1],train[2],order,minute],
+                    name=f"task_in_prog_rec_3_{minute}_{train}_{order}"
+                )
+                # end_time-task <= M*y
+                self.model.addConstr(
+                    end_time - minute <= self.big_m(family, hi + self.arr_durees[order-1] - minute)*self.task_in_progress_arr_y[train[0],train[1],train[2],order,minute],
+                    name=f"task_in_prog_rec_4_{minute}_{train}_{order}"
+                )
+                # in_progress >= x+y-1
+                self.model.addConstr(
+                    task_in_progress >= self.task_in_progress_arr_x[train[0],train[1],train[2],order,minute] + self.task_in_progress_arr_y[train[0],train[1],train[2],order,minute] - 1,
+                    name=f"task_in_prog_rec_5_{minute}_{train}_{order}"
+                )
             print("23.1: Task in progress relation REC constraint defined.")
 
         def define_task_in_progress_for_relation_constraint(self):
             """22.2: FOR For every minute and task, set task_in_progress to 1 if task is in progress at that minute."""  
-            for minute in self.minute_slots:
-                for train in self.trains_dep:
-                    for order in self.dep_orders[:-1]:
-                        # Chantier FOR
-                        start_time = self.th_dep[train[0],train[1],train[2],order]
-                        end_time = self.th_dep[train[0],train[1],train[2],order] + self.dep_durees[order-1]
-                        task_in_progress = self.task_in_progress_dep[train[0],train[1],train[2],order,minute]
-                        # th*in_progress <= minute
-                        self.model.addConstr(
-                            start_time*task_in_progress <= minute,
-                            name=f"task_in_prog_for_1_{minute}_{train}_{order}"
-                        )
-                        # minute <= th+duree*in_progress + M(1-in_progress)
-                        self.model.addConstr(
-                            minute <= (end_time)*task_in_progress + self.M*(1-task_in_progress),
-                            name=f"task_in_prog_for_2_{minute}_{train}_{order}"
-                        )
-                        # minute-th <= M*x
-                        self.model.addConstr(
-                            (minute - end_time) <= self.M*self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute],
-                            name=f"task_in_prog_for_3_{minute}_{train}_{order}"
-                        )
-                        # end_time-task <= M*y
-                        self.model.addConstr(
-                            end_time - minute <= self.M*self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute],
-                            name=f"task_in_prog_for_4_{minute}_{train}_{order}"
-                        )
-                        # in_progress >= x+y-1
-                        self.model.addConstr(
-                            task_in_progress >= self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute] + self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute] - 1,
-                            name=f"task_in_prog_for_5_{minute}_{train}_{order}"
-                        )
+            for key in self.task_in_progress_dep.keys():
+                train, order, minute = key[:3], key[3], key[4]
+                if order not in self.dep_orders[:-1]:
+                    continue
+                # Chantier FOR
+                family, (lo, hi) = 'task_in_prog_for', self.th_dep_windows[key[:4]]
+                start_time = self.th_dep[train[0],train[1],train[2],order]
+                end_time = self.th_dep[train[0],train[1],train[2],order] + self.dep_durees[order-1]
+                task_in_progress = self.task_in_progress_dep[train[0],train[1],train[2],order,minute]
+                # th*in_progress <= minute
+                self.model.addConstr(
+                    start_time*task_in_progress <= minute,
+                    name=f"task_in_prog_for_1_{minute}_{train}_{order}"
+                )
+                # minute <= th+duree*in_progress + M(1-in_progress)
+                self.model.addConstr(
+                    minute <= (end_time)*task_in_progress + self.big_m(family, minute)*(1-task_in_progress),
+                    name=f"task_in_prog_for_2_{minute}_{train}_{order}"
+                )
+                # minute-th <= M*x
+                self.model.addConstr(
+                    (minute - end_time) <= self.big_m(family, minute - lo - self.dep_durees[order-1])*self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute],
+                    name=f"task_in_prog_for_3_{minute}_{train}_{order}"
+                )
+                # end_time-task <= M*y
+                self.model.addConstr(
+                    end_time - minute <= self.big_m(family, hi + self.dep_durees[order-1] - minute)*self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute],
+                    name=f"task_in_prog_for_4_{minute}_{train}_{order}"
+                )
+                # in_progress >= x+y-1
+                self.model.addConstr(
+                    task_in_progress >= self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute] + self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute] - 1,
+                    name=f"task_in_prog_for_5_{minute}_{train}_{order}"
+                )
             print("23.2: Task in progress relation FOR constraint defined.")
 
         def define_task_in_progress_dep_relation_constraint(self):
             """22.3: DEP For every minute and task, set task_in_progress to 1 if task is in progress at that minute."""  
-            for minute in self.minute_slots:
-                for train in self.trains_dep:
-                    order = 4
-                    # Chantier DEP
-                    start_time = self.th_dep[train[0],train[1],train[2],order]
-                    end_time = self.th_dep[train[0],train[1],train[2],order] + self.dep_durees[order-1]
-                    task_in_progress = self.task_in_progress_dep[train[0],train[1],train[2],order,minute]
-                    # th*in_progress <= minute
-                    self.model.addConstr(
-                        start_time*task_in_progress <= minute,
-                        name=f"task_in_prog_dep_1_{minute}_{train}_{order}"
-                    )
-                    # minute <= th+duree*in_progress + M(1-in_progress)
-                    self.model.addConstr(
-                        minute <= (end_time)*task_in_progress + self.M*(1-task_in_progress),
-                        name=f"task_in_prog_dep_2_{minute}_{train}_{order}"
-                    )
-                    # minute-th <= M*x
-                    self.model.addConstr(
-                        (minute - end_time) <= self.M*self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute],
-                        name=f"task_in_prog_dep_3_{minute}_{train}_{order}"
-                    )
-                    # end_time-task <= M*y
-                    self.model.addConstr(
-                        end_time - minute <= self.M*self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute],
-                        name=f"task_in_prog_dep_4_{minute}_{train}_{order}"
-                    )
-                    # in_progress >= x+y-1
-                    self.model.addConstr(
-                        task_in_progress >= self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute] + self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute] - 1,
-                        name=f"task_in_prog_dep_5_{minute}_{train}_{order}"
-                    )
+            for key in self.task_in_progress_dep.keys():
+                train, order, minute = key[:3], key[3], key[4]
+                if order != 4:
+                    continue
+                # Chantier DEP
+                family, (lo, hi) = 'task_in_prog_dep', self.th_dep_windows[key[:4]]
+                start_time = self.th_dep[train[0],train[1],train[2],order]
+                end_time = self.th_dep[train[0],train[1],train[2],order] + self.dep_durees[order-1]
+                task_in_progress = self.task_in_progress_dep[train[0],train[1],train[2],order,minute]
+                # th*in_progress <= minute
+                self.model.addConstr(
+                    start_time*task_in_progress <= minute,
+                    name=f"task_in_prog_dep_1_{minute}_{train}_{order}"
+                )
+                # minute <= th+duree*in_progress + M(1-in_progress)
+                self.model.addConstr(
+                    minute <= (end_time)*task_in_progress + self.big_m(family, minute)*(1-task_in_progress),
+                    name=f"task_in_prog_dep_2_{minute}_{train}_{order}"
+                )
+                # minute-th <= M*x
+                self.model.addConstr(
+                    (minute - end_time) <= self.big_m(family, minute - lo - self.dep_durees[order-1])*self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute],
+                    name=f"task_in_prog_dep_3_{minute}_{train}_{order}"
+                )
+                # end_time-task <= M*y
+                self.model.addConstr(
+                    end_time - minute <= self.big_m(family, hi + self.dep_durees[order-1] - minute)*self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute],
+                    name=f"task_in_prog_dep_4_{minute}_{train}_{order}"
+                )
+                # in_progress >= x+y-1
+                self.model.addConstr(
+                    task_in_progress >= self.task_in_progress_dep_x[train[0],train[1],train[2],order,minute] + self.task_in_progress_dep_y[train[0],train[1],train[2],order,minute] - 1,
+                    name=f"task_in_prog_dep_5_{minute}_{train}_{order}"
+                )
             print("23.3: Task in progress relation DEP constraint defined.")
 
         def define_envelope_active(self, roulement, envelope_active, envelope_used):
             """24.1: Define if an roulement is active at minute m"""
-            for i, (start_time,end_time) in enumerate(self.envelopes_agents[roulement]):
-                for minute_slot in self.minute_slots:
-                    minute = minute_slot*15
-                    if start_time <= minute < end_time:
-                        self.model.addConstr(
-                            envelope_active[minute_slot] == envelope_used[i], name = f'envelope_activity_{i}_{minute}'
-                        )
-                    else:
-                        continue
+            for i in range(len(self.envelopes_agents[roulement])):
+                for minute_slot in self.envelope_slots.slots(roulement, i):
+                    self.model.addConstr(
+                        envelope_active[minute_slot] == envelope_used[i], name = f'envelope_activity_{i}_{minute_slot*15}'
+                    )
 
             print(f'24: Roulement activity defined {roulement}')
 
@@ -738,20 +888,20 @@ class ModelJalon3:
 
 
         def define_max_agent_constraint(self):
-            """Constraint 24.2: Ensure that the maximum number of agents is not exceeded at any time."""
+            """Constraint 24.2: Ensure that the maximum number of agents is not exceeded at any time. Slots outside the time window of a task count as 0."""
             for minute in self.minute_slots:
                 self.model.addConstr(
-                    quicksum(self.task_in_progress_arr[train[0], train[1], train[2], order, minute] for train in self.trains_arr for order in self.arr_orders) 
+                    self.task_in_progress_arr.sum('*', '*', '*', '*', minute)
                     <= self.max_agents['reception'][minute]*self.envelope_active_REC[minute] + self.max_agents['reception_depart'][minute]*self.envelope_active_REC_DEP[minute],
                     name=f"max_agents_constraint_rec_{minute}"
                 )
                 self.model.addConstr(
-                    quicksum(self.task_in_progress_dep[train[0], train[1], train[2], order, minute] for train in self.trains_dep for order in self.dep_orders[:-1]) 
+                    quicksum(self.task_in_progress_dep.sum('*', '*', '*', order, minute) for order in self.dep_orders[:-1])
                     <= self.max_agents['formation'][minute]*self.envelope_active_FOR[minute] + self.max_agents['formation_depart'][minute]*self.envelope_active_FOR_DEP[minute],
                     name=f"max_agents_constraint_for_{minute}"
                 )
                 self.model.addConstr(
-                    quicksum(self.task_in_progress_dep[train[0], train[1], train[2], 4, minute] for train in self.trains_dep) 
+                    self.task_in_progress_dep.sum('*', '*', '*', 4, minute)
                     <= self.max_agents['depart'][minute]*self.envelope_active_DEP[minute] + self.max_agents['reception_depart'][minute]*self.envelope_active_REC_DEP[minute] + self.max_agents['formation_depart'][minute]*self.envelope_active_FOR_DEP[minute],
                     name=f"max_agents_constraint_dep_{minute}"
                 )
@@ -759,7 +909,15 @@ class ModelJalon3:
 
         def define_usage_relation_constraint(self):
             """Constraint 25: Convert envelope_taches into envelope_used."""
-            M = 100
+            def fitting(start_time, end_time, tasks):
+                """Tasks (train, order) whose time window lets them fit in the envelope, the most envelope_taches at 1 in it"""
+                count = 0
+                for train, order in tasks:
+                    windows, durees = (self.th_arr_windows, self.arr_durees) if train[0] == 'ARR' else (self.th_dep_windows, self.dep_durees)
+                    lo, hi = windows[train + (order,)]
+                    count += hi >= start_time and lo + durees[int(order)-1] <= end_time
+                return count
+
             # REC
             for i, (start_time,end_time) in enumerate(self.envelopes_agents['roulement_reception']):
                 self.model.addConstr(
@@ -767,7 +925,7 @@ class ModelJalon3:
                     name=f'envelope_used_rec_1_{i}'
                 )
                 self.model.addConstr(
-                    quicksum(self.envelope_taches_REC[i,train[0],train[1],train[2],order] for train in self.trains_arr for order in self.arr_orders) <= M*self.envelope_used_REC[i],
+                    quicksum(self.envelope_taches_REC[i,train[0],train[1],train[2],order] for train in self.trains_arr for order in self.arr_orders) <= self.big_m('usage_relation', fitting(start_time, end_time, [(train, order) for train in self.trains_arr for order in self.arr_orders]))*self.envelope_used_REC[i],
                     name=f'envelope_used_rec_2_{i}'
                 )
             # FOR
@@ -777,7 +935,7 @@ class ModelJalon3:
                     name=f'envelope_used_for_1_{i}'
                 )
                 self.model.addConstr(
-                    quicksum(self.envelope_taches_FOR[i,train[0],train[1],train[2],order] for train in self.trains_dep for order in self.dep_orders[:-1]) <= M*self.envelope_used_FOR[i],
+                    quicksum(self.envelope_taches_FOR[i,train[0],train[1],train[2],order] for train in self.trains_dep for order in self.dep_orders[:-1]) <= self.big_m('usage_relation', fitting(start_time, end_time, [(train, order) for train in self.trains_dep for order in self.dep_orders[:-1]]))*self.envelope_used_FOR[i],
                     name=f'envelope_used_for_2_{i}'
                 )
             # DEP
@@ -787,7 +945,7 @@ class ModelJalon3:
                     name=f'envelope_used_dep_1_{i}'
                 )
                 self.model.addConstr(
-                    quicksum(self.envelope_taches_DEP[i,train[0],train[1],train[2],4] for train in self.trains_dep) <= M*self.envelope_used_DEP[i],
+                    quicksum(self.envelope_taches_DEP[i,train[0],train[1],train[2],4] for train in self.trains_dep) <= self.big_m('usage_relation', fitting(start_time, end_time, [(train, 4) for train in self.trains_dep]))*self.envelope_used_DEP[i],
                     name=f'envelope_used_dep_2_{i}'
                 )
             # REC_DEP
@@ -806,7 +964,10 @@ class ModelJalon3:
                             for train in self.trains
                             for order in self.dep_orders
                             if not (train[0] == 'ARR' and order == 4) and not (train[0] == 'DEP' and (order == 1 or order == 2 or order == 3))) 
-                            <= M*self.envelope_used_REC_DEP[i],
+                            <= self.big_m('usage_relation', fitting(start_time, end_time, [
+                                (train, order) for train in self.trains for order in self.dep_orders
+                                if not (train[0] == 'ARR' and order == 4) and not (train[0] == 'DEP' and (order == 1 or order == 2 or order == 3))
+                            ]))*self.envelope_used_REC_DEP[i],
                     name=f'envelope_used_rec_dep_2_{i}'
                 )
             # FOR_DEP
@@ -823,208 +984,544 @@ class ModelJalon3:
                     quicksum(self.envelope_taches_FOR_DEP[i,train[0],train[1],train[2],order]
                             for train in self.trains_dep
                             for order in self.dep_orders)
-                            <= M*self.envelope_used_FOR_DEP[i],
+                            <= self.big_m('usage_relation', fitting(start_time, end_time, [(train, order) for train in self.trains_dep for order in self.dep_orders]))*self.envelope_used_FOR_DEP[i],
                     name=f'envelope_used_for_dep_2_{i}'
                 )
             print("25: Usage relation constraint defined.")
         
         def define_total_usage(self):
-            """Constraint 26: Calculate total usage of envelopes."""
+            """Constraint 26: Calculate total usage of envelopes, the used_envelopes being already counted."""
+            used = self.used_envelopes
             self.model.addConstr(
                 quicksum(
-                    self.envelope_used_REC[i] for i in range(len(self.envelopes_agents['roulement_reception']))
+                    self.envelope_used_REC[i] for i in range(len(self.envelopes_agents['roulement_reception'])) if i not in used.get('REC', ())
                 )+
                 quicksum(
-                    self.envelope_used_FOR[i] for i in range(len(self.envelopes_agents['roulement_formation']))
+                    self.envelope_used_FOR[i] for i in range(len(self.envelopes_agents['roulement_formation'])) if i not in used.get('FOR', ())
                 )+
                 quicksum(
-                    self.envelope_used_DEP[i] for i in range(len(self.envelopes_agents['roulement_depart']))
+                    self.envelope_used_DEP[i] for i in range(len(self.envelopes_agents['roulement_depart'])) if i not in used.get('DEP', ())
                 )+
                 quicksum(
-                    self.envelope_used_REC_DEP[i] for i in range(len(self.envelopes_agents['roulement_reception_depart']))
+                    self.envelope_used_REC_DEP[i] for i in range(len(self.envelopes_agents['roulement_reception_depart'])) if i not in used.get('REC_DEP', ())
                 )+
                 quicksum(
-                    self.envelope_used_FOR_DEP[i] for i in range(len(self.envelopes_agents['roulement_formation_depart']))
+                    self.envelope_used_FOR_DEP[i] for i in range(len(self.envelopes_agents['roulement_formation_depart'])) if i not in used.get('FOR_DEP', ())
                 ) <= self.envelope_used_total,
             )
             print("26: Total usage constraint defined.")
 
+        def define_occupation_relation_matrix(self):
+            """Constraints 8.1-8.3 (matrix build): same rows as the tupledict builders, added in bulk."""
+            # index of each train in a_vars or b_vars/c_vars, from its integer id
+            positions = self.train_table.positions
+            a_vars = [self.a[train] for train in self.trains_arr]
+            b_vars = [self.b[train] for train in self.trains_dep]
+            c_vars = [self.c[train] for train in self.trains_dep]
+            arr_to_dep = self.arr_to_dep
+
+            # Chantier REC: from arrival to end of DEB
+            keys = list(self.rec_occup.keys())
+            slots = np.array([k[3] for k in keys], dtype=float)
+            ref_lo = np.array([k[2] for k in keys]) / 15
+            end_hi = np.array([self.deb_windows[k[:3]][1] + 15 for k in keys]) / 15
+            add_occupation_rows(
+                self.model, [self.rec_occup[k] for k in keys], [self.rec_x[k] for k in keys], [self.rec_y[k] for k in keys],
+                slots,
+                start=(None, None, None, np.array([k[2] for k in keys]) / 15),
+                end=(a_vars, positions([k[:3] for k in keys]), 1 / 15, 1),
+                ref='start', M=tuple(self.big_m('rec_occup', m) for m in (slots, slots - ref_lo, end_hi - slots)), name='rec_occup'
+            )
+            print("8.1: Occupation variables REC related to start time defined (matrix).")
+
+            # Chantier FOR: arrival trains from DEB to FOR of their departure train, departure trains from FOR to end of DEG
+            keys = [k for k in self.for_occup.keys() if k[0] == 'ARR' and k[:3] in arr_to_dep]
+            slots = np.array([k[3] for k in keys], dtype=float)
+            ref_lo = np.array([self.deb_windows[k[:3]][0] for k in keys]) / 15
+            end_hi = np.array([self.for_windows[arr_to_dep[k[:3]]][1] for k in keys]) / 15
+            add_occupation_rows(
+                self.model, [self.for_occup[k] for k in keys], [self.for_x[k] for k in keys], [self.for_y[k] for k in keys],
+                slots,
+                start=(a_vars, positions([k[:3] for k in keys]), 1 / 15, 0),
+                end=(b_vars, positions([arr_to_dep[k[:3]] for k in keys]), 1 / 15, 0),
+                ref='start', M=tuple(self.big_m('for_occup', m) for m in (slots, slots - ref_lo, end_hi - slots)), name='for_occup_arr'
+            )
+            keys = [k for k in self.for_occup.keys() if k[0] == 'DEP']
+            slots = np.array([k[3] for k in keys], dtype=float)
+            ref_lo = np.array([self.for_windows[k[:3]][0] for k in keys]) / 15
+            end_hi = np.array([self.deg_windows[k[:3]][1] + 15 for k in keys]) / 15
+            add_occupation_rows(
+                self.model, [self.for_occup[k] for k in keys], [self.for_x[k] for k in keys], [self.for_y[k] for k in keys],
+                slots,
+                start=(b_vars, positions([k[:3] for k in keys]), 1 / 15, 0),
+                end=(c_vars, positions([k[:3] for k in keys]), 1 / 15, 1),
+                ref='start', M=tuple(self.big_m('for_occup', m) for m in (slots, slots - ref_lo, end_hi - slots)), name='for_occup_dep'
+            )
+            print("8.2: Occupation variables FOR related to start time defined (matrix).")
+
+            # Chantier DEP: from DEG to departure
+            keys = list(self.dep_occup.keys())
+            slots = np.array([k[3] for k in keys], dtype=float)
+            ref_lo = np.array([self.deg_windows[k[:3]][0] for k in keys]) / 15
+            end_hi = np.array([k[2] for k in keys]) / 15
+            add_occupation_rows(
+                self.model, [self.dep_occup[k] for k in keys], [self.dep_x[k] for k in keys], [self.dep_y[k] for k in keys],
+                slots,
+                start=(c_vars, positions([k[:3] for k in keys]), 1 / 15, 0),
+                end=(None, None, None, np.array([k[2] for k in keys]) / 15),
+                ref='start', M=tuple(self.big_m('dep_occup', m) for m in (slots, slots - ref_lo, end_hi - slots)), name='dep_occup'
+            )
+            print("8.3: Occupation variables DEP related to start time defined (matrix).")
+
+        def define_task_in_progress_matrix(self):
+            """Constraints 22.1-22.3 (matrix build): same rows as the tupledict builders, added in bulk."""
+            for th, task_in_progress, x, y, durees, windows, families in [
+                (self.th_arr, self.task_in_progress_arr, self.task_in_progress_arr_x, self.task_in_progress_arr_y, self.arr_durees, self.th_arr_windows,
+                 [('rec', lambda order: True)]),
+                (self.th_dep, self.task_in_progress_dep, self.task_in_progress_dep_x, self.task_in_progress_dep_y, self.dep_durees, self.th_dep_windows,
+                 [('for', lambda order: order in self.dep_orders[:-1]), ('dep', lambda order: order == 4)]),
+            ]:
+                th_keys = list(th.keys())
+                th_idx = {key: i for i, key in enumerate(th_keys)}
+                th_vars = [th[key] for key in th_keys]
+                for family, keep_order in families:
+                    keys = [k for k in task_in_progress.keys() if keep_order(k[3])]
+                    index = [th_idx[k[:4]] for k in keys]
+                    slots = np.array([k[4] for k in keys], dtype=float)
+                    duree = np.array([durees[k[3]-1] for k in keys], dtype=float)
+                    lo = np.array([windows[k[:4]][0] for k in keys], dtype=float)
+                    hi = np.array([windows[k[:4]][1] for k in keys], dtype=float)
+                    add_occupation_rows(
+                        self.model, [task_in_progress[k] for k in keys], [x[k] for k in keys], [y[k] for k in keys],
+                        slots,
+                        start=(th_vars, index, 1, 0),
+                        end=(th_vars, index, 1, duree),
+                        ref='end', M=tuple(self.big_m(f'task_in_prog_{family}', m) for m in (slots, slots - lo - duree, hi + duree - slots)),
+                        name=f'task_in_prog_{family}'
+                    )
+            print("23: Task in progress relation constraints defined (matrix).")
+
+        def define_voies_matrix(self):
+            """Constraints 9 and 10 (matrix build): one row per slot and chantier."""
+            for occup, trains, max_var, capacity, name in [
+                (self.rec_occup, self.trains_arr, self.rec_max, self.max_voies[0], 'rec'),
+                (self.for_occup, self.trains_dep, None, self.max_voies[1], 'for'),
+                (self.for_occup, self.trains, self.for_max, None, 'for'),
+                (self.dep_occup, self.trains_dep, self.dep_max, self.max_voies[2], 'dep'),
+            ]:
+                trains = set(trains)
+                keys = [k for k in occup.keys() if k[:3] in trains]
+                variables = [occup[k] for k in keys]
+                slots = [k[3] for k in keys]
+                if capacity is not None:
+                    add_slot_sum_rows(self.model, variables, slots, self.minute_slots, GRB.LESS_EQUAL, capacity, f'max_voies_constraint_{name}')
+                if max_var is not None:
+                    add_slot_sum_rows(
+                        self.model, variables, slots, self.minute_slots, GRB.LESS_EQUAL, 0, f'{name}_max_constraint',
+                        extra=[([max_var] * len(self.minute_slots), -np.ones(len(self.minute_slots)))]
+                    )
+            print("9-10: Maximum voies constraints defined (matrix).")
 
-        # run all constraints
+        def define_max_agent_matrix(self):
+            """Constraint 24.2 (matrix build): one row per slot and chantier."""
+            envelopes = {
+                'reception': self.envelope_active_REC, 'formation': self.envelope_active_FOR, 'depart': self.envelope_active_DEP,
+                'reception_depart': self.envelope_active_REC_DEP, 'formation_depart': self.envelope_active_FOR_DEP,
+            }
+            for task_in_progress, keep_order, roulements, name in [
+                (self.task_in_progress_arr, lambda order: True, ['reception', 'reception_depart'], 'rec'),
+                (self.task_in_progress_dep, lambda order: order in self.dep_orders[:-1], ['formation', 'formation_depart'], 'for'),
+                (self.task_in_progress_dep, lambda order: order == 4, ['depart', 'reception_depart', 'formation_depart'], 'dep'),
+            ]:
+                keys = [k for k in task_in_progress.keys() if keep_order(k[3])]
+                extra = [
+                    ([envelopes[roulement][minute] for minute in self.minute_slots], -np.array(self.max_agents[roulement], dtype=float))
+                    for roulement in roulements
+                ]
+                add_slot_sum_rows(
+                    self.model, [task_in_progress[k] for k in keys], [k[4] for k in keys], self.minute_slots,
+                    GRB.LESS_EQUAL, 0, f'max_agents_constraint_{name}', extra=extra
+                )
+            print("24.2: Maximum agents constraint defined (matrix).")
+
+        def define_voies_events(self):
+            """Constraints 8-10 (event build): voies only counted at the first slot each train occupies a chantier, see utils_event.
+            A train occupies the slots strictly between the start and end of its stay, as with the occupation variables."""
+            a, b, c = self.a, self.b, self.c
+            shift = lambda window, offset: (window[0] + offset, window[1] + offset)
+            rec_items = {
+                train: ((None, 15 * (train[2] // 15) + 15), (15 * (train[2] // 15) + 15,) * 2, (a[train], 0), self.deb_windows[train])
+                for train in self.trains_arr
+            }
+            for_items = {
+                train: ((a[train], 15), shift(self.deb_windows[train], 15), (b[self.arr_to_dep[train]], -15), shift(self.for_windows[self.arr_to_dep[train]], -15))
+                for train in self.trains_arr if train in self.arr_to_dep
+            } | {
+                train: ((b[train], 15), shift(self.for_windows[train], 15), (c[train], 0), self.deg_windows[train])
+                for train in self.trains_dep
+            }
+            dep_items = {
+                train: ((c[train], 15), shift(self.deg_windows[train], 15), (None, 15 * math.ceil(train[2] / 15) - 15), (15 * math.ceil(train[2] / 15) - 15,) * 2)
+                for train in self.trains_dep
+            }
+            self.voies_events = {
+                name: EventOverlaps(self.model, self.big_m, items, f'{name}_voies')
+                for name, items in [('rec', rec_items), ('for', for_items), ('dep', dep_items)]
+            }
+            trains_dep = set(self.trains_dep)
+            for name, max_var, capacity, capacity_trains in [
+                ('rec', self.rec_max, self.max_voies[0], None),
+                ('for', self.for_max, self.max_voies[1], trains_dep),
+                ('dep', self.dep_max, self.max_voies[2], None),
+            ]:
+                events = self.voies_events[name]
+                for train, count in events.counts().items():
+                    self.model.addConstr(max_var >= count, name=f"{name}_max_event_{train}")
+                for train, count in events.counts(capacity_trains).items():
+                    if capacity_trains is None or train in capacity_trains:
+                        self.model.addConstr(count <= capacity, name=f"max_voies_event_{name}_{train}")
+            print(f"8-10: Maximum voies constraints defined (event), {sum(len(events.z) for events in self.voies_events.values())} pairs.")
+
+        def define_max_agent_events(self):
+            """Constraint 24.2 (event build): tasks in progress only counted at the start of each task, against the agents of the
+            envelopes used at that time (the agents of a roulement over an envelope being its max_agents on the slots of the envelope)."""
+            envelope_used = {
+                'reception': self.envelope_used_REC, 'formation': self.envelope_used_FOR, 'depart': self.envelope_used_DEP,
+                'reception_depart': self.envelope_used_REC_DEP, 'formation_depart': self.envelope_used_FOR_DEP,
+            }
+            nb_slots = len(self.minute_slots)
+            self.agent_events, self.agent_covers = {}, {}
+            for th, windows, durees, keep_order, roulements, name in [
+                (self.th_arr, self.th_arr_windows, self.arr_durees, lambda order: True, ['reception', 'reception_depart'], 'rec'),
+                (self.th_dep, self.th_dep_windows, self.dep_durees, lambda order: order in self.dep_orders[:-1], ['formation', 'formation_depart'], 'for'),
+                (self.th_dep, self.th_dep_windows, self.dep_durees, lambda order: order == self.dep_orders[-1], ['depart', 'reception_depart', 'formation_depart'], 'dep'),
+            ]:
+                keys = [key for key in windows if keep_order(key[3])]
+                items = {
+                    key: ((th[key], 0), windows[key], (th[key], durees[key[3]-1] - 1), (windows[key][0] + durees[key[3]-1] - 1, windows[key][1] + durees[key[3]-1] - 1))
+                    for key in keys
+                }
+                envelopes = [
+                    (roulement, i, start, end, min(self.max_agents[roulement][max(0, start // 15):min(nb_slots, math.ceil(end / 15))], default=0), envelope_used[roulement][i])
+                    for roulement in roulements for i, (start, end) in enumerate(self.envelopes_agents[f'roulement_{roulement}'])
+                ]
+                self.agent_events[name] = events = EventOverlaps(self.model, self.big_m, items, f'{name}_agents')
+                self.agent_covers[name] = covers = EnvelopeCovers(self.model, self.big_m, {key: (th[key], windows[key]) for key in keys}, envelopes, f'{name}_agents')
+                capacities = covers.capacities(keys)
+                for key, count in events.counts().items():
+                    self.model.addConstr(count <= capacities[key], name=f"max_agents_event_{name}_{key}")
+            print(f"24.2: Maximum agents constraint defined (event), {sum(len(events.z) for events in self.agent_events.values())} pairs.")
+
+
+        # run all constraints, profiled by the BuildProfiler if enabled
+        run = self.profiler.run
 
         ## unavailability        
-        define_unavailability_machines_constraints()
-        define_unavailability_chantier_constraints()
-        define_single_train_per_machine_constraints()
+        run(define_unavailability_machines_constraints)
+        run(define_unavailability_chantier_constraints)
+        run(define_single_train_per_machine_constraints)
         ## every 15 minutes
-        define_task_time_slots_constraint()
+        run(define_task_time_slots_constraint)
         ## precedence and parallelisation
-        define_arr_start_constraint()
-        define_arr_tri_constraint()
-        define_tri_deb_constraint()
-        define_DEB_parallel_constraint()
-        define_for_after_deb_constraint()  
-        define_FOR_parallel_constraint()
-        define_attelage_FOR_constraint()
-        define_DEG_attelage_constraint()
-        define_DEG_parallel_constraint()
-        define_frein_DEG_constraint()
-        define_dep_final_constraint()
-        # voies and occupation
-        max_voies_constraint(self)
-        calculate_max_voies_used(self)
-        define_REC_occupation_relation_constraints(self)
-        define_FOR_occupation_relation_constraints(self)
-        define_DEP_occupation_relation_constraints(self)
-        # task in progress
-        define_task_in_progress_rec_relation_constraint(self)
-        define_task_in_progress_for_relation_constraint(self)
-        define_task_in_progress_dep_relation_constraint(self)
+        run(define_arr_start_constraint)
+        run(define_arr_tri_constraint)
+        run(define_tri_deb_constraint)
+        run(define_DEB_parallel_constraint)
+        run(define_for_after_deb_constraint)  
+        run(define_FOR_parallel_constraint)
+        run(define_attelage_FOR_constraint)
+        run(define_DEG_attelage_constraint)
+        run(define_DEG_parallel_constraint)
+        run(define_frein_DEG_constraint)
+        run(define_dep_final_constraint)
+        if self.capacity_mode == 'event':
+            # voies counted at the start of each stay, no occupation nor task in progress variables
+            run(define_voies_events, self)
+        elif self.build_mode == 'matrix':
+            # voies and occupation
+            run(define_voies_matrix, self)
+            run(define_occupation_relation_matrix, self)
+            # task in progress
+            run(define_task_in_progress_matrix, self)
+        else:
+            # voies and occupation
+            run(max_voies_constraint, self)
+            run(calculate_max_voies_used, self)
+            run(define_REC_occupation_relation_constraints, self)
+            run(define_FOR_occupation_relation_constraints, self)
+            run(define_DEP_occupation_relation_constraints, self)
+            # task in progress
+            run(define_task_in_progress_rec_relation_constraint, self)
+            run(define_task_in_progress_for_relation_constraint, self)
+            run(define_task_in_progress_dep_relation_constraint, self)
         # assign tasks to envelopes and times, restrict maximum agents
-        define_assign_task_to_envelope(self)
-        define_all_placements(self)
-        define_all_envelope_activity(self)
-        define_max_agent_constraint(self)
+        run(define_assign_task_to_envelope, self)
+        if self.build_mode == 'matrix':
+            run(define_all_placements_matrix, self)
+        else:
+            run(define_all_placements, self)
+        if self.capacity_mode == 'event':
+            run(define_max_agent_events, self)
+        elif self.build_mode == 'matrix':
+            run(define_all_envelope_activity, self)
+            run(define_max_agent_matrix, self)
+        else:
+            run(define_all_envelope_activity, self)
+            run(define_max_agent_constraint, self)
         # see if envelopes are used and how many
-        define_usage_relation_constraint(self)
-        define_total_usage(self)
+        run(define_usage_relation_constraint, self)
+        run(define_total_usage, self)
         
         
         print('Constraints defined')
+        self.big_m.report()
     
     def _define_objective_function(self):
         self.model.setObjective(self.envelope_used_total, GRB.MINIMIZE)  # Minimise total envelope usage
         print('Objective function defined')
 
+    def _define_warm_start(self):
+        """Give Gurobi a MIP start (Start attribute) built by the greedy heuristic of utils_warmstart, for all the variables of the model."""
+        start_time = tme.time()
+        nb_slots = len(self.minute_slots)
+        envelope_vars = {
+            'roulement_reception': 'envelope_taches_REC', 'roulement_formation': 'envelope_taches_FOR', 'roulement_depart': 'envelope_taches_DEP',
+            'roulement_reception_depart': 'envelope_taches_REC_DEP', 'roulement_formation_depart': 'envelope_taches_FOR_DEP',
+        }
+        envelope_used = {
+            'roulement_reception': 'REC', 'roulement_formation': 'FOR', 'roulement_depart': 'DEP',
+            'roulement_reception_depart': 'REC_DEP', 'roulement_formation_depart': 'FOR_DEP',
+        }
+        # envelopes each task can be assigned to, as in define_assign_task_to_envelope
+        task_envelopes = {}
+        for train_type, orders, roulements in [
+            ('ARR', self.arr_orders, ['roulement_reception', 'roulement_reception_depart']),
+            ('DEP', self.dep_orders[:-1], ['roulement_formation', 'roulement_formation_depart']),
+            ('DEP', self.dep_orders[-1:], ['roulement_depart', 'roulement_reception_depart', 'roulement_formation_depart']),
+        ]:
+            for order in orders:
+                task_envelopes[train_type, int(order)] = [
+                    (roulement, i, start, end) for roulement in roulements for i, (start, end) in enumerate(self.envelopes_agents.get(roulement, []))
+                ]
+        # envelopes of the trains fixed by the rolling horizon
+        assigned = {key[1:]: (roulement, key[0]) for roulement, name in envelope_vars.items() for key, value in self.fixed.get(name, {}).items() if value == 1}
+        values = greedy_schedule(
+            self.trains_arr, self.trains_dep, self.trains_requis_dict,
+            {'a': self.deb_windows, 'b': self.for_windows, 'c': self.deg_windows, 'th_arr': self.th_arr_windows, 'th_dep': self.th_dep_windows},
+            self.arr_durees, self.dep_durees, self.machine_intervals | self.chantier_intervals, self.max_voies, task_envelopes, nb_slots, 14 + self.epsilon, self.epsilon, assigned
+        )
+        # variables are dict keys below, they need to be in the model
+        self.model.update()
+        starts = {}
+
+        # start times and the variables following from them
+        for name in ['a', 'b', 'c', 'th_arr', 'th_dep']:
+            starts.update({getattr(self, name)[key]: value for key, value in values[name].items()})
+        starts.update({self.th_arr_int[key]: value / 15 for key, value in values['th_arr'].items()})
+        starts.update({self.th_dep_int[key]: value / 15 for key, value in values['th_dep'].items()})
+        a, b, c = values['a'], values['b'], values['c']
+
+        def occupation(occup, x, y, start, end, ref):
+            """occup is 1 on the slots strictly between start and end, x and y as forced by the rows 8.x and 22.x"""
+            count = np.zeros(nb_slots)
+            for key in occup.keys():
+                item, slot = key[:-1], key[-1]
+                start_value, end_value = start(item), end(item)
+                x_value = slot > (start_value if ref == 'start' else end_value)
+                y_value = end_value > slot
+                starts.update({occup[key]: x_value and y_value, x[key]: x_value, y[key]: y_value})
+                count[slot] += x_value and y_value
+            return count
+
+        if self.capacity_mode == 'slot':
+            rec_count = occupation(self.rec_occup, self.rec_x, self.rec_y, lambda train: train[2] / 15, lambda train: (a[train] + 15) / 15, 'start')
+            for_count = occupation(
+                self.for_occup, self.for_x, self.for_y,
+                lambda train: (a[train] if train[0] == 'ARR' else b[train]) / 15,
+                lambda train: b[self.arr_to_dep[train]] / 15 if train[0] == 'ARR' else (c[train] + 15) / 15, 'start'
+            )
+            dep_count = occupation(self.dep_occup, self.dep_x, self.dep_y, lambda train: c[train] / 15, lambda train: train[2] / 15, 'start')
+            starts.update({self.rec_max: rec_count.max(), self.for_max: for_count.max(), self.dep_max: dep_count.max()})
+            for occup, x, y, th, durees in [
+                (self.task_in_progress_arr, self.task_in_progress_arr_x, self.task_in_progress_arr_y, values['th_arr'], self.arr_durees),
+                (self.task_in_progress_dep, self.task_in_progress_dep_x, self.task_in_progress_dep_y, values['th_dep'], self.dep_durees),
+            ]:
+                occupation(occup, x, y, lambda task: th[task], lambda task: th[task] + durees[task[3]-1], 'end')
+        elif not self.cached:
+            # event indicators from the start times, the max voies being the largest count at an event
+            # (a cached model has no event objects, Gurobi completes the MIP start from the start times)
+            for events in list(self.voies_events.values()) + list(self.agent_events.values()):
+                starts.update(events.start_values(starts))
+            for name, max_var in [('rec', self.rec_max), ('for', self.for_max), ('dep', self.dep_max)]:
+                starts[max_var] = max(self.voies_events[name].count_values(starts).values(), default=0)
+
+        # disjunctions: 1 if the train is before the other train or the unavailable period
+        for before, after, start in [(self.g_before, self.g_after, a), (self.k_before, self.k_after, b), (self.l_before, self.l_after, c)]:
+            for key in before.keys():
+                is_before = start[key[:3]] <= start[key[3:6]] - key[6] - self.epsilon
+                starts.update({before[key]: is_before, after[key]: not is_before})
+        for binaries, periods, start in [
+            (self.d, self.d_periods, a), (self.e, self.e_periods, b), (self.f, self.f_periods, c),
+            (self.chant_d, self.chant_d_periods, a), (self.chant_e, self.chant_e_periods, b), (self.chant_f, self.chant_f_periods, c),
+        ]:
+            starts.update({binaries[key]: start[key[:3]] <= start_time - self.epsilon for key, (start_time, _) in periods.items()})
+        for binaries, periods, th in [(self.th_arr_unavail, self.th_arr_periods, values['th_arr']), (self.th_dep_unavail, self.th_dep_periods, values['th_dep'])]:
+            starts.update({binaries[key]: th[key[:4]] + duree <= start_time - self.epsilon for key, (start_time, _, duree) in periods.items()})
+
+        # envelopes of the tasks of the model, the fixed assignments of the trains outside the model being in used_envelopes
+        trains = set(self.trains)
+        used = {envelope for key, envelope in values['envelopes'].items() if key[:3] in trains}
+        reused = {(roulement, i) for roulement, name in envelope_used.items() for i in self.used_envelopes.get(name, ())}
+        for roulement, name in envelope_vars.items():
+            starts.update({var: (roulement, key[0]) == values['envelopes'].get(key[1:]) for key, var in getattr(self, name).items()})
+        for roulement, name in envelope_used.items():
+            used_vars = getattr(self, f'envelope_used_{name}')
+            active = np.zeros(nb_slots)
+            for i in range(len(self.envelopes_agents[roulement])):
+                starts[used_vars[i]] = (roulement, i) in used
+                slots = self.envelope_slots.slots(roulement, i)
+                active[slots.start:slots.stop] = (roulement, i) in used
+            if self.capacity_mode == 'slot':
+                active_vars = getattr(self, f'envelope_active_{name}')
+                starts.update({active_vars[slot]: active[slot] for slot in self.minute_slots})
+        if self.capacity_mode == 'event' and not self.cached:
+            for covers in self.agent_covers.values():
+                starts.update(covers.start_values(starts))
+        starts[self.envelope_used_total] = len(used - reused)
+
+        self.model.setAttr('Start', list(starts), [float(value) for value in starts.values()])
+        self.warm_start_report = {'heuristic_time': tme.time() - start_time, 'unplaced': len(values['unplaced']), 'objective': len(used - reused)}
+        print(f"Warm start: {len(self.trains) - len(values['unplaced'])}/{len(self.trains)} trains placed, {len(used - reused)} envelopes used, built in {self.warm_start_report['heuristic_time']:.2f}s")
+
+    def solution_variables(self):
+        """Variables read by get_results and the rolling horizon, by name"""
+        names = ['a', 'b', 'c', 'th_arr', 'th_dep', 'rec_max', 'for_max', 'dep_max']
+        names += [f'envelope_{kind}_{roulement}' for kind in ['taches', 'used'] for roulement in ['REC', 'FOR', 'DEP', 'REC_DEP', 'FOR_DEP']]
+        return {name: getattr(self, name) for name in names}
+
     def optimize(self):
-        """Optimize the model."""
-        self.model.setParam('TimeLimit', 400)
-        self.model.optimize()
+        """Optimize the model with the backend, the MIP start and the callback being used by Gurobi only."""
+        self.warm_start_report = {}
+        if self.backend.name != 'gurobi':
+            self.solution = self.backend.solve(self, self.time_limit)
+            print('Optimization complete')
+            return
+        if self.warm_start == 'greedy':
+            self._define_warm_start()
+        # filled by the callback: MIP start accepted or not, time of the first incumbent
+        self.model._warm_start = {'accepted': None, 'first_incumbent': None}
+        self.solution = self.backend.solve(self, self.time_limit, incumbent_callback)
+        self.warm_start_report |= self.model._warm_start
+        if self.warm_start == 'greedy':
+            print(f"Warm start accepted: {self.warm_start_report['accepted']}")
+        print(f"First incumbent after {self.warm_start_report['first_incumbent']}s")
         print('Optimization complete')
 
     def save_model(self):
         """Save the model to a file."""
-        self.model.write(self.model_save_path)
-        print(f'Model saved to {self.model_save_path}')
+        path = self.backend.write(self, self.model_save_path)
+        print(f'Model saved to {path}')
+
+    def save_telemetry(self):
+        """Save the progress time series and summary of the solve next to the results, if TELEMETRY is set."""
+        if self.telemetry is None or self.backend.name != 'gurobi':
+            return []
+        written = self.telemetry.save(f'{self.results_folder_save_path}/telemetry_{Path(self.fichier).stem}')
+        print(f'Telemetry saved to {", ".join(map(str, written))}')
+        return written
 
     def process_envelope_tasks(self,envelope_type, trains, orders, envelope_taches, th_var, taches_dict, results_roulements):
-        """Create dataframe structure to sort the tasks and which journee de service they are assigned to."""
-        for i, (start_time, end_time) in enumerate(self.envelopes_agents[envelope_type]):
-            for train in trains:
-                for order in orders:
-                    if envelope_type == 'roulement_reception_depart' and (train[0] == 'ARR' and order == 4 or train[0] == 'DEP' and (order == 1 or order == 2 or order == 3)):
-                        continue
-                    if envelope_type == 'roulement_reception_depart' and train[0] == 'ARR':
-                        taches_dict = self.arr_taches_dict
-                        th_var = 'th_arr'
-                    elif envelope_type == 'roulement_reception_depart' and train[0] == 'DEP':
-                        taches_dict = self.dep_taches_dict
-                        th_var = 'th_dep'
-                    nb_roulement = envelope_taches[i, train[0], train[1], train[2], order]
-                    if nb_roulement.X == 0:
-                        continue
-                    elif nb_roulement.X == 1:
-                        jour_start, horaire_start = minute_to_date2(start_time, self.j1)
-                        jour_end, horaire_end = minute_to_date2(end_time, self.j1)
-                        jour_tache, horaire_tache = minute_to_date2(self.model.getVarByName(f'{th_var}[{train[0]},{train[1]},{train[2]},{order}]').X, self.j1)
-                        jour_tache_fin, horaire_tache_fin = minute_to_date2(self.model.getVarByName(f'{th_var}[{train[0]},{train[1]},{train[2]},{order}]').X + taches_dict[order][0][0], self.j1)
-                        results_roulements.append({
-                            'Id JS': f'{envelope_type}_{horaire_start}-{horaire_end}_{jour_start}',
-                            'Type T': taches_dict[order][0][2],
-                            'Sillon': train,
-                            'Début T': f'{jour_tache} {horaire_tache}',
-                            'Fin T': f'{jour_tache_fin} {horaire_tache_fin}',
-                            'Durée T': taches_dict[order][0][0],
-                            'Lieu T': taches_dict[order][0][1],
-                            'Roulement': envelope_type
-                            
-                        })
+        """Create dataframe structure to sort the tasks and which journee de service they are assigned to, from the binaries of envelope_taches equal to 1."""
+        trains, orders = set(trains), set(orders)
+        assigned = []
+        for i, *train, order in self.solution.nonzero(envelope_taches):
+            train = tuple(train)
+            if train not in trains or order not in orders:
+                continue
+            if envelope_type == 'roulement_reception_depart':
+                if train[0] == 'ARR' and order == 4 or train[0] == 'DEP' and order in (1, 2, 3):
+                    continue
+                taches_dict, th_var = (self.arr_taches_dict, 'th_arr') if train[0] == 'ARR' else (self.dep_taches_dict, 'th_dep')
+            start_time, end_time = self.envelopes_agents[envelope_type][i]
+            debut = self.solution.value(th_var, train + (order,))
+            assigned.append((train, taches_dict[order][0], start_time, end_time, debut, debut + taches_dict[order][0][0]))
+        # the 4 dates of each assigned task converted in one call
+        dates, horaires = minutes_to_date2([minute for row in assigned for minute in row[2:]], self.j1)
+        dates, horaires = dates.reshape(-1, 4).tolist(), horaires.reshape(-1, 4).tolist()
+        for (train, tache, *_), jours, heures in zip(assigned, dates, horaires):
+            results_roulements.append({
+                'Id JS': f'{envelope_type}_{heures[0]}-{heures[1]}_{jours[0]}',
+                'Type T': tache[2],
+                'Sillon': train,
+                'Début T': f'{jours[2]} {heures[2]}',
+                'Fin T': f'{jours[3]} {heures[3]}',
+                'Durée T': tache[0],
+                'Lieu T': tache[1],
+                'Roulement': envelope_type
+
+            })
 
     def process_roulement(self, roulement_type, envelope_used, results_journees,roulement_nb):
         """Create dataframe structure for the journees de service that are used."""
-        for i, (start_time, end_time) in enumerate(self.envelopes_agents[roulement_type]):
-            if envelope_used[i].X == 0:
-                continue
-            date, time = minute_to_date2(start_time, self.j1)
+        envelopes = self.envelopes_agents[roulement_type]
+        used = self.solution.values_of(envelope_used, range(len(envelopes)))
+        keep = np.flatnonzero(used)
+        dates = minutes_to_date([envelopes[i][0] for i in keep], self.j1).tolist()
+        for value, date in zip(used[keep].tolist(), dates):
             if date not in results_journees:
                 results_journees[date] = np.zeros(5)
-            results_journees[date][roulement_nb] += envelope_used[i].X
+            results_journees[date][roulement_nb] += value
+
+    def plot_results(self):
+        """Save the gantt of the machine tasks and the sankey of the correspondances of the last results."""
+        file_name = Path(self.fichier).stem
+        gantt_image_save_path = f"{self.results_folder_save_path}/gantt_{file_name}.png"
+        sankey_image_save_path = f"{self.results_folder_save_path}/sankey_{file_name}.png"
+        display_gantt(self.results_file_path, gantt_image_save_path)
+        display_sankey(self.fichier, sankey_image_save_path)
 
     def get_results(self):
         """Extract and return results after optimization."""
-        if self.model.status == GRB.OPTIMAL or self.model.status == GRB.TIME_LIMIT or self.model.status == GRB.INTERRUPTED:
-            results = []
-            for train in self.trains:
-                if train[0] == 'ARR':
-                    jour, horaire = minute_to_date2(self.model.getVarByName(f'a[{train[0]},{train[1]},{train[2]}]').X, self.j1)
-                    results.append({
-                        'Id tâche': f'{self.machines[0]}_{train[1]}_{jour}',
-                        'Type de tâche': self.machines[0],
-                        'Jour': jour,
-                        'Heure début': horaire,
-                        'Durée': self.machines_durees[0],
-                        'Sillon': train[1]
-                    })
-                elif train[0] == 'DEP':
-                    jour, horaire = minute_to_date2(self.model.getVarByName(f'b[{train[0]},{train[1]},{train[2]}]').X, self.j1)
-                    results.append({
-                        'Id tâche': f'{self.machines[1]}_{train[1]}_{jour}',
-                        'Type de tâche': self.machines[1],
-                        'Jour': jour,
-                        'Heure début': horaire,
-                        'Durée': self.machines_durees[1],
-                        'Sillon': train[1]
-                    })
-                    jour, horaire = minute_to_date2(self.model.getVarByName(f'c[{train[0]},{train[1]},{train[2]}]').X, self.j1)
-                    results.append({
-                        'Id tâche': f'{self.machines[2]}_{train[1]}_{jour}',
-                        'Type de tâche': self.machines[2],
-                        'Jour': jour,
-                        'Heure début': horaire,
-                        'Durée': self.machines_durees[2],
-                        'Sillon': train[1]
-                    })
+        if self.solution.found:
+            # start times read in bulk, all converted to dates in one call
+            df_results = machine_tasks_frame(
+                self.trains_arr, self.trains_dep,
+                self.solution.values_of('a', self.trains_arr), self.solution.values_of('b', self.trains_dep), self.solution.values_of('c', self.trains_dep),
+                self.machines, self.machines_durees, self.j1
+            )
             voies =[{
-                'Taux max voies (%)': 100*self.rec_max.x/self.max_voies[0],
-                'Nombre max voies occupées': self.rec_max.x,
+                'Taux max voies (%)': 100*self.solution.value('rec_max')/self.max_voies[0],
+                'Nombre max voies occupées': self.solution.value('rec_max'),
                 'Nombre total voies dispo': self.max_voies[0],
             },
             {
-                'Taux max voies (%)': 100*self.for_max.x/self.max_voies[1],
-                'Nombre max voies occupées': self.for_max.x,
+                'Taux max voies (%)': 100*self.solution.value('for_max')/self.max_voies[1],
+                'Nombre max voies occupées': self.solution.value('for_max'),
                 'Nombre total voies dispo': self.max_voies[1],  
             },
             {
-                'Taux max voies (%)': 100*self.dep_max.x/self.max_voies[2],
-                'Nombre max voies occupées': self.dep_max.x,
+                'Taux max voies (%)': 100*self.solution.value('dep_max')/self.max_voies[2],
+                'Nombre max voies occupées': self.solution.value('dep_max'),
                 'Nombre total voies dispo': self.max_voies[2],  
             }
             ]
 
-            results_taches_humaines = []
-            for train in self.trains:
-                if train[0] == 'ARR':
-                    for task in self.arr_taches:
-                        jour, horaire = minute_to_date2(self.model.getVarByName(f'th_arr[{train[0]},{train[1]},{train[2]},{task[0]}]').X, self.j1)
-                        results_taches_humaines.append({
-                            'Id tâche': f'{self.machines[0]}_{train[1]}_{jour}',
-                            'Type de tâche': task,
-                            'Jour': jour,
-                            'Heure début': horaire,
-                            'Durée': task[1],
-                            'Sillon': train[1]
-                        })
-                elif train[0] == 'DEP':
-                    for task in self.dep_taches:
-                        jour, horaire = minute_to_date2(self.model.getVarByName(f'th_dep[{train[0]},{train[1]},{train[2]},{task[0]}]').X, self.j1)
-                        results_taches_humaines.append({
-                            'Id tâche': f'{self.machines[1]}_{train[1]}_{jour}',
-                            'Type de tâche': task,
-                            'Jour': jour,
-                            'Heure début': horaire,
-                            'Durée': task[1],
-                            'Sillon': train[1]
-                        })
+            # human tasks of the arrival trains then of the departure trains, start times read in bulk
+            taches = [(0, train, task) for train in self.trains_arr for task in self.arr_taches] + [(1, train, task) for train in self.trains_dep for task in self.dep_taches]
+            starts = np.concatenate([
+                self.solution.values_of('th_arr', [train + (int(task[0]),) for _, train, task in taches if train[0] == 'ARR']),
+                self.solution.values_of('th_dep', [train + (int(task[0]),) for _, train, task in taches if train[0] == 'DEP']),
+            ])
+            jours, horaires = minutes_to_date2(starts, self.j1)
+            jours = jours.tolist()
+            df_results_th = pd.DataFrame({
+                'Id tâche': [f'{self.machines[machine]}_{train[1]}_{jour}' for (machine, train, _), jour in zip(taches, jours)],
+                'Type de tâche': [task for _, _, task in taches],
+                'Jour': jours,
+                'Heure début': horaires,
+                'Durée': [task[1] for _, _, task in taches],
+                'Sillon': [train[1] for _, train, _ in taches],
+            })
 
             results_roulements = []
 
@@ -1032,26 +1529,24 @@ class ModelJalon3:
         
 
             # Process each roulement type
-            self.process_roulement('roulement_reception', self.envelope_used_REC, results_journees, 0)
-            self.process_roulement('roulement_formation', self.envelope_used_FOR, results_journees, 1)
-            self.process_roulement('roulement_depart', self.envelope_used_DEP, results_journees, 2)
-            self.process_roulement('roulement_reception_depart', self.envelope_used_REC_DEP, results_journees, 3)
-            self.process_roulement('roulement_formation_depart', self.envelope_used_FOR_DEP, results_journees, 4)
+            self.process_roulement('roulement_reception', 'envelope_used_REC', results_journees, 0)
+            self.process_roulement('roulement_formation', 'envelope_used_FOR', results_journees, 1)
+            self.process_roulement('roulement_depart', 'envelope_used_DEP', results_journees, 2)
+            self.process_roulement('roulement_reception_depart', 'envelope_used_REC_DEP', results_journees, 3)
+            self.process_roulement('roulement_formation_depart', 'envelope_used_FOR_DEP', results_journees, 4)
             
 
             # Process each envelope type
-            self.process_envelope_tasks('roulement_reception', self.trains_arr, self.arr_orders, self.envelope_taches_REC, 'th_arr', self.arr_taches_dict, results_roulements)
-            self.process_envelope_tasks('roulement_formation', self.trains_dep, self.dep_orders[:-1], self.envelope_taches_FOR, 'th_dep', self.dep_taches_dict, results_roulements)
-            self.process_envelope_tasks('roulement_depart', self.trains_dep, [4], self.envelope_taches_DEP, 'th_dep', self.dep_taches_dict, results_roulements)
-            self.process_envelope_tasks('roulement_reception_depart', self.trains, self.dep_orders, self.envelope_taches_REC_DEP, 'th_dep', self.dep_taches_dict, results_roulements)
-            self.process_envelope_tasks('roulement_formation_depart', self.trains_dep, self.dep_orders, self.envelope_taches_FOR_DEP, 'th_dep', self.dep_taches_dict, results_roulements)
+            self.process_envelope_tasks('roulement_reception', self.trains_arr, self.arr_orders, 'envelope_taches_REC', 'th_arr', self.arr_taches_dict, results_roulements)
+            self.process_envelope_tasks('roulement_formation', self.trains_dep, self.dep_orders[:-1], 'envelope_taches_FOR', 'th_dep', self.dep_taches_dict, results_roulements)
+            self.process_envelope_tasks('roulement_depart', self.trains_dep, [4], 'envelope_taches_DEP', 'th_dep', self.dep_taches_dict, results_roulements)
+            self.process_envelope_tasks('roulement_reception_depart', self.trains, self.dep_orders, 'envelope_taches_REC_DEP', 'th_dep', self.dep_taches_dict, results_roulements)
+            self.process_envelope_tasks('roulement_formation_depart', self.trains_dep, self.dep_orders, 'envelope_taches_FOR_DEP', 'th_dep', self.dep_taches_dict, results_roulements)
 
 
 
             # Create DataFrames from the results
-            df_results = pd.DataFrame(results)
             df_voies = pd.DataFrame(voies, index=self.chantiers)
-            df_results_th = pd.DataFrame(results_taches_humaines)
             df_results_roulements = pd.DataFrame(results_roulements)
 
             
@@ -1062,7 +1557,7 @@ class ModelJalon3:
 
             # Convert results_journees to DataFrame
             df_results_journees = pd.DataFrame.from_dict(results_journees)
-            df_results_journees.set_index(self.roulements_agents_df['Roulement'], inplace=True)
+            df_results_journees.set_index(pd.Index(self.roulements, name='Roulement'), inplace=True)
 
             # Add totals
             df_results_journees['Total'] = df_results_journees.sum(axis=1)
@@ -1070,26 +1565,28 @@ class ModelJalon3:
 
             sheet_names = ["Taches machine", "Voies utilisation", "Taches humaines", "Roulements", "Nb Journees activees"]
             file_name = Path(self.fichier).stem
-            results_file_path = f'{self.results_folder_save_path}/results_{file_name}.xlsx'
-
-            # Save DataFrames to different sheets in the same Excel file
-            with pd.ExcelWriter(f'{self.results_folder_save_path}/results_{file_name}.xlsx') as writer:
-                df_results.to_excel(writer, sheet_name=sheet_names[0], index=False)
-                df_voies.to_excel(writer, sheet_name=sheet_names[1], index=True)
-                df_results_th.to_excel(writer, sheet_name=sheet_names[2], index=False)
-                df_results_roulements.to_excel(writer, sheet_name=sheet_names[3], index=False)
-                df_results_journees.to_excel(writer, sheet_name=sheet_names[4], index=True)
+            results_file_path = f'{self.results_folder_save_path}/results_{file_name}'
+
+            # Save DataFrames as the sheets of the results file, in the RESULTS_FORMAT formats
+            written = write_results({
+                sheet_names[0]: (df_results, False),
+                sheet_names[1]: (df_voies, True),
+                sheet_names[2]: (df_results_th, False),
+                sheet_names[3]: (df_results_roulements, False),
+                sheet_names[4]: (df_results_journees, True),
+            }, results_file_path)
             
-            print(f'Results saved to {self.results_folder_save_path}/results_{file_name}.xlsx')
-            gantt_image_save_path = f"{self.results_folder_save_path}/gantt_{file_name}.png"
-            sankey_image_save_path = f"{self.results_folder_save_path}/sankey_{file_name}.png"
-            display_gantt(results_file_path, gantt_image_save_path)
-            display_sankey(self.fichier, sankey_image_save_path)
+            self.results_paths = written
+            print(f'Results saved to {", ".join(map(str, written))}')
+            self.results_file_path = results_file_path
+            if self.plot:
+                self.plot_results()
             return df_results
         else:
             print("No optimal solution found")
-            self.model.computeIIS()
-            self.model.write('outputs/models/infeasible.ilp')
+            if self.backend.name == 'gurobi':
+                self.model.computeIIS()
+                self.model.write('outputs/models/infeasible.ilp')
             return None
         
     def run_optimization(self):
@@ -1098,5 +1595,6 @@ class ModelJalon3:
         self.optimisation_time = tme.time()
         self.save_model()
         df_results = self.get_results()
+        self.save_telemetry()
         print(f'Time taken for: Data Loading = {self.data_loaded_time-self.start_program_time}s, Variables and Constraints = {self.constraint_variable_time-self.data_loaded_time}s, Optimisation = {self.optimisation_time-self.constraint_variable_time}s')
         return df_results
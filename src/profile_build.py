@@ -0,0 +1,33 @@
+import argparse
+from pathlib import Path
+import time as tme
+import pandas as pd
+from model_jalon3 import ModelJalon3
+from utils.utils_profile import estimate_build
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time, memory and model size of each builder of ModelJalon3')
+    parser.add_argument('--instance', default=None, help='FILE_INSTANCE in .env by default')
+    parser.add_argument('--build-mode', default=None, choices=['tupledict', 'matrix'], help='BUILD_MODE in .env by default')
+    parser.add_argument('--capacity-mode', default=None, choices=['slot', 'event'], help='CAPACITY_MODE in .env by default')
+    parser.add_argument('--dry-run', action='store_true', help='estimate the variables, constraints and nonzeros from the instance without building the model')
+    parser.add_argument('--output', default=None, help='csv of the profile, RESULTS_FOLDER_SAVE_PATH/build_profile_<instance>.csv by default')
+    args = parser.parse_args()
+
+    start = tme.time()
+    model = ModelJalon3(
+        args.build_mode, backend='gurobi', fichier=args.instance, capacity_mode=args.capacity_mode, profile=not args.dry_run, dry_run=args.dry_run
+    )
+    if model.cached:
+        raise SystemExit('The model was read from MODEL_CACHE_DIR, unset it to profile the build')
+    df = estimate_build(model) if args.dry_run else model.profiler.report()
+    if not args.dry_run:
+        model.model.update()
+        print(f'Built in {tme.time()-start:.1f}s: {model.model.NumVars} variables, {model.model.NumConstrs + model.model.NumQConstrs} constraints, {model.model.NumNZs + model.model.NumQCNZs} nonzeros')
+    totals = df[['time', 'variables', 'constraints', 'nonzeros']].sum(min_count=1)
+    df = pd.concat([df, pd.DataFrame([{'family': 'total', 'phase': '', **totals}])], ignore_index=True)
+    output = args.output or f'{model.results_folder_save_path}/build_profile_{Path(model.fichier).stem}{"_dry_run" if args.dry_run else ""}.csv'
+    df.to_csv(output, index=False)
+    print(df.to_string(index=False))
+    print(f'Build profile ({model.build_mode}, {model.capacity_mode}) saved to {output}')
@@ -0,0 +1,183 @@
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+import numpy as np
+import os
+import time as tme
+from model_jalon3 import ModelJalon3
+from utils.utils_backend import Solution
+from utils.utils_instance import load_instance
+from utils.utils_warmstart import SlotCounter
+from utils.utils_window import machine_windows
+
+# roulements of the envelope variables
+ENVELOPES = ['REC', 'FOR', 'DEP', 'REC_DEP', 'FOR_DEP']
+# variables of a committed train kept fixed in the next windows, and written to the results
+FIXED_VARIABLES = ['a', 'b', 'c', 'th_arr', 'th_dep'] + [f'envelope_taches_{name}' for name in ENVELOPES]
+DAY = 24 * 60
+
+
+def train_day(train):
+    """Day of the sillon of a train, the day it is assigned to a window"""
+    return train[2] // DAY
+
+
+def day_windows(first_day, last_day, window_days, overlap_days):
+    """Overlapping windows (start, end, commit_end) of days covering [first_day, last_day].
+    The trains of days [start, commit_end) are committed after solving [start, end), the overlap being solved again by the next window."""
+    step = max(1, window_days - overlap_days)
+    windows = []
+    start = first_day
+    while True:
+        end = min(start + window_days, last_day + 1)
+        if end > last_day:
+            windows.append((start, end, end))
+            return windows
+        windows.append((start, end, start + step))
+        start += step
+
+
+def used_envelopes(fixed):
+    """{roulement: envelope indexes} of the envelopes a committed task is assigned to"""
+    return {name: {key[0] for key, value in fixed[f'envelope_taches_{name}'].items() if value == 1} for name in ENVELOPES}
+
+
+def solve_block(windows, trains, trains_requis_dict, build_mode, time_limit):
+    """Solve a block of days window after window, fixing the trains committed by a window in the following ones, where
+    the envelopes of every committed train (in the window or not) are reused for free.
+    Returns the values of the committed variables ({variable name: {key: value}}), None if a window has no solution,
+    and the warm start report of each window."""
+    fixed = {name: {} for name in FIXED_VARIABLES}
+    committed = set()
+    reports = []
+    for start, end, commit_end in windows:
+        free = {train for train in trains if start <= train_day(train) < end and train not in committed}
+        # a departure needs its required arrivals, fixed if already committed
+        required = {train_arr for train in free if train[0] == 'DEP' for train_arr in trains_requis_dict.get(train, [])}
+        free |= required - committed
+        # committed trains still in the yard at the start of the window
+        kept = {train for train in committed if train[0] == 'DEP' and train[2] >= start * DAY}
+        kept |= {train_arr for train in kept for train_arr in trains_requis_dict.get(train, [])}
+        kept |= {train for train in committed if train[0] == 'ARR' and train[2] >= (start - 1) * DAY}
+        kept |= required & committed
+
+        print(f'Rolling horizon: days {start} to {end - 1}, {len(free)} trains to schedule, {len(kept)} fixed')
+        model = ModelJalon3(build_mode, trains=free | kept, fixed=fixed, used_envelopes=used_envelopes(fixed))
+        model.time_limit = time_limit
+        model.optimize()
+        reports.append(model.warm_start_report)
+        if not model.solution.found:
+            print(f'No solution found for days {start} to {end - 1}')
+            return None, reports
+
+        to_commit = {train for train in free if train_day(train) < commit_end}
+        for name in FIXED_VARIABLES:
+            offset = 1 if name.startswith('envelope') else 0
+            for key, value in model.solution.values[name].items():
+                if key[offset:offset+3] in to_commit:
+                    fixed[name][key] = round(value)
+        committed |= to_commit
+    return fixed, reports
+
+
+def merged_solution(model, fixed):
+    """Solution of the whole horizon from the committed values: the envelopes used are the ones of the committed
+    tasks, and the max voies are counted from the start times as the occupation rows of ModelJalon3 (model)."""
+    values = dict(fixed)
+    for name, envelopes in used_envelopes(fixed).items():
+        values[f'envelope_used_{name}'] = {i: 1 for i in envelopes}
+    a, b, c = fixed['a'], fixed['b'], fixed['c']
+    rec, for_, dep = (SlotCounter(len(model.minute_slots), None) for _ in range(3))
+    for train in model.trains_arr:
+        rec.add(train[2], a[train] + 15)
+        if train in model.arr_to_dep:
+            for_.add(a[train], b[model.arr_to_dep[train]])
+    for train in model.trains_dep:
+        for_.add(b[train], c[train] + 15)
+        dep.add(c[train], train[2])
+    for name, counter in [('rec_max', rec), ('for_max', for_), ('dep_max', dep)]:
+        values[name] = {None: int(counter.counts.max(initial=0))}
+    objective = sum(len(envelopes) for envelopes in used_envelopes(fixed).values())
+    return Solution('feasible', values, objective)
+
+
+class RollingHorizonJalon3:
+    """Solve ModelJalon3 on overlapping windows of days instead of the whole horizon at once.
+
+    Each window is solved with the constraints of ModelJalon3 on its trains only, the trains of its first days are then
+    fixed for the next windows. Blocks of days that share no train (no correspondance nor time window across the cut)
+    are independent and solved in parallel in a process pool. The committed values of the blocks are the solution whose
+    usual results (get_results) are written by a dry run ModelJalon3, without building the model of the whole horizon."""
+    def __init__(self, window_days=None, overlap_days=None, processes=None, build_mode=None):
+        """Initialize the decomposition, the parameters default to the ROLLING_* values in .env"""
+        self.start_program_time = tme.time()
+        load_dotenv(override=True)
+        self.fichier = os.getenv('FILE_INSTANCE')
+        self.build_mode = build_mode
+        self.window_days = window_days or int(os.getenv('ROLLING_WINDOW_DAYS', 2))
+        self.overlap_days = overlap_days if overlap_days is not None else int(os.getenv('ROLLING_OVERLAP_DAYS', 1))
+        self.processes = processes or int(os.getenv('ROLLING_PROCESSES', 1))
+        self.time_limit = int(os.getenv('ROLLING_TIME_LIMIT', 400))
+        self.window_slack = int(os.getenv('WINDOW_SLACK_MINUTES')) if os.getenv('WINDOW_SLACK_MINUTES') else None
+        self._load_data()
+        self._define_blocks()
+
+    def _load_data(self):
+        """Load the trains, their correspondances and the durations needed to find the time span of each train."""
+        instance = load_instance(self.fichier)
+        self.trains, self.trains_arr, self.trains_dep, self.minutes = instance.trains, instance.trains_arr, instance.trains_dep, instance.minutes
+        self.machines_durees = instance.machines_durees
+        self.trains_requis_dict = instance.trains_requis_dict
+        self.arr_durees, self.dep_durees = instance.tasks.arr_durees, instance.tasks.dep_durees
+
+    def _define_blocks(self):
+        """Split the days into blocks that can be solved independently, and each block into rolling windows."""
+        deb_windows, for_windows, _ = machine_windows(
+            self.trains_arr, self.trains_dep, self.trains_requis_dict, max(self.minutes), self.machines_durees[0],
+            sum(self.arr_durees[:-1]), sum(self.dep_durees[:2]), sum(self.dep_durees[2:]), self.window_slack
+        )
+        # time span of each train and of each departure with its required arrivals
+        spans = {train: (train[2], deb_windows[train][1] + max(self.machines_durees[0], self.arr_durees[-1])) for train in self.trains_arr}
+        spans |= {train: (for_windows[train][0], train[2]) for train in self.trains_dep}
+        for train, trains_requis in self.trains_requis_dict.items():
+            group = [spans[train]] + [spans[train_arr] for train_arr in trains_requis]
+            spans[train] = (min(lo for lo, _ in group), max(hi for _, hi in group))
+
+        days = sorted({train_day(train) for train in self.trains})
+        cuts = [day for day in range(days[0] + 1, days[-1] + 1) if not any(lo < day * DAY < hi for lo, hi in spans.values())]
+        bounds = [days[0]] + cuts + [days[-1] + 1]
+        self.blocks = []
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            trains = [train for train in self.trains if first <= train_day(train) < last]
+            if trains:
+                self.blocks.append((day_windows(first, last - 1, self.window_days, self.overlap_days), trains))
+        print(f'Rolling horizon: {len(self.blocks)} independent blocks, {sum(len(windows) for windows, _ in self.blocks)} windows')
+
+    def run_optimization(self):
+        """Solve the blocks (in parallel if there are several) and write the results of the committed values."""
+        args = [(windows, trains, self.trains_requis_dict, self.build_mode, self.time_limit) for windows, trains in self.blocks]
+        if self.processes > 1 and len(args) > 1:
+            with ProcessPoolExecutor(max_workers=self.processes) as pool:
+                solutions = list(pool.map(solve_block, *zip(*args)))
+        else:
+            solutions = [solve_block(*arg) for arg in args]
+        self.optimisation_time = tme.time()
+        solutions, reports = zip(*solutions)
+        reports = [report for block_reports in reports for report in block_reports]
+        accepted = [report for report in reports if report.get('accepted')]
+        incumbents = [report['first_incumbent'] for report in reports if report.get('first_incumbent') is not None]
+        print(f'Warm start accepted in {len(accepted)}/{len(reports)} windows, first incumbent after {np.mean(incumbents) if incumbents else None}s on average')
+        if any(solution is None for solution in solutions):
+            print("No solution found for at least one window")
+            return None
+
+        fixed = {name: {} for name in FIXED_VARIABLES}
+        for solution in solutions:
+            for name, values in solution.items():
+                fixed[name].update(values)
+        # time windows and data of the whole instance only, for get_results
+        model = ModelJalon3(self.build_mode, dry_run=True)
+        model.solution = merged_solution(model, fixed)
+        print(f'Rolling horizon: {model.solution.objective} envelopes used')
+        df_results = model.get_results()
+        print(f'Rolling horizon time: Windows = {self.optimisation_time-self.start_program_time}s, Merge = {tme.time()-self.optimisation_time}s')
+        return df_results
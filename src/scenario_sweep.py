@@ -0,0 +1,179 @@
+import argparse
+import json
+import time as tme
+from pathlib import Path
+from gurobipy import GRB
+import pandas as pd
+from model_jalon3 import ModelJalon3
+
+# binaries of the envelopes used of each roulement, as read by get_results
+ENVELOPE_USED = {
+    'roulement_reception': 'envelope_used_REC', 'roulement_formation': 'envelope_used_FOR', 'roulement_depart': 'envelope_used_DEP',
+    'roulement_reception_depart': 'envelope_used_REC_DEP', 'roulement_formation_depart': 'envelope_used_FOR_DEP',
+}
+# name of the max voies rows and of the max voies used variable of each chantier, in the order of max_voies
+VOIES = [('rec', 'rec_max'), ('for', 'for_max'), ('dep', 'dep_max')]
+
+
+class ScenarioSweep:
+    """What-if scenarios solved on one built ModelJalon3, instead of loading, building and solving the instance for each.
+
+    A scenario is a dict of changes to the instance, applied in place to the built gurobipy model:
+    - max_voies {chantier: voies}: right hand side of the max voies rows (constraint 9), shifted by the change of voies
+    - nombre_agents {roulement: agents}: coefficients of the envelopes of the roulement in the max agents rows (24.2),
+      the agents of a slot being linear in the agents of the roulement
+    - unavailability {machine: [(start, end)]}: extra unavailable periods (minutes) of DEB, FOR or DEG, a binary and the
+      two rows of constraint 1.1 for each train whose window meets the period, removed before the next scenario
+    - time_limit: TimeLimit of the scenario, the time_limit of the sweep if unset
+    Every scenario starts from the instance values, and is solved with the previous solution as MIP start."""
+
+    def __init__(self, model=None, time_limit=None):
+        """model: built ModelJalon3 (gurobi backend), ModelJalon3() if None. time_limit: default TimeLimit, the one of the model if None"""
+        self.model = model or ModelJalon3()
+        if self.model.backend.name != 'gurobi':
+            raise ValueError(f'Scenarios change the gurobipy model in place, backend gurobi needed instead of {self.model.backend.name}')
+        self.time_limit = time_limit if time_limit is not None else self.model.time_limit
+        self.agents = dict(zip(self.model.roulements, [int(agents) for agents in self.model.nombre_agents]))
+        self.start = None
+        self.added = []
+
+        model = self.model.model
+        model.update()
+        self.variables = model.getVars()
+        constrs = model.getConstrs()
+        names = model.getAttr('ConstrName', constrs)
+        # max voies rows of each chantier (slot, matrix and event builds) with their right hand side in the built model
+        self.voies_rows = []
+        for name, _ in VOIES:
+            prefixes = (f'max_voies_constraint_{name}', f'max_voies_event_{name}_')
+            rows = [constr for constr, constr_name in zip(constrs, names) if constr_name.startswith(prefixes)]
+            self.voies_rows.append((rows, model.getAttr('RHS', rows)))
+        # coefficients of the envelopes of each roulement in the max agents rows
+        agent_rows = {constr.index for constr, constr_name in zip(constrs, names) if constr_name.startswith('max_agents')}
+        self.agent_coefs = {}
+        for roulement, variables in self._envelope_columns().items():
+            coefs = []
+            for var in variables:
+                column = model.getCol(var)
+                coefs += [(column.getConstr(i), var, column.getCoeff(i)) for i in range(column.size()) if column.getConstr(i).index in agent_rows]
+            self.agent_coefs[roulement] = coefs
+
+    def _envelope_columns(self):
+        """{roulement: variables multiplied by the agents of the roulement in the max agents rows}"""
+        if self.model.capacity_mode == 'event':
+            if not hasattr(self.model, 'agent_covers'):
+                raise ValueError('The envelope covers of the event build are not kept in the model cache, unset MODEL_CACHE_DIR')
+            return {
+                roulement: [cover for covers in self.model.agent_covers.values() for key, cover in covers.cover.items() if f'roulement_{key[-2]}' == roulement]
+                for roulement in ENVELOPE_USED
+            }
+        return {roulement: list(getattr(self.model, name.replace('used', 'active')).values()) for roulement, name in ENVELOPE_USED.items()}
+
+    def _apply(self, scenario):
+        """Change the built model from the instance values to the ones of scenario"""
+        model = self.model.model
+        unknown = set(scenario) - {'max_voies', 'nombre_agents', 'unavailability', 'time_limit'}
+        if unknown:
+            raise ValueError(f'Unknown scenario changes {sorted(unknown)}')
+
+        max_voies = scenario.get('max_voies', {})
+        if set(max_voies) - set(self.model.chantiers):
+            raise ValueError(f'Unknown chantiers {sorted(set(max_voies) - set(self.model.chantiers))}, expected {self.model.chantiers}')
+        for chantier, base, (rows, rhs) in zip(self.model.chantiers, self.model.max_voies, self.voies_rows):
+            shift = max_voies.get(chantier, base) - base
+            model.setAttr('RHS', rows, [value + shift for value in rhs])
+
+        nombre_agents = scenario.get('nombre_agents', {})
+        if set(nombre_agents) - set(self.agent_coefs):
+            raise ValueError(f'Unknown roulements {sorted(set(nombre_agents) - set(self.agent_coefs))}, expected {list(self.agent_coefs)}')
+        for roulement, coefs in self.agent_coefs.items():
+            base = self.agents[roulement]
+            agents = nombre_agents.get(roulement, base)
+            if base == 0:
+                if agents != 0:
+                    raise ValueError(f'{roulement} has no agents in the instance, its envelopes are not in the max agents rows')
+                continue
+            for constr, var, coef in coefs:
+                model.chgCoeff(constr, var, coef * agents / base)
+
+        starts = dict(zip(self.model.machines, [self.model.a, self.model.b, self.model.c]))
+        epsilon = self.model.epsilon
+        for machine, periods in scenario.get('unavailability', {}).items():
+            if machine not in starts:
+                raise ValueError(f'Unknown machine {machine}, expected one of {self.model.machines}')
+            for start_time, end_time in periods:
+                for train, start in starts[machine].items():
+                    lo, hi = start.LB, start.UB
+                    if hi <= start_time - epsilon or lo >= end_time + epsilon:
+                        continue
+                    # 1 if the machine starts the train before the period, constraint 1.1
+                    before = model.addVar(vtype=GRB.BINARY, name=f'scenario_{machine}[{train},{start_time}]')
+                    self.added += [
+                        before,
+                        model.addConstr(start <= start_time - epsilon + max(hi - start_time + epsilon, 0) * (1 - before)),
+                        model.addConstr(start >= end_time + epsilon - max(end_time + epsilon - lo, 0) * before),
+                    ]
+
+    def _revert(self):
+        """Remove the variables and rows added by the last scenario, the right hand sides and coefficients being set by every _apply"""
+        if self.added:
+            self.model.model.remove(self.added)
+            self.added = []
+
+    def solve(self, name, scenario):
+        """Apply and solve one scenario, warm started from the previous solution. Returns its row of the comparison table."""
+        model = self.model.model
+        self._revert()
+        self._apply(scenario)
+        if self.start is not None:
+            model.setAttr('Start', self.variables, self.start)
+        solution = self.model.backend.solve(self.model, scenario.get('time_limit', self.time_limit))
+        self.model.solution = solution
+        if solution.found:
+            self.start = model.getAttr('X', self.variables)
+
+        row = {
+            'scenario': name, 'status': solution.status, 'objective': solution.objective, 'solve_time': solution.runtime,
+            'gap': model.MIPGap if solution.found else None, 'unavailability_binaries': len(self.added) // 3,
+        }
+        max_voies = scenario.get('max_voies', {})
+        for chantier, base, (_, max_var) in zip(self.model.chantiers, self.model.max_voies, VOIES):
+            row[f'max_voies_{chantier}'] = max_voies.get(chantier, base)
+            row[f'voies_used_{chantier}'] = solution.value(max_var) if solution.found else None
+        nombre_agents = scenario.get('nombre_agents', {})
+        for roulement, used in ENVELOPE_USED.items():
+            row[f'agents_{roulement}'] = nombre_agents.get(roulement, self.agents[roulement])
+            row[f'envelopes_{roulement}'] = sum(solution.values[used].values()) if solution.found else None
+        return row
+
+    def run(self, scenarios):
+        """Solve the scenarios ({name: scenario}) one after the other, the instance itself first ('base') if not given.
+        Returns the comparison table, the model being left as built."""
+        if 'base' not in scenarios:
+            scenarios = {'base': {}} | scenarios
+        rows = []
+        for name, scenario in scenarios.items():
+            print(f'Scenario {name}: {scenario}')
+            rows.append(self.solve(name, scenario))
+        self._revert()
+        self._apply({})
+        return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve what-if scenarios of the instance in .env on one built ModelJalon3')
+    parser.add_argument('scenarios', help='json file of {name: scenario}, see ScenarioSweep')
+    parser.add_argument('--time-limit', type=float, default=None, help='TimeLimit of the scenarios without time_limit, the one of ModelJalon3 by default')
+    parser.add_argument('--output', default=None, help='comparison csv, RESULTS_FOLDER_SAVE_PATH/scenarios_<instance>.csv by default')
+    args = parser.parse_args()
+
+    with open(args.scenarios) as file:
+        scenarios = json.load(file)
+    start = tme.time()
+    sweep = ScenarioSweep(time_limit=args.time_limit)
+    built = tme.time()
+    df = sweep.run(scenarios)
+    output = args.output or f"{sweep.model.results_folder_save_path}/scenarios_{Path(sweep.model.fichier).stem}.csv"
+    df.to_csv(output, index=False)
+    print(df.to_string(index=False))
+    print(f'Time taken for: Build = {built-start}s, {len(df)} scenarios = {tme.time()-built}s, comparison saved to {output}')
@@ -3,6 +3,7 @@ import itertools
 
 import plotly.express as px
 import pandas as pd
+from utils.utils_results import read_results
 # from display_track import displays_track_occupation
 
 class ResultColumnNames:
@@ -21,7 +22,7 @@ def display_gantt(results_file_path, gantt_image_save_path, save_image=True):
     MACHINE_TASKS_SHEET = "Taches machine"
     RESULTS_FILE_PATH = results_file_path
     
-    result_df = pd.read_excel(RESULTS_FILE_PATH, sheet_name=MACHINE_TASKS_SHEET)
+    result_df = read_results(RESULTS_FILE_PATH, MACHINE_TASKS_SHEET)
     result_df[ResultColumnNames.TASK_DATE] = pd.to_datetime(result_df[ResultColumnNames.TASK_DATE],  format="%d/%m/%Y")
     result_df[ResultColumnNames.TASK_HOUR] = pd.to_datetime(result_df[ResultColumnNames.TASK_HOUR], format="%H:%M").dt.time
     dummy_date = datetime.date(2000, 1, 1)
@@ -5,6 +5,7 @@ import os
 import plotly.express as px
 import pandas as pd
 from dotenv import load_dotenv
+from utils_results import read_results
 
 # ORDERED_MACHINES = ["Debranchement", "Formation", "Degarage"]
 ORDERED_MACHINES = [
@@ -33,7 +34,7 @@ if __name__ == "__main__":
     load_dotenv(override=True)
     RESULTS_FILE_PATH = os.getenv("RESULTS_FILE_PATH")
 
-    result_df = pd.read_excel(RESULTS_FILE_PATH, sheet_name=MACHINE_TASKS_SHEET)
+    result_df = read_results(RESULTS_FILE_PATH, MACHINE_TASKS_SHEET)
     # Ensure that date columns are properly parsed
     result_df[ResultColumnNames.TASK_DATE] = pd.to_datetime(result_df[ResultColumnNames.TASK_DATE], format="%d/%m/%Y")
     result_df[ResultColumnNames.TASK_HOUR] = pd.to_datetime(result_df[ResultColumnNames.TASK_HOUR], format="%H:%M").dt.time
@@ -0,0 +1,230 @@
+from pathlib import Path
+import numpy as np
+from gurobipy import GRB, Var
+from utils.utils_telemetry import chain_callbacks
+
+
+class Solution:
+    """Values of the variables needed by the results, whatever the backend that solved the model.
+
+    status: 'optimal', 'feasible' (limit reached with a solution), 'infeasible' or 'unknown' (no solution found)
+    values: {variable name: {key: value}}, key None for a single variable, as the variables of the gurobipy model"""
+
+    def __init__(self, status, values=None, objective=None, runtime=None):
+        self.status = status
+        self.values = values or {}
+        self.objective = objective
+        self.runtime = runtime
+
+    @property
+    def found(self):
+        return self.status in ('optimal', 'feasible')
+
+    def value(self, name, key=None):
+        """Value of variable name[key], 0 for a key the backend did not create (binaries pruned by CP-SAT)"""
+        return self.values[name].get(key, 0)
+
+    def values_of(self, name, keys):
+        """Array of the values of name[key] for each key of keys, 0 for the keys the backend did not create"""
+        values = self.values[name]
+        return np.fromiter((values.get(key, 0) for key in keys), dtype=float, count=len(keys))
+
+    def nonzero(self, name):
+        """Keys of the binaries of name equal to 1, in the order of the variables"""
+        return [key for key, value in self.values[name].items() if value > 0.5]
+
+
+def gurobi_values(variables, x):
+    """{name: {key: value}} of the variables (tupledict or Var by name), x giving the value of each column of the model"""
+    x = np.asarray(x, dtype=float)
+    values = {}
+    for name, variable in variables.items():
+        if isinstance(variable, Var):
+            values[name] = {None: float(x[variable.index])}
+        else:
+            # one gather of the columns of the tupledict instead of one lookup per key
+            index = np.fromiter((var.index for var in variable.values()), dtype=np.int64, count=len(variable))
+            values[name] = dict(zip(variable.keys(), x[index].tolist()))
+    return values
+
+
+class GurobiBackend:
+    """Solve the gurobipy model with Gurobi (license needed for the full size instances)."""
+    name = 'gurobi'
+    builds_model = True
+
+    def solve(self, model, time_limit=None, callback=None):
+        """Optimize model.model, callback being passed to Gurobi with the SolverTelemetry of the model if it has one"""
+        if time_limit is not None:
+            model.model.setParam('TimeLimit', time_limit)
+        telemetry = getattr(model, 'telemetry', None)
+        if telemetry is not None:
+            telemetry.start()
+            callback = chain_callbacks(callback, telemetry)
+        model.model.optimize(callback)
+        if telemetry is not None:
+            telemetry.finish(model.model)
+        status = model.model.status
+        if model.model.SolCount == 0:
+            return Solution('infeasible' if status in (GRB.INFEASIBLE, GRB.INF_OR_UNBD) else 'unknown', runtime=model.model.Runtime)
+        x = model.model.getAttr('X', model.model.getVars())
+        return Solution(
+            'optimal' if status == GRB.OPTIMAL else 'feasible', gurobi_values(model.solution_variables(), x),
+            model.model.ObjVal, model.model.Runtime
+        )
+
+    def write(self, model, path):
+        model.model.write(path)
+        return path
+
+
+class HighsBackend:
+    """Solve the gurobipy model with HiGHS, the open-source MIP solver (highspy, no license).
+
+    The model is read from gurobipy (getA, bounds, types) and passed to HiGHS as is, except the quadratic occupation
+    rows (start time * binary): HiGHS only solves linear models, each product x*z of a bounded variable x and a binary z
+    is replaced by a new variable w with the exact linearisation L*z <= w <= U*z, x-U*(1-z) <= w <= x-L*(1-z)."""
+    name = 'highs'
+    builds_model = True
+
+    def solve(self, model, time_limit=None, callback=None):
+        """Solve model.model with HiGHS, callback (Gurobi only) is ignored"""
+        import highspy
+
+        inf = highspy.kHighsInf
+        gmodel = model.model
+        gmodel.update()
+        variables = gmodel.getVars()
+        lb = np.array(gmodel.getAttr('LB', variables), dtype=float)
+        ub = np.array(gmodel.getAttr('UB', variables), dtype=float)
+        vtype = np.array(gmodel.getAttr('VType', variables))
+        cost = np.array(gmodel.getAttr('Obj', variables), dtype=float)
+        lb[lb <= -GRB.INFINITY] = -inf
+        ub[ub >= GRB.INFINITY] = inf
+
+        # linear rows, row bounds from the sense
+        A = gmodel.getA().tocsr()
+        constrs = gmodel.getConstrs()
+        rhs = np.array(gmodel.getAttr('RHS', constrs), dtype=float)
+        sense = np.array(gmodel.getAttr('Sense', constrs))
+        row_lower = np.where(sense == '<', -inf, rhs)
+        row_upper = np.where(sense == '>', inf, rhs)
+        rows = [(A.indptr, A.indices, A.data, row_lower, row_upper)]
+
+        # quadratic rows, linearised
+        products = {}
+        new_bounds = []
+        starts, indices, data, lower, upper = [0], [], [], [], []
+
+        def add_row(row, row_lo, row_hi):
+            indices.extend(row)
+            data.extend(row.values())
+            starts.append(len(indices))
+            lower.append(row_lo)
+            upper.append(row_hi)
+
+        for qconstr in gmodel.getQConstrs():
+            quad = gmodel.getQCRow(qconstr)
+            linear = quad.getLinExpr()
+            row = {}
+            for i in range(linear.size()):
+                j = linear.getVar(i).index
+                row[j] = row.get(j, 0) + linear.getCoeff(i)
+            for i in range(quad.size()):
+                x, z = quad.getVar1(i).index, quad.getVar2(i).index
+                if vtype[x] == GRB.BINARY:
+                    x, z = z, x
+                if vtype[z] != GRB.BINARY or not np.isfinite(lb[x]) or not np.isfinite(ub[x]):
+                    raise ValueError(f'HiGHS backend: product of {variables[x].VarName} and {variables[z].VarName} can not be linearised')
+                if (x, z) not in products:
+                    w = len(lb) + len(new_bounds)
+                    products[x, z] = w
+                    new_bounds.append((min(0, lb[x]), max(0, ub[x])))
+                    add_row({w: 1, z: -lb[x]}, 0, inf)
+                    add_row({w: 1, z: -ub[x]}, -inf, 0)
+                    add_row({w: 1, x: -1, z: -lb[x]}, -inf, -lb[x])
+                    add_row({w: 1, x: -1, z: -ub[x]}, -ub[x], inf)
+                w = products[x, z]
+                row[w] = row.get(w, 0) + quad.getCoeff(i)
+            add_row(row, -inf if qconstr.QCSense == '<' else qconstr.QCRHS, inf if qconstr.QCSense == '>' else qconstr.QCRHS)
+        if len(starts) > 1:
+            rows.append((np.array(starts), np.array(indices), np.array(data), np.array(lower), np.array(upper)))
+
+        num_col = len(lb) + len(new_bounds)
+        lp = highspy.HighsLp()
+        lp.num_col_ = num_col
+        lp.num_row_ = sum(len(row[3]) for row in rows)
+        lp.col_cost_ = np.concatenate([cost, np.zeros(len(new_bounds))])
+        lp.col_lower_ = np.concatenate([lb, [lo for lo, _ in new_bounds]])
+        lp.col_upper_ = np.concatenate([ub, [hi for _, hi in new_bounds]])
+        lp.row_lower_ = np.concatenate([row[3] for row in rows])
+        lp.row_upper_ = np.concatenate([row[4] for row in rows])
+        lp.offset_ = gmodel.ObjCon
+        lp.sense_ = highspy.ObjSense.kMaximize if gmodel.ModelSense == GRB.MAXIMIZE else highspy.ObjSense.kMinimize
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        lp.a_matrix_.num_col_ = num_col
+        lp.a_matrix_.num_row_ = lp.num_row_
+        offset = 0
+        matrix_starts, matrix_indices, matrix_values = [], [], []
+        for row_starts, row_indices, row_values, _, _ in rows:
+            matrix_starts.append(np.asarray(row_starts[:-1]) + offset)
+            matrix_indices.append(row_indices)
+            matrix_values.append(row_values)
+            offset += len(row_indices)
+        lp.a_matrix_.start_ = np.concatenate(matrix_starts + [[offset]]).astype(np.int32)
+        lp.a_matrix_.index_ = np.concatenate(matrix_indices).astype(np.int32)
+        lp.a_matrix_.value_ = np.concatenate(matrix_values).astype(float)
+        integer = np.concatenate([vtype != GRB.CONTINUOUS, np.zeros(len(new_bounds), dtype=bool)])
+        lp.integrality_ = [highspy.HighsVarType.kInteger if is_integer else highspy.HighsVarType.kContinuous for is_integer in integer]
+
+        highs = highspy.Highs()
+        highs.setOptionValue('output_flag', False)
+        if time_limit is not None:
+            highs.setOptionValue('time_limit', float(time_limit))
+        highs.passModel(lp)
+        highs.run()
+        model_status = highs.getModelStatus()
+        info = highs.getInfo()
+        runtime = highs.getRunTime()
+        if model_status == highspy.HighsModelStatus.kInfeasible:
+            return Solution('infeasible', runtime=runtime)
+        if info.primal_solution_status != 2:
+            return Solution('unknown', runtime=runtime)
+        x = np.round(highs.getSolution().col_value).tolist()
+        return Solution(
+            'optimal' if model_status == highspy.HighsModelStatus.kOptimal else 'feasible',
+            gurobi_values(model.solution_variables(), x), info.objective_function_value, runtime
+        )
+
+    def write(self, model, path):
+        model.model.write(path)
+        return path
+
+
+class CpSatBackend:
+    """Solve the scheduling problem of the model with OR-Tools CP-SAT (no license), see utils_cpsat.
+    The gurobipy rows are not built, CP-SAT has its own formulation built from the data and time windows of the model."""
+    name = 'cpsat'
+    builds_model = False
+
+    def solve(self, model, time_limit=None, callback=None):
+        """Build and solve the CP-SAT model of model, callback (Gurobi only) is ignored"""
+        from utils.utils_cpsat import CpSatModel
+
+        model.cpsat = CpSatModel(model)
+        return model.cpsat.solve(time_limit)
+
+    def write(self, model, path):
+        path = str(Path(path).with_suffix('.pb.txt'))
+        model.cpsat.model.ExportToFile(path)
+        return path
+
+
+BACKENDS = {'gurobi': GurobiBackend, 'highs': HighsBackend, 'cpsat': CpSatBackend}
+
+
+def get_backend(name):
+    """Backend from its name in SOLVER_BACKEND: 'gurobi', 'highs' or 'cpsat'"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown solver backend {name}, expected one of {list(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,27 @@
+import numpy as np
+
+
+class BigM:
+    """Tight big-M of each disjunctive row, computed from the bounds of the variables of the row instead of one global M.
+
+    For a row `lhs <= rhs + M*(1-z)` (or `lhs <= rhs + M*z`), the smallest valid M is the largest violation max(lhs - rhs)
+    over the bounds (time windows) of its variables, 0 if the row always holds. The values used are kept per constraint
+    family for report()."""
+
+    def __init__(self, default):
+        self.default = default
+        self.stats = {}
+
+    def __call__(self, family, violation):
+        """M of the rows of a family whose largest violation is `violation`, a number or an array of them (one per row)"""
+        m = np.maximum(np.asarray(violation, dtype=float), 0)
+        if m.size:
+            count, total, low, high = self.stats.get(family, (0, 0.0, np.inf, -np.inf))
+            self.stats[family] = (count + m.size, total + m.sum(), min(low, m.min()), max(high, m.max()))
+        return m if m.ndim else float(m)
+
+    def report(self):
+        """Print the big-M used per constraint family, compared to the global M"""
+        print(f'Big-M per constraint family (global M = {self.default}):')
+        for family, (count, total, low, high) in self.stats.items():
+            print(f'    {family}: {count} rows, min {low:g}, mean {total / count:.1f}, max {high:g}')
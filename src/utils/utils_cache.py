@@ -0,0 +1,66 @@
+import hashlib
+import pickle
+from pathlib import Path
+from gurobipy import Var, tupledict, read
+from utils.utils_instance import bundle_path
+
+
+def model_variables(model):
+    """Variables of a model class, the attributes holding a Var or a tupledict of Vars"""
+    return {name: value for name, value in vars(model).items() if isinstance(value, (Var, tupledict))}
+
+
+class ModelCache:
+    """Built gurobipy models saved in folder, keyed by a hash of everything they are built from.
+
+    The key hashes the bytes of the instance file, the settings changing the model (.env) and the source files of the
+    model code, so any change gives a new key and a stale model is never read back. A model is stored as a compressed
+    MPS file (<key>.mps.bz2) and the keys of its variables as a pickle (<key>.pkl), {attribute: column index} for a
+    Var and {attribute: {key: column index}} for a tupledict, to rebuild the attributes read by get_results."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def key(self, fichier, settings, sources):
+        """sha256 of the instance file (the files of its compiled bundle if it was only compiled), the settings ({name: value}) and the source files"""
+        digest = hashlib.sha256()
+        instance_files = [Path(fichier)] if Path(fichier).exists() else sorted(bundle_path(fichier).iterdir())
+        for instance_file in instance_files:
+            digest.update(instance_file.read_bytes())
+        digest.update(repr(sorted(settings.items())).encode())
+        for source in sources:
+            digest.update(Path(source).read_bytes())
+        return digest.hexdigest()
+
+    def paths(self, key):
+        return self.folder / f'{key}.mps.bz2', self.folder / f'{key}.pkl'
+
+    def load(self, key, env=None):
+        """(gurobipy model, {attribute: Var or tupledict}) stored under key, None if not cached, read in env if given"""
+        model_path, variables_path = self.paths(key)
+        if not model_path.exists() or not variables_path.exists():
+            return None
+        with open(variables_path, 'rb') as file:
+            indices = pickle.load(file)
+        model = read(str(model_path), env)
+        columns = model.getVars()
+        variables = {
+            name: columns[index] if isinstance(index, int) else tupledict({var_key: columns[i] for var_key, i in index.items()})
+            for name, index in indices.items()
+        }
+        return model, variables
+
+    def save(self, key, model, variables):
+        """Store model and the column indices of variables ({attribute: Var or tupledict}) under key"""
+        model_path, variables_path = self.paths(key)
+        model.update()
+        indices = {
+            name: value.index if isinstance(value, Var) else {var_key: var.index for var_key, var in value.items()}
+            for name, value in variables.items()
+        }
+        model.write(str(model_path))
+        # the metadata is written last, a model without it is not read back
+        with open(variables_path, 'wb') as file:
+            pickle.dump(indices, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return model_path
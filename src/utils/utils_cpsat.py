@@ -0,0 +1,227 @@
+import math
+from ortools.sat.python import cp_model
+from utils.utils_backend import Solution
+from utils.utils_warmstart import is_free, SlotCounter
+from utils.utils_window import unavailable_intervals
+
+# chantier of the agents: the tasks (train type, orders) it holds and the roulements whose agents work in it
+AGENT_CHANTIERS = {
+    'REC': (['ARR'], lambda model: model.arr_orders, ['reception', 'reception_depart']),
+    'FOR': (['DEP'], lambda model: model.dep_orders[:-1], ['formation', 'formation_depart']),
+    'DEP': (['DEP'], lambda model: model.dep_orders[-1:], ['depart', 'reception_depart', 'formation_depart']),
+}
+ENVELOPE_NAMES = {
+    'reception': 'REC', 'formation': 'FOR', 'depart': 'DEP', 'reception_depart': 'REC_DEP', 'formation_depart': 'FOR_DEP',
+}
+
+
+class CpSatModel:
+    """CP-SAT formulation of ModelJalon1/2/3 (model.jalon), on the data and time windows computed by the model.
+
+    Start times are integer variables whose domain is the 15 minutes grid of their window without the starts meeting an
+    unavailable period of their machine or chantier (constraints 1.x and 7). Each machine task is an interval of
+    14+epsilon minutes and each machine a NoOverlap of its intervals (constraint 2). The stay of a train in a chantier
+    is an interval over the slots the occupation rows 8.x force to 1, max voies is a Cumulative (9, 10).
+    For jalon 3 the human tasks are intervals of their duration, each assigned to one envelope of its roulements (21.x).
+    The agents of a chantier are a Cumulative of the tasks in progress, whose capacity at each slot is the max_agents of
+    the roulements with an envelope used (24.x), then the number of envelopes used is minimised (26)."""
+
+    def __init__(self, model):
+        self.source = model
+        self.model = cp_model.CpModel()
+        self.intervals = {
+            resource: unavailable_intervals(periods)
+            for resource, periods in (model.unavailable_periods | model.unavailable_periods_chantiers).items()
+        }
+        self.nb_slots = len(model.minute_slots)
+        self.horizon = max(max(model.minutes), 15 * self.nb_slots) + 15
+        self._define_machines()
+        if model.jalon >= 2:
+            self._define_voies()
+        if model.jalon == 3:
+            self._define_tasks()
+            self._define_envelopes()
+        print('CP-SAT model defined')
+
+    def _start_var(self, name, window, resources, duration=0):
+        """Start time on the 15 minutes grid of window, free of the unavailable periods of resources"""
+        lo, hi = window
+        values = [
+            start for start in range(15 * math.ceil(lo / 15), hi + 1, 15)
+            if all(is_free(start, self.intervals.get(resource, []), duration, self.source.epsilon) for resource in resources)
+        ]
+        if not values:
+            print(f'No start possible for {name}')
+            self.model.AddBoolOr([])
+            values = [lo]
+        return self.model.NewIntVarFromDomain(cp_model.Domain.FromValues(values), name)
+
+    def _interval(self, start, end, name):
+        """Interval [start, end) of variable size"""
+        size = self.model.NewIntVar(0, self.horizon, f'{name}_size')
+        return self.model.NewIntervalVar(start, size, end, name)
+
+    def _define_machines(self):
+        """Constraints 1.1, 1.2 and 7 (domains), 2 (NoOverlap), 3 and 4 (windows), 5 and 6."""
+        model = self.source
+        self.a = {train: self._start_var(f'a{train}', model.deb_windows[train], ['DEB', 'WPY_REC']) for train in model.trains_arr}
+        self.b = {train: self._start_var(f'b{train}', model.for_windows[train], ['FOR', 'WPY_FOR']) for train in model.trains_dep}
+        self.c = {train: self._start_var(f'c{train}', model.deg_windows[train], ['DEG', 'WPY_FOR']) for train in model.trains_dep}
+        for machine, starts in [('DEB', self.a), ('FOR', self.b), ('DEG', self.c)]:
+            if machine in model.machines:
+                self.model.AddNoOverlap([
+                    self.model.NewFixedSizeIntervalVar(start, 14 + model.epsilon, f'{machine}{train}') for train, start in starts.items()
+                ])
+        for train_dep, trains_requis in model.trains_requis_dict.items():
+            for train_arr in trains_requis:
+                self.model.Add(self.b[train_dep] >= self.a[train_arr] + int(model.machines_durees[0]))
+        for train in model.trains_dep:
+            self.model.Add(self.c[train] >= self.b[train] + 165)
+
+    def _define_voies(self):
+        """Constraints 9 and 10: a train occupies the slots strictly between the start and end of its stay in a chantier."""
+        model = self.source
+        rec = [self._interval(15 * (train[2] // 15 + 1), self.a[train] + 15, f'rec{train}') for train in model.trains_arr]
+        for_ = [self._interval(self.b[train] + 15, self.c[train] + 15, f'for{train}') for train in model.trains_dep]
+        dep = [self._interval(self.c[train] + 15, 15 * math.ceil(train[2] / 15), f'dep{train}') for train in model.trains_dep]
+        for intervals, capacity in zip([rec, for_, dep], model.max_voies):
+            self.model.AddCumulative(intervals, [1] * len(intervals), capacity)
+        if model.jalon == 2:
+            # the arrival trains are counted in chantier FOR from arrival to the end of DEB, objective of jalon 2
+            self.for_max = self.model.NewIntVar(0, len(model.trains), 'for_max')
+            self.model.AddCumulative(rec + for_, [1] * len(rec + for_), self.for_max)
+            self.model.Minimize(self.for_max)
+
+    def _define_tasks(self):
+        """Constraints 1.2 (domains) and 11 to 20: chained human tasks, DEB/FOR/DEG done with the machine."""
+        model = self.source
+        self.th_arr = {
+            key: self._start_var(f'th_arr{key}', window, ['WPY_REC'], model.arr_durees[key[3]-1])
+            for key, window in model.th_arr_windows.items()
+        }
+        self.th_dep = {
+            key: self._start_var(f'th_dep{key}', window, ['WPY_DEP' if key[3] == model.dep_orders[-1] else 'WPY_FOR'], model.dep_durees[key[3]-1])
+            for key, window in model.th_dep_windows.items()
+        }
+        for train in model.trains_arr:
+            th = [self.th_arr[train + (int(order),)] for order in model.arr_orders]
+            for (first, second), duree in zip(zip(th, th[1:]), model.arr_durees):
+                self.model.Add(second >= first + int(duree))
+            self.model.Add(th[0] >= train[2])
+            self.model.Add(th[-1] == self.a[train])
+        for train in model.trains_dep:
+            th = [self.th_dep[train + (int(order),)] for order in model.dep_orders]
+            for (first, second), duree in zip(zip(th, th[1:]), model.dep_durees):
+                self.model.Add(second >= first + int(duree))
+            self.model.Add(th[-1] + int(model.dep_durees[-1]) <= train[2])
+            self.model.Add(th[0] == self.b[train])
+            self.model.Add(th[2] == self.c[train])
+
+    def _define_envelopes(self):
+        """Constraints 21 to 26: each task in one envelope, agents of the used envelopes, number of envelopes used."""
+        model = self.source
+        self.envelope_taches = {roulement: {} for roulement in ENVELOPE_NAMES}
+        self.envelope_used = {
+            roulement: {i: self.model.NewBoolVar(f'used_{roulement}_{i}') for i in range(len(model.envelopes_agents.get(f'roulement_{roulement}', [])))}
+            for roulement in ENVELOPE_NAMES
+        }
+        for chantier, (train_types, orders, roulements) in AGENT_CHANTIERS.items():
+            tasks = []
+            for key, th in (self.th_arr | self.th_dep).items():
+                if key[0] not in train_types or key[3] not in orders(model):
+                    continue
+                duree = int((model.arr_durees if key[0] == 'ARR' else model.dep_durees)[key[3]-1])
+                lo, hi = (model.th_arr_windows if key[0] == 'ARR' else model.th_dep_windows)[key]
+                tasks.append(self.model.NewFixedSizeIntervalVar(th, duree, f'task{key}'))
+                assigned = []
+                for roulement in roulements:
+                    for i, (start, end) in enumerate(model.envelopes_agents.get(f'roulement_{roulement}', [])):
+                        # only the envelopes the window of the task can fit in
+                        if max(lo, start) > min(hi, end - duree):
+                            continue
+                        x = self.model.NewBoolVar(f'envelope_{roulement}_{i}{key}')
+                        self.model.Add(th >= start).OnlyEnforceIf(x)
+                        self.model.Add(th + duree <= end).OnlyEnforceIf(x)
+                        self.model.AddImplication(x, self.envelope_used[roulement][i])
+                        self.envelope_taches[roulement][(i,) + key] = x
+                        assigned.append(x)
+                if any(model.envelopes_agents.get(f'roulement_{roulement}') for roulement in roulements):
+                    self.model.AddExactlyOne(assigned)
+
+            # agents: constant capacity minus a filler interval per run of slots with the same roulements active
+            # envelopes covering each slot, from the envelopes x slots incidence of each roulement
+            covering = {
+                roulement: model.envelope_slots.incidence(f'roulement_{roulement}').tocsc()
+                for roulement in roulements if f'roulement_{roulement}' in model.envelopes_agents
+            }
+            profile = []
+            for slot in range(self.nb_slots):
+                terms = tuple(
+                    (roulement, int(i), int(model.max_agents[roulement][slot]))
+                    for roulement, matrix in covering.items()
+                    for i in matrix.indices[matrix.indptr[slot]:matrix.indptr[slot + 1]]
+                    if model.max_agents[roulement][slot] > 0
+                )
+                if profile and profile[-1][2] == terms:
+                    profile[-1][1] = slot + 1
+                else:
+                    profile.append([slot, slot + 1, terms])
+            capacity = max(sum(agents for _, _, agents in terms) for _, _, terms in profile)
+            fillers, demands = [], []
+            for first, last, terms in profile:
+                agents = self.model.NewIntVar(0, capacity, f'agents_{chantier}_{first}')
+                self.model.Add(agents == sum(value * self.envelope_used[roulement][i] for roulement, i, value in terms))
+                fillers.append(self.model.NewFixedSizeIntervalVar(15 * first, 15 * (last - first), f'filler_{chantier}_{first}'))
+                demands.append(capacity - agents)
+            self.model.AddCumulative(tasks + fillers, [1] * len(tasks) + demands, capacity)
+
+        # an envelope is used only if a task is assigned to it
+        for roulement, used in self.envelope_used.items():
+            for i, var in used.items():
+                self.model.AddBoolOr([x for key, x in self.envelope_taches[roulement].items() if key[0] == i]).OnlyEnforceIf(var)
+        # envelopes of the trains fixed by the rolling horizon
+        for roulement, name in ENVELOPE_NAMES.items():
+            for key, value in model.fixed.get(f'envelope_taches_{name}', {}).items():
+                if key in self.envelope_taches[roulement]:
+                    self.model.Add(self.envelope_taches[roulement][key] == value)
+        # the envelopes already used by the trains outside the model (rolling horizon) are reused for free
+        self.model.Minimize(sum(
+            var for roulement, used in self.envelope_used.items() for i, var in used.items()
+            if i not in model.used_envelopes.get(ENVELOPE_NAMES[roulement], ())
+        ))
+
+    def _voies_max(self, a, b, c):
+        """Max voies occupied in chantiers REC, FOR and DEP, counted as the occupation rows of the jalon"""
+        model = self.source
+        rec, for_, dep = (SlotCounter(self.nb_slots, None) for _ in range(3))
+        for train in model.trains_arr:
+            rec.add(train[2], a[train] + 15)
+            if model.jalon == 2:
+                for_.add(train[2], a[train] + 15)
+            elif train in model.arr_to_dep:
+                for_.add(a[train], b[model.arr_to_dep[train]])
+        for train in model.trains_dep:
+            for_.add(b[train], c[train] + 15)
+            dep.add(c[train], train[2])
+        return [int(counter.counts.max(initial=0)) for counter in [rec, for_, dep]]
+
+    def solve(self, time_limit=None):
+        """Solve with CP-SAT, the values having the names and keys of the variables of the gurobipy model"""
+        solver = cp_model.CpSolver()
+        if time_limit is not None:
+            solver.parameters.max_time_in_seconds = float(time_limit)
+        status = solver.Solve(self.model)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            return Solution('infeasible' if status == cp_model.INFEASIBLE else 'unknown', runtime=solver.WallTime())
+        values = {name: {key: solver.Value(var) for key, var in getattr(self, name).items()} for name in ['a', 'b', 'c']}
+        if self.source.jalon >= 2:
+            rec_max, for_max, dep_max = self._voies_max(values['a'], values['b'], values['c'])
+            values |= {'rec_max': {None: rec_max}, 'for_max': {None: for_max}, 'dep_max': {None: dep_max}}
+        if self.source.jalon == 3:
+            values |= {name: {key: solver.Value(var) for key, var in getattr(self, name).items()} for name in ['th_arr', 'th_dep']}
+            for roulement, name in ENVELOPE_NAMES.items():
+                values[f'envelope_taches_{name}'] = {key: solver.Value(var) for key, var in self.envelope_taches[roulement].items()}
+                values[f'envelope_used_{name}'] = {i: solver.Value(var) for i, var in self.envelope_used[roulement].items()}
+        return Solution(
+            'optimal' if status == cp_model.OPTIMAL else 'feasible', values, solver.ObjectiveValue(), solver.WallTime()
+        )
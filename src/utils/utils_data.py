@@ -1,19 +1,66 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from utils.utils_date import time_to_minutes_2, time_to_minutes, minute_to_date, minute_to_date2, time_to_minutes_3
+from openpyxl import load_workbook
+from utils.utils_date import times_to_minutes_2, time_to_minutes, minutes_to_date, time_to_minutes_3
+from utils.utils_envelope import EnvelopeSlots
 
-def load_data(fichier):
-    """Load the data from the Excel file"""
+# sheets of an instance and the explicit dtype of their numeric columns (inferred if a value does not fit)
+SHEETS = {
+    'Chantiers': {'Nombre de voies': np.int64},
+    'Machines': {'Duree ': np.int64},
+    'Sillons arrivee': {'n°TRAIN': np.int64},
+    'Sillons depart': {'n°TRAIN': np.int64},
+    'Correspondances': {'n°Train depart': np.int64, 'n°Train arrivee': np.int64},
+    'Taches humaines': {'Ordre': np.int64, 'Durée': np.int64},
+    'Roulements agents': {'Nombre agents': np.int64},
+}
+# sheets of the machine scheduling (jalon 1 and 2), the human tasks sheets only being needed by jalon 3
+MACHINE_SHEETS = ['Chantiers', 'Machines', 'Sillons arrivee', 'Sillons depart', 'Correspondances']
 
-    chantiers_df = pd.read_excel(fichier, sheet_name='Chantiers')
-    machines_df = pd.read_excel(fichier, sheet_name='Machines')
-    sillons_arrivee_df = pd.read_excel(fichier, sheet_name='Sillons arrivee')
-    sillons_depart_df = pd.read_excel(fichier, sheet_name='Sillons depart')
-    correspondances_df = pd.read_excel(fichier, sheet_name='Correspondances')
-    taches_humaines_df = pd.read_excel(fichier, sheet_name='Taches humaines')
-    roulements_agents_df = pd.read_excel(fichier, sheet_name='Roulements agents')
-    return chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df, taches_humaines_df,roulements_agents_df
+def _column(values, dtype):
+    """Typed array of the values of a column, pandas inference if there is no dtype or a value does not fit it.
+    Empty cells are NaN, as read by pd.read_excel."""
+    if dtype is not None:
+        try:
+            return np.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            pass
+    return pd.Series([np.nan if value is None else value for value in values], dtype=None if values else object)
+
+def read_workbook(fichier, sheets=SHEETS, required=None):
+    """Read the sheets of the workbook in one pass: the file is opened once in read-only mode and each sheet streamed
+    row by row into one list per column, converted once to its dtype. Empty rows are skipped.
+    The sheets missing from the workbook are left out, a ValueError is raised if one of required (every sheet if None) is."""
+    workbook = load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        missing = [sheet for sheet in (sheets if required is None else required) if sheet not in workbook.sheetnames]
+        if missing:
+            raise ValueError(f'Worksheets {missing} not found in {fichier}')
+        frames = {}
+        for sheet, dtypes in sheets.items():
+            if sheet not in workbook.sheetnames:
+                continue
+            rows = workbook[sheet].iter_rows(values_only=True)
+            header = [(i, name) for i, name in enumerate(next(rows, ())) if name is not None]
+            columns = [[] for _ in header]
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                # read-only rows stop at their last filled cell
+                for column, (i, _) in zip(columns, header):
+                    column.append(row[i] if i < len(row) else None)
+            frames[sheet] = pd.DataFrame(
+                {name: _column(column, dtypes.get(name)) for column, (_, name) in zip(columns, header)}, columns=[name for _, name in header]
+            )
+    finally:
+        workbook.close()
+    return frames
+
+def load_data(fichier, required=None):
+    """Load the data from the Excel file, None for the sheets it does not have (required: sheets it must have, all if None)"""
+    frames = read_workbook(fichier, required=required)
+    return tuple(frames.get(sheet) for sheet in SHEETS)
 
 def calculate_delta_days(sillons_depart_df,sillons_arrivee_df):
     """Calculate the number of days between the first and last event"""
@@ -34,9 +81,9 @@ def calculate_delta_days(sillons_depart_df,sillons_arrivee_df):
     first_day = j1.weekday()
     return j1, jours, first_day
 
-def add_time_reference(fichier):
+def add_time_reference(fichier, required=None):
     """Add the time reference to the data"""
-    chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df,taches_humaines_df,roulements_agents_df = load_data(fichier)
+    chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df,taches_humaines_df,roulements_agents_df = load_data(fichier, required)
     j1, jours,first_day = calculate_delta_days(sillons_depart_df,sillons_arrivee_df)
     return chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df, taches_humaines_df,roulements_agents_df, j1, jours,first_day
 
@@ -45,13 +92,14 @@ def format_trains(machines_df, sillons_arrivee_df, sillons_depart_df, chantiers_
     machines = ['DEB', 'FOR', 'DEG']
     chantiers = chantiers_df['Chantier'].to_list()
     machines_durees = machines_df['Duree '].to_list()
-    trains_arr = []
-    trains_dep = []
-    for x, train in sillons_arrivee_df.iterrows():
-        y = ('ARR', train['n°TRAIN'], time_to_minutes_2(train['JARR'], train['HARR'], j1,day_1))
-        trains_arr.append(y)
-    for x, train in sillons_depart_df.iterrows():
-        trains_dep.append(('DEP', train['n°TRAIN'], time_to_minutes_2(train['JDEP'], train['HDEP'], j1,day_1)))
+    trains_arr = list(zip(
+        ['ARR'] * len(sillons_arrivee_df), sillons_arrivee_df['n°TRAIN'].to_list(),
+        times_to_minutes_2(sillons_arrivee_df['JARR'], sillons_arrivee_df['HARR'], j1, day_1).tolist()
+    ))
+    trains_dep = list(zip(
+        ['DEP'] * len(sillons_depart_df), sillons_depart_df['n°TRAIN'].to_list(),
+        times_to_minutes_2(sillons_depart_df['JDEP'], sillons_depart_df['HDEP'], j1, day_1).tolist()
+    ))
 
     trains = trains_arr + trains_dep
     minutes = list(range(0, 24 * 60 * (jours+1)))
@@ -96,33 +144,28 @@ def format_taches_humaines(taches_humaines_df, roulements_agents_df, jours,day_1
 
     nombre_agents = np.array(nombre_agents)
 
+    # agents over the slots, from the slots covered by the envelopes, with the capacities of the former loop over every
+    # slot and envelope: 'depart' counts the depart and reception_depart agents, and the formation_depart agents once per
+    # formation_depart envelope over the bounds of the last envelope tested before them, 'reception_depart' and
+    # 'formation_depart' staying at zero
+    envelope_slots = EnvelopeSlots(envelopes_agents, len(minute_slots))
+    zeros = np.zeros(len(minute_slots), dtype=np.int64)
+    depart = (
+        envelope_slots.profile('roulement_depart', nombre_agents[2])
+        + envelope_slots.profile('roulement_reception_depart', nombre_agents[3])
+    )
+    tested = [roulement for roulement in ['roulement_reception', 'roulement_formation', 'roulement_depart', 'roulement_reception_depart'] if envelopes_agents[roulement]]
+    if tested and envelopes_agents['roulement_formation_depart']:
+        slots = envelope_slots.slots(tested[-1], -1)
+        depart[slots.start:slots.stop] += nombre_agents[4] * len(envelopes_agents['roulement_formation_depart'])
     max_agents = {
-        'reception': [0] * len(minute_slots),
-        'reception_depart': [0] * len(minute_slots),
-        'formation': [0] * len(minute_slots),
-        'formation_depart': [0] * len(minute_slots),
-        'depart': [0] * len(minute_slots)
+        'reception': envelope_slots.profile('roulement_reception', nombre_agents[0]).tolist(),
+        'reception_depart': zeros.tolist(),
+        'formation': envelope_slots.profile('roulement_formation', nombre_agents[1]).tolist(),
+        'formation_depart': zeros.tolist(),
+        'depart': depart.tolist(),
     }
 
-    for i, minute in enumerate(minute_slots):
-        minute = minute*15
-        for (start, end) in envelopes_agents['roulement_reception']:
-            if start <= minute < end:
-                max_agents['reception'][i] += nombre_agents[0]
-        for (start, end) in envelopes_agents['roulement_formation']:
-            if start <= minute < end:
-                max_agents['formation'][i] += nombre_agents[1]
-        for (start, end) in envelopes_agents['roulement_depart']:
-            if start <= minute < end:
-                max_agents['depart'][i] += nombre_agents[2]
-        for (start, end) in envelopes_agents['roulement_reception_depart']:
-            if start <= minute < end:
-                max_agents['depart'][i] += nombre_agents[3]
-        for (start3, end3) in envelopes_agents['roulement_formation_depart']:
-            if start <= minute < end:
-                max_agents['depart'][i] += nombre_agents[4]
-
-        
     arr_taches_dict = {}
     dep_taches_dict = {}
     for x, tache in taches_humaines_df.iterrows():
@@ -192,19 +235,37 @@ def unavailable_chantiers(chantiers_df, jours,day_1):
 
     return unavailable_periods_chantiers, start_times
 
+def resolve_correspondances(trains_dep, trains_arr, correspondances_df, j1):
+    """Join the correspondances rows (one per wagon) with the trains on (n° train, date of the day).
+    Returns {departed train: [required arrived trains]}, {arrived train: [departed trains it feeds]} and
+    {(departed train, arrived train): number of wagons}, the lists being in the order of the rows then of trains_arr."""
+    arrivees = {}
+    for train_arr, jour in zip(trains_arr, minutes_to_date([train[2] for train in trains_arr], j1).tolist()):
+        arrivees.setdefault((train_arr[1], jour), []).append(train_arr)
+    lignes = {}
+    for train_dep, jour_dep, train_arr, jour_arr in zip(
+        correspondances_df['n°Train depart'].to_list(), correspondances_df['Jour depart'].to_list(),
+        correspondances_df['n°Train arrivee'].to_list(), correspondances_df['Jour arrivee'].to_list()
+    ):
+        lignes.setdefault((train_dep, jour_dep), []).append((train_arr, jour_arr))
+
+    trains_requis_dict = {}
+    departs_dict = {train_arr: [] for train_arr in trains_arr}
+    wagons = {}
+    for train, jour in zip(trains_dep, minutes_to_date([train[2] for train in trains_dep], j1).tolist()):
+        tous_trains = {}
+        for ligne in lignes.get((train[1], jour), []):
+            for train_arr in arrivees.get(ligne, []):
+                tous_trains[train_arr] = tous_trains.get(train_arr, 0) + 1
+        trains_requis_dict[train] = list(tous_trains)
+        for train_arr, nombre in tous_trains.items():
+            departs_dict[train_arr].append(train)
+            wagons[train, train_arr] = nombre
+    return trains_requis_dict, departs_dict, wagons
+
 def correspondance_for_depart(trains_dep, trains_arr, correspondances_df, j1):
     """Find the required arrived trains for each departed train"""
-    trains_requis_dict = {}
-    for train in trains_dep:
-        tous_trains = []
-        for _, row in correspondances_df.iterrows():
-            if row['n°Train depart'] == train[1] and row['Jour depart'] == minute_to_date(train[2], j1):
-                for train_arr in trains_arr:
-                    if row['n°Train arrivee'] == train_arr[1] and row['Jour arrivee'] == minute_to_date(train_arr[2], j1):
-                        if train_arr not in tous_trains:
-                            tous_trains.append(train_arr)
-        trains_requis_dict[train] = tous_trains
-    return trains_requis_dict
+    return resolve_correspondances(trains_dep, trains_arr, correspondances_df, j1)[0]
 
 def find_max_voies(chantiers_df):
     """Find the maximum number of voies used in the data"""
@@ -1,6 +1,40 @@
 from datetime import datetime, timedelta, time
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 
+# 'HH:MM' of each minute of a day
+DAY_TIMES = np.array([f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(24 * 60)])
+
+@lru_cache(maxsize=None)
+def _parse_date(date_str):
+    return datetime.strptime(date_str.strip(), "%d/%m/%Y")
+
+@lru_cache(maxsize=None)
+def _parse_time(time_str):
+    """Minutes of the day of a 'HH:MM' string"""
+    time_obj = datetime.strptime(time_str.strip(), "%H:%M")
+    return time_obj.hour * 60 + time_obj.minute
+
+def _date(date_str):
+    """datetime of a 'dd/mm/YYYY' string, a datetime or Timestamp being returned as is"""
+    if type(date_str) == str:
+        return _parse_date(date_str)
+    elif type(date_str) == datetime or type(date_str) == pd._libs.tslibs.timestamps.Timestamp:
+        return date_str
+
+def _time_minutes(time_str):
+    """Minutes of the day of a 'HH:MM' string or a time"""
+    if type(time_str) == str:
+        return _parse_time(time_str)
+    elif type(time_str) == time:
+        return time_str.hour * 60 + time_str.minute
+
+def _map_unique(values, convert):
+    """Array of convert(value) for the values of a column, convert being called once per distinct value"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return np.array([convert(value) for value in uniques], dtype=np.int64)[codes]
+
 def time_to_minutes(day_of_week, time_str, total_jours,day_1):
     """Convert the time to minutes depending of the week, same as the 2nd function. Convert the day of the week to an integer (0 = Monday, 6 = Sunday)"""
     day_of_week = int(day_of_week)-1 - day_1
@@ -8,56 +42,64 @@ def time_to_minutes(day_of_week, time_str, total_jours,day_1):
         day_of_week2 = day_of_week + 7
     else:
         day_of_week2 = day_of_week
-    time_obj = datetime.strptime(time_str.strip(), "%H:%M")
-    
-    total_minutes = day_of_week * 24 * 60 + time_obj.hour * 60 + time_obj.minute
-    total_minutes2 = day_of_week2 * 24 * 60 + time_obj.hour * 60 + time_obj.minute
+    minutes = _parse_time(time_str)
+
+    total_minutes = day_of_week * 24 * 60 + minutes
+    total_minutes2 = day_of_week2 * 24 * 60 + minutes
     if total_minutes == total_minutes2:
         total_minutes2 = 0
     return [total_minutes, total_minutes2]
 
 def time_to_minutes_2(date_str, time_str, jour1,day_1):
     """Convert the time to minutes. Get the day of the week (0 = Monday, 6 = Sunday...jusqu'à finir le total des jours)"""
-    if type(date_str) == str:
-        date_obj = datetime.strptime(date_str.strip(), "%d/%m/%Y")
-    elif type(date_str) == datetime or type(date_str) == pd._libs.tslibs.timestamps.Timestamp:
-        date_obj = date_str
-    
-    day_diff = date_obj- jour1
+    day_diff = _date(date_str) - jour1
     number_day = day_diff.days-day_1
-    
-    if type(time_str) == str:
-        time_obj = datetime.strptime(time_str.strip(), "%H:%M")
-    elif type(time_str) == time:
-        time_obj = time_str
-    
-    total_minutes = number_day * 24 * 60 + time_obj.hour * 60 + time_obj.minute
+
+    total_minutes = number_day * 24 * 60 + _time_minutes(time_str)
     return total_minutes
 
+def times_to_minutes_2(dates, times, jour1, day_1):
+    """Array version of time_to_minutes_2 for columns of dates and times, each distinct date and time being parsed once"""
+    days = _map_unique(dates, lambda date_str: (_date(date_str) - jour1).days)
+    return (days - day_1) * 24 * 60 + _map_unique(times, _time_minutes)
+
 def time_to_minutes_3(day, time_str, day_1):
     """Convert the time to minutes"""
     number_day = int(day)
 
-    if type(time_str) == str:
-        time_obj = datetime.strptime(time_str.strip(), "%H:%M")
-    elif type(time_str) == time:
-        time_obj = time_str
-    
-    total_minutes = number_day * 24 * 60 + time_obj.hour * 60 + time_obj.minute
+    total_minutes = number_day * 24 * 60 + _time_minutes(time_str)
     return total_minutes
 
 def minute_to_date(minutes, jour1):
     """Convert the minutes to a date"""
     jour = jour1 + timedelta(minutes//(24*60))
     date_str = jour.strftime("%d/%m/%Y")
-    
+
     return date_str
 
 def minute_to_date2(minutes, jour1):
     """Convert the minutes to a date"""
     jour = jour1 + timedelta(minutes=minutes)
-    
+
     date_str = jour.strftime("%d/%m/%Y")
     time_str = jour.strftime("%H:%M")
-    
-    return date_str, time_str
\ No newline at end of file
+
+    return date_str, time_str
+
+def _day_strings(days, jour1):
+    """'dd/mm/YYYY' of jour1 + days for an array of days, each distinct day being formatted once"""
+    uniques, codes = np.unique(days, return_inverse=True)
+    return np.array([(jour1 + timedelta(int(day))).strftime("%d/%m/%Y") for day in uniques], dtype=str)[codes.reshape(-1)]
+
+def minutes_to_date(minutes, jour1):
+    """Array version of minute_to_date"""
+    return _day_strings(np.floor_divide(np.asarray(minutes), 24 * 60), jour1)
+
+def minutes_to_date2(minutes, jour1):
+    """Array version of minute_to_date2: (dates, times) arrays of an array of minutes (solution values may be floats)"""
+    # microseconds from the midnight of jour1, rounded like timedelta
+    midnight = datetime(jour1.year, jour1.month, jour1.day)
+    offset = (jour1 - midnight) // timedelta(microseconds=1)
+    microseconds = np.round(np.asarray(minutes, dtype=float) * 60_000_000).astype(np.int64) + offset
+    days, minute_of_day = np.divmod(microseconds // 60_000_000, 24 * 60)
+    return _day_strings(days, midnight), DAY_TIMES[minute_of_day]
@@ -0,0 +1,42 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+class EnvelopeSlots:
+    """Slots covered by the envelopes of each roulement, an envelope (start, end) covering the slots s with start <= 15*s < end.
+
+    The envelopes of a roulement are stored as interval arrays, envelope i covering the slots first[i] <= s < last[i].
+    The capacity profiles (difference array) and the envelopes x slots incidence matrix are built from them in one pass,
+    shared by format_taches_humaines and the constraints of ModelJalon3, instead of testing every slot against every envelope."""
+
+    def __init__(self, envelopes_agents, nb_slots):
+        self.nb_slots = nb_slots
+        self.first, self.last = {}, {}
+        for roulement, envelopes in envelopes_agents.items():
+            bounds = np.array(envelopes, dtype=np.int64).reshape(-1, 2)
+            # first slot with 15*s >= start, first slot with 15*s >= end
+            first = np.clip(-(-bounds[:, 0] // 15), 0, nb_slots)
+            self.first[roulement] = first
+            self.last[roulement] = np.maximum(first, np.clip(-(-bounds[:, 1] // 15), 0, nb_slots))
+
+    def slots(self, roulement, i):
+        """Slots covered by envelope i of roulement"""
+        return range(int(self.first[roulement][i]), int(self.last[roulement][i]))
+
+    def profile(self, roulement, agents):
+        """Agents available at each slot: agents (of each envelope, a number or an array) summed over the envelopes of roulement covering the slot"""
+        first, last = self.first[roulement], self.last[roulement]
+        agents = np.broadcast_to(np.asarray(agents, dtype=np.int64), first.shape)
+        diff = np.zeros(self.nb_slots + 1, dtype=np.int64)
+        np.add.at(diff, first, agents)
+        np.add.at(diff, last, -agents)
+        return np.cumsum(diff[:-1])
+
+    def incidence(self, roulement):
+        """Sparse boolean (envelopes, slots) matrix of roulement, True where the envelope covers the slot"""
+        first, last = self.first[roulement], self.last[roulement]
+        lengths = last - first
+        rows = np.repeat(np.arange(len(first)), lengths)
+        # slot of the k-th covered (envelope, slot) pair: first of its envelope plus its rank in the envelope
+        cols = np.repeat(first - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(len(first), self.nb_slots))
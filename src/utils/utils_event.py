@@ -0,0 +1,142 @@
+from bisect import bisect_right
+from gurobipy import GRB, quicksum
+
+
+def _expr(term):
+    """Expression of a term (var, offset), var None for a constant"""
+    var, offset = term
+    return offset if var is None else var + offset
+
+
+def _is_constant(indicator, value):
+    """True if an indicator of EventOverlaps is the constant value instead of a binary"""
+    return isinstance(indicator, int) and indicator == value
+
+
+def _value(term, values):
+    """Value of a term (var, offset) given the value of its variable"""
+    var, offset = term
+    return offset if var is None else values[var] + offset
+
+
+class EventOverlaps:
+    """Event-based cumulative of items (stays of trains in a chantier, human tasks) using one resource.
+
+    Item i holds the resource from its event P_i to Q_i included (minutes). items[i] is (P term, P window, Q term,
+    Q window), a term being (var, offset) worth var + offset (var None for a constant) and a window its [lo, hi] range.
+    The max number of items holding the resource is reached at an event, so it is only counted there:
+        u[j, i] = 1 if P_j <= P_i, v[j, i] = 1 if P_i <= Q_j, z[j, i] >= u + v - 1 if j holds the resource at P_i,
+        n[i] = 1 if item i is not empty (P_i <= Q_i).
+    Each indicator is only forced to 1 (row `expr + 1 <= M*b`), which is enough for a capacity upper bound. Pairs are
+    only built for the items j whose [P, Q] window can meet the event window of i, and an indicator known from the
+    windows is a constant instead of a binary."""
+
+    def __init__(self, model, big_m, items, name):
+        self.model = model
+        self.big_m = big_m
+        self.name = name
+        self.items = items
+        # (indicator var, plus term, minus term), its value being plus - minus >= 0, and (z, u, v) of the products,
+        # lists as vars can not be hashed before the model is updated
+        self.indicators = []
+        self.products = []
+        self.z = {}
+        self.n = {key: self._indicator(q, q_window, p, p_window, f'{name}_n', key) for key, (p, p_window, q, q_window) in items.items()}
+
+        # sweep by earliest event: only the items j with P_j_lo <= P_i_hi can hold the resource at P_i
+        by_event = sorted(items, key=lambda key: items[key][1][0])
+        event_lo = [items[key][1][0] for key in by_event]
+        for i, (p_i, p_window_i, _, _) in items.items():
+            for j in by_event[:bisect_right(event_lo, p_window_i[1])]:
+                p_j, p_window_j, q_j, q_window_j = items[j]
+                if j == i or q_window_j[1] < p_window_i[0]:
+                    continue
+                u = self._indicator(p_i, p_window_i, p_j, p_window_j, f'{name}_u', j + i)
+                v = self._indicator(q_j, q_window_j, p_i, p_window_i, f'{name}_v', j + i) if not _is_constant(u, 0) else 0
+                if _is_constant(u, 0) or _is_constant(v, 0):
+                    continue
+                if _is_constant(u, 1):
+                    z = v
+                elif _is_constant(v, 1):
+                    z = u
+                else:
+                    z = model.addVar(vtype=GRB.BINARY, name=f'{name}_z[{j + i}]')
+                    model.addConstr(z >= u + v - 1, name=f'{name}_z_{j}_{i}')
+                    self.products.append((z, u, v))
+                self.z[j, i] = z
+
+    def _indicator(self, plus, plus_window, minus, minus_window, name, key):
+        """Binary forced to 1 if plus - minus >= 0, a constant 0 or 1 if the windows already decide it"""
+        lo, hi = plus_window[0] - minus_window[1], plus_window[1] - minus_window[0]
+        if hi < 0:
+            return 0
+        if lo >= 0:
+            return 1
+        b = self.model.addVar(vtype=GRB.BINARY, name=f'{name}[{key}]')
+        self.model.addConstr(_expr(plus) - _expr(minus) + 1 <= self.big_m(f'{self.name}_event', hi + 1)*b, name=f'{name}_{key}')
+        self.indicators.append((b, plus, minus))
+        return b
+
+    def counts(self, keep=None):
+        """{i: number of items holding the resource at the event of i (itself included)}, only counting the items in keep if given"""
+        terms = {i: [self.n[i]] for i in self.items}
+        for (j, i), z in self.z.items():
+            if keep is None or j in keep:
+                terms[i].append(z)
+        return {i: quicksum(terms[i]) for i in terms}
+
+    def count_values(self, values, keep=None):
+        """{i: value of counts(keep)[i]} for the values of the binaries in values ({var: value})"""
+        value = lambda b: b if isinstance(b, int) else values[b]
+        counts = {i: value(self.n[i]) for i in self.items}
+        for (j, i), z in self.z.items():
+            if keep is None or j in keep:
+                counts[i] += value(z)
+        return counts
+
+    def start_values(self, values):
+        """{binary: value} of the indicators for the start times in values ({var: value}), for a MIP start"""
+        starts = {b: float(_value(plus, values) - _value(minus, values) >= 0) for b, plus, minus in self.indicators}
+        value = lambda b: b if isinstance(b, int) else starts[b]
+        for z, u, v in self.products:
+            starts[z] = float(value(u) and value(v))
+        return starts
+
+
+class EnvelopeCovers:
+    """Agents available at the start of each human task, for the event-based agents capacity.
+
+    tasks[key] is (th var, th window), envelopes a list of (roulement, i, start, end, agents, used var). cover[key,
+    roulement, i] can only be 1 if the envelope is used and start <= th < end, the capacity at the start of the task
+    being the agents of the envelopes it covers. Only the envelopes the window of the task can meet get a binary."""
+
+    def __init__(self, model, big_m, tasks, envelopes, name):
+        self.cover = {}
+        self.envelopes = {}
+        for key, (th, (lo, hi)) in tasks.items():
+            for roulement, i, start, end, agents, used in envelopes:
+                if agents <= 0 or end <= lo or start > hi:
+                    continue
+                cover = model.addVar(vtype=GRB.BINARY, name=f'{name}_cover[{key + (roulement, i)}]')
+                model.addConstr(cover <= used, name=f'{name}_cover_used_{key}_{roulement}_{i}')
+                if lo < start:
+                    model.addConstr(th >= start - big_m(f'{name}_cover', start - lo)*(1 - cover), name=f'{name}_cover_start_{key}_{roulement}_{i}')
+                if hi > end - 1:
+                    model.addConstr(th <= end - 1 + big_m(f'{name}_cover', hi - end + 1)*(1 - cover), name=f'{name}_cover_end_{key}_{roulement}_{i}')
+                self.cover[key + (roulement, i)] = cover
+                self.envelopes[key + (roulement, i)] = (th, start, end, agents, used)
+
+    def capacities(self, tasks):
+        """{key: agents available at the start of the task} for the keys of tasks"""
+        terms = {key: [] for key in tasks}
+        for cover_key, cover in self.cover.items():
+            if cover_key[:-2] in terms:
+                terms[cover_key[:-2]].append(self.envelopes[cover_key][3]*cover)
+        return {key: quicksum(terms[key]) for key in terms}
+
+    def start_values(self, values):
+        """{binary: value} of the covers for the start times and used envelopes in values ({var: value}), for a MIP start"""
+        return {
+            cover: float(bool(values[used]) and start <= values[th] < end)
+            for cover, (th, start, end, _, used) in ((cover, self.envelopes[key]) for key, cover in self.cover.items())
+        }
@@ -0,0 +1,128 @@
+import math
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from utils.utils_date import DAY_TIMES
+
+# arrival trains a day of the realistic instance (instance_WPY_realiste_jalon3.xlsx), the one of scale 1
+ARRIVALS_PER_DAY = 16
+# first train number of the arrival and departure lines, a line running once a day under the same number
+ARRIVAL_NUMBER, DEPARTURE_NUMBER = 100000, 400000
+MAX_VOIES = {'WPY_REC': 15, 'WPY_FOR': 40, 'WPY_DEP': 14}
+MACHINES = [('DEB', 'Débranchement'), ('FOR', 'Formation'), ('DEG', 'Dégarage')]
+# (type de train, type de tache humaine, lien machine, durée, chantier, ordre) of the realistic instance
+TACHES = [
+    ('ARR', 'arrivée Reception', None, 15, 'WPY_REC', 1),
+    ('ARR', 'préparation tri', None, 45, 'WPY_REC', 2),
+    ('ARR', 'débranchement', 'DEB=', 15, 'WPY_REC', 3),
+    ('DEP', 'appui voie + mise en place câle', 'FOR=', 15, 'WPY_FOR', 1),
+    ('DEP', 'attelage véhicules', None, 150, 'WPY_FOR', 2),
+    ('DEP', 'dégarage / bouger de rame', 'DEG=', 15, 'WPY_FOR', 3),
+    ('DEP', 'essai de frein départ', None, 20, 'WPY_DEP', 4),
+]
+# {roulement: (jours de la semaine, nombre agents, cycles horaires, connaissances chantiers)} of the realistic instance
+ROSTERS = {
+    'roulement_reception': ('1;2;3;4;5;6;7', 6, '05:00-13:00;13:00-21:00;21:00-05:00', 'WPY_REC'),
+    'roulement_formation': ('1;2;3;4;5;6;7', 8, '05:00-13:00;13:00-21:00;21:00-05:00', 'WPY_FOR'),
+    'roulement_depart': ('1;2;3;4;5;6;7', 2, '05:00-13:00;13:00-21:00;21:00-05:00', 'WPY_DEP'),
+    'roulement_reception_depart': ('1;2;3;4;5', 1, '22:00-06:00;09:00-17:00', 'WPY_REC;WPY_DEP'),
+    'roulement_formation_depart': ('1;2;3;4;5;6;7', 7, '05:00-13:00;13:00-21:00;21:00-05:00', 'WPY_FOR;WPY_DEP'),
+}
+# shifts a machine or a chantier can be unavailable on, within a day as unavailable_machines reads them
+SHIFTS = ['05:00-13:00', '13:00-21:00']
+# envelopes and unavailabilities are given by day of the week over two weeks at most (format_taches_humaines)
+MAX_DAYS = 14
+
+
+def _unavailabilities(rng, density):
+    """Indisponibilites cell: each shift of each day of the week unavailable with probability density, 0 if none"""
+    periods = [f'({day},{shift})' for day in range(1, 8) for shift in SHIFTS if rng.random() < density]
+    return ';'.join(periods) if periods else 0
+
+
+def _sillons(rng, lines, days, offset, jitter):
+    """(line, minute) of lines running once a day on the days offset to offset+days-1, each at its own time of the day
+    give or take jitter minutes"""
+    base = rng.integers(0, 24 * 60, lines)
+    minutes = np.clip(base + rng.integers(-jitter, jitter + 1, (days, lines)), 0, 24 * 60 - 1)
+    minutes += (offset + np.arange(days))[:, None] * 24 * 60
+    return np.tile(np.arange(lines), days), minutes.ravel()
+
+
+def generate_sheets(
+    scale=1.0, days=7, start='08/08/2022', trains_per_day=None, arrivals_per_departure=(1, 4), wagons=(1, 3),
+    max_delay_days=2, min_gap=360, unavailability=0.1, voies_scale=None, agents_scale=None, machine_duration=15,
+    rosters=None, seed=0
+):
+    """Sheets of a synthetic instance ({sheet: DataFrame} with the columns and dtypes of load_data), seeded by seed.
+
+    Arrival trains run on days 0 to days-1 from start and departure trains on days 1 to days, trains_per_day lines of
+    each (ARRIVALS_PER_DAY * scale by default) at their own time of the day. A departure train takes the wagons of
+    arrivals_per_departure (min, max) arrival trains, arrived between max_delay_days days and min_gap minutes before
+    it, each giving wagons (min, max) wagons. Every shift of a machine or a chantier is unavailable with probability
+    unavailability. The voies of the chantiers and the agents of the rosters ({roulement: (jours de la semaine, nombre
+    agents, cycles horaires, connaissances chantiers)}, ROSTERS by default) are scaled by voies_scale and agents_scale
+    (scale by default). The machines stay one DEB, FOR and DEG of machine_duration minutes."""
+    start = datetime.strptime(start, '%d/%m/%Y')
+    if days + start.weekday() > MAX_DAYS:
+        raise ValueError(f'{days} days from a {start:%A} go past the {MAX_DAYS} days of the rosters and unavailabilities')
+    rng = np.random.default_rng(seed)
+    trains_per_day = trains_per_day or max(1, round(ARRIVALS_PER_DAY * scale))
+    voies_scale = scale if voies_scale is None else voies_scale
+    agents_scale = scale if agents_scale is None else agents_scale
+    rosters = rosters or ROSTERS
+
+    arr_lines, arr_minutes = _sillons(rng, trains_per_day, days, 0, 30)
+    dep_lines, dep_minutes = _sillons(rng, trains_per_day, days, 1, 30)
+
+    # arrival trains of each departure train among the ones arrived in [departure - max_delay_days, departure - min_gap]
+    order = np.argsort(arr_minutes, kind='stable')
+    first = np.searchsorted(arr_minutes[order], dep_minutes - max_delay_days * 24 * 60, 'left')
+    last = np.searchsorted(arr_minutes[order], dep_minutes - min_gap, 'right')
+    pairs_arr, pairs_dep = [], []
+    for dep, (lo, hi) in enumerate(zip(first.tolist(), last.tolist())):
+        if hi <= lo:
+            continue
+        count = min(int(rng.integers(arrivals_per_departure[0], arrivals_per_departure[1] + 1)), hi - lo)
+        chosen = order[lo + rng.choice(hi - lo, count, replace=False)]
+        pairs_arr.append(chosen)
+        pairs_dep.append(np.full(len(chosen), dep))
+    pairs_arr = np.concatenate(pairs_arr) if pairs_arr else np.zeros(0, dtype=np.int64)
+    pairs_dep = np.concatenate(pairs_dep) if pairs_dep else np.zeros(0, dtype=np.int64)
+    # one row per wagon
+    counts = rng.integers(wagons[0], wagons[1] + 1, len(pairs_arr))
+    wagon_arr, wagon_dep = np.repeat(pairs_arr, counts), np.repeat(pairs_dep, counts)
+
+    dates = np.array([(start + timedelta(days=day)).strftime('%d/%m/%Y') for day in range(days + 1)])
+    return {
+        'Chantiers': pd.DataFrame({
+            'Chantier': list(MAX_VOIES),
+            'Nombre de voies': np.array([math.ceil(voies * voies_scale) for voies in MAX_VOIES.values()], dtype=np.int64),
+            'Indisponibilites': pd.Series([_unavailabilities(rng, unavailability) for _ in MAX_VOIES], dtype=object),
+        }),
+        'Machines': pd.DataFrame({
+            'Machine': [machine for machine, _ in MACHINES],
+            'Type de tache': [tache for _, tache in MACHINES],
+            'Duree ': np.full(len(MACHINES), machine_duration, dtype=np.int64),
+            'Indisponibilites': pd.Series([_unavailabilities(rng, unavailability) for _ in MACHINES], dtype=object),
+        }),
+        'Sillons arrivee': pd.DataFrame({
+            'n°TRAIN': ARRIVAL_NUMBER + arr_lines, 'HARR': DAY_TIMES[arr_minutes % (24 * 60)], 'JARR': dates[arr_minutes // (24 * 60)],
+        }),
+        'Sillons depart': pd.DataFrame({
+            'n°TRAIN': DEPARTURE_NUMBER + dep_lines, 'HDEP': DAY_TIMES[dep_minutes % (24 * 60)], 'JDEP': dates[dep_minutes // (24 * 60)],
+        }),
+        'Correspondances': pd.DataFrame({
+            'Id wagon': np.arange(1, len(wagon_arr) + 1), 'Jour arrivee': dates[arr_minutes[wagon_arr] // (24 * 60)],
+            'n°Train arrivee': ARRIVAL_NUMBER + arr_lines[wagon_arr], 'Jour depart': dates[dep_minutes[wagon_dep] // (24 * 60)],
+            'n°Train depart': DEPARTURE_NUMBER + dep_lines[wagon_dep],
+        }),
+        'Taches humaines': pd.DataFrame(TACHES, columns=['Type de train', 'Type de tache humaine', 'Lien machine', 'Durée', 'Chantier', 'Ordre']),
+        'Roulements agents': pd.DataFrame({
+            'Roulement': list(rosters),
+            'Jours de la semaine': [jours for jours, _, _, _ in rosters.values()],
+            'Nombre agents': np.array([math.ceil(agents * agents_scale) for _, agents, _, _ in rosters.values()], dtype=np.int64),
+            'Cycles horaires': [cycles for _, _, cycles, _ in rosters.values()],
+            'Connaissances chantiers': [chantiers for _, _, _, chantiers in rosters.values()],
+        }),
+    }
@@ -0,0 +1,261 @@
+import json
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from utils.utils_data import (
+    SHEETS, load_data, calculate_delta_days, format_trains, unavailable_machines, unavailable_chantiers, correspondance_for_depart,
+    find_max_voies, format_taches_humaines
+)
+
+# bumped when the content of the bundle changes, older bundles are compiled again
+FORMAT_VERSION = 4
+# roulements needed by format_taches_humaines
+ROULEMENTS = ['roulement_reception', 'roulement_formation', 'roulement_depart', 'roulement_reception_depart', 'roulement_formation_depart']
+
+
+class TrainTable:
+    """Trains of an instance as typed arrays with dense integer ids: the arrival trains are ids 0 to n_arr-1 in the order
+    of trains_arr, the departure trains follow in the order of trains_dep. The tuple ('ARR'|'DEP', n°TRAIN, minute) stays
+    the key of a train in the models (tupledicts, variable names, results), the ids index the arrays built from them."""
+    __slots__ = ('n_arr', 'kind', 'numero', 'minute', '_ids')
+    KINDS = ('ARR', 'DEP')
+
+    def __init__(self, arr_numeros, arr_minutes, dep_numeros, dep_minutes):
+        self.n_arr = len(arr_numeros)
+        self.kind = np.concatenate([np.zeros(len(arr_numeros), dtype=np.int8), np.ones(len(dep_numeros), dtype=np.int8)])
+        self.numero = np.concatenate([np.asarray(arr_numeros), np.asarray(dep_numeros)])
+        self.minute = np.concatenate([np.asarray(arr_minutes, dtype=np.int64), np.asarray(dep_minutes, dtype=np.int64)])
+        self._ids = None
+
+    @classmethod
+    def from_trains(cls, trains_arr, trains_dep):
+        return cls([train[1] for train in trains_arr], [train[2] for train in trains_arr], [train[1] for train in trains_dep], [train[2] for train in trains_dep])
+
+    def __len__(self):
+        return len(self.kind)
+
+    def keys(self):
+        """Tuple of each train, in the order of the ids"""
+        return list(zip([self.KINDS[kind] for kind in self.kind.tolist()], self.numero.tolist(), self.minute.tolist()))
+
+    def ids(self, trains):
+        """Ids of a list of train tuples"""
+        if self._ids is None:
+            self._ids = {train: i for i, train in enumerate(self.keys())}
+        return np.fromiter((self._ids[train] for train in trains), dtype=np.int64, count=len(trains))
+
+    def positions(self, trains):
+        """Index of each train in trains_arr or trains_dep"""
+        ids = self.ids(trains)
+        return np.where(self.kind[ids] == 1, ids - self.n_arr, ids)
+
+
+class TaskCatalog:
+    """Human tasks of the arrival and departure trains as typed arrays (order, duration, chantier), the rows of
+    arr_taches/dep_taches being converted once instead of by each user of the mixed string arrays."""
+    __slots__ = ('arr_orders', 'arr_durees', 'arr_chantiers', 'dep_orders', 'dep_durees', 'dep_chantiers')
+
+    def __init__(self, arr_taches, dep_taches):
+        arr_taches, dep_taches = np.asarray(arr_taches), np.asarray(dep_taches)
+        self.arr_orders, self.arr_durees = arr_taches[:, 0].astype(np.int64), arr_taches[:, 1].astype(np.int64)
+        self.dep_orders, self.dep_durees = dep_taches[:, 0].astype(np.int64), dep_taches[:, 1].astype(np.int64)
+        self.arr_chantiers, self.dep_chantiers = arr_taches[:, 2].astype(str), dep_taches[:, 2].astype(str)
+
+
+class Instance:
+    """Parsed instance: the values returned by the utils_data functions, as attributes named like in the models."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def parse_instance(fichier, required=None):
+    """Parse the xlsx instance with the utils_data functions. The human tasks are None if the instance has no roulements.
+    required: sheets the file must have (load_data), all if None"""
+    return parse_sheets(load_data(fichier, required))
+
+
+def parse_sheets(sheets):
+    """Instance of the DataFrames of the sheets of an instance, in the order of SHEETS (load_data, or the synthetic
+    instances of utils_generator without writing them to xlsx first), None for a sheet the instance does not have"""
+    chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df, taches_humaines_df, roulements_agents_df = sheets
+    j1, jours, first_day = calculate_delta_days(sillons_depart_df, sillons_arrivee_df)
+    trains, trains_arr, trains_dep, minutes, machines, machines_durees, minute_slots, chantiers = format_trains(
+        machines_df, sillons_arrivee_df, sillons_depart_df, chantiers_df, j1, jours, first_day
+    )
+    unavailable_periods, start_times = unavailable_machines(machines_df, jours, first_day)
+    unavailable_periods_chantiers, start_times_chantiers = unavailable_chantiers(chantiers_df, jours, first_day)
+    fields = dict(
+        j1=j1, jours=jours, first_day=first_day,
+        trains=trains, trains_arr=trains_arr, trains_dep=trains_dep, minutes=minutes, machines=machines,
+        machines_durees=machines_durees, minute_slots=minute_slots, chantiers=chantiers,
+        unavailable_periods=unavailable_periods, start_times=start_times,
+        unavailable_periods_chantiers=unavailable_periods_chantiers, start_times_chantiers=start_times_chantiers,
+        trains_requis_dict=correspondance_for_depart(trains_dep, trains_arr, correspondances_df, j1),
+        max_voies=find_max_voies(chantiers_df),
+        roulements=roulements_agents_df['Roulement'].to_list() if roulements_agents_df is not None else [],
+        train_table=TrainTable.from_trains(trains_arr, trains_dep),
+        sheets=[sheet for sheet, df in zip(SHEETS, sheets) if df is not None],
+        arr_taches=None, dep_taches=None, envelopes_agents=None, nombre_agents=None, max_agents=None, arr_taches_dict=None, dep_taches_dict=None,
+        tasks=None,
+    )
+    if taches_humaines_df is not None and set(ROULEMENTS) <= set(fields['roulements']):
+        (
+            fields['arr_taches'], fields['dep_taches'], fields['envelopes_agents'], fields['nombre_agents'], fields['max_agents'],
+            fields['arr_taches_dict'], fields['dep_taches_dict']
+        ) = format_taches_humaines(taches_humaines_df, roulements_agents_df, jours, first_day, minute_slots)
+        fields['tasks'] = TaskCatalog(fields['arr_taches'], fields['dep_taches'])
+    return Instance(**fields)
+
+
+def bundle_path(fichier):
+    """Folder of the compiled instance of an xlsx file, next to it"""
+    return Path(fichier).with_suffix('.instance')
+
+
+def _periods_arrays(periods):
+    """{resource: [([start, start2], [end, end2])]} to a resource list and an (n, 5) array (resource index, start, start2, end, end2)"""
+    resources = list(periods)
+    rows = [(index, *start, *end) for index, resource in enumerate(resources) for start, end in periods[resource]]
+    return resources, np.array(rows, dtype=np.int64).reshape(-1, 5)
+
+
+def _periods_from_arrays(resources, rows):
+    """Inverse of _periods_arrays, with the start times returned by unavailable_machines/unavailable_chantiers"""
+    periods = {resource: [] for resource in resources}
+    for index, start, start2, end, end2 in rows.tolist():
+        periods[resources[index]].append(([start, start2], [end, end2]))
+    start_times = []
+    for resource, resource_periods in periods.items():
+        for start, _ in resource_periods:
+            start_times.append((start[0], resource))
+            if start[1] != 0:
+                start_times.append((start[1], resource))
+    return periods, start_times
+
+
+def compile_instance(fichier, instance=None):
+    """Write the compiled instance of an xlsx file: one .npy file per typed array and meta.json for the names and scalars.
+    The arrays are uncompressed so load_instance can memory-map them. Returns the folder of the bundle."""
+    instance = instance or parse_instance(fichier)
+    folder = bundle_path(fichier)
+    folder.mkdir(parents=True, exist_ok=True)
+    position = {train: i for i, train in enumerate(instance.trains_arr)}
+    machines, machine_rows = _periods_arrays(instance.unavailable_periods)
+    chantiers, chantier_rows = _periods_arrays(instance.unavailable_periods_chantiers)
+    arrays = {
+        'trains_arr_id': np.array([train[1] for train in instance.trains_arr]),
+        'trains_arr_minute': np.array([train[2] for train in instance.trains_arr], dtype=np.int64),
+        'trains_dep_id': np.array([train[1] for train in instance.trains_dep]),
+        'trains_dep_minute': np.array([train[2] for train in instance.trains_dep], dtype=np.int64),
+        'machines_durees': np.array(instance.machines_durees),
+        'max_voies': np.array(instance.max_voies),
+        'unavailable_machines': machine_rows,
+        'unavailable_chantiers': chantier_rows,
+        # (index of the departure train, index of a required arrival train), in the order of trains_requis_dict
+        'correspondances': np.array(
+            [(i, position[train_arr]) for i, train in enumerate(instance.trains_dep) for train_arr in instance.trains_requis_dict[train]], dtype=np.int64
+        ).reshape(-1, 2),
+    }
+    meta = {
+        'format_version': FORMAT_VERSION, 'j1': instance.j1.isoformat(), 'jours': int(instance.jours), 'first_day': int(instance.first_day),
+        'machines': instance.machines, 'chantiers': instance.chantiers, 'roulements': instance.roulements,
+        'unavailable_machines': machines, 'unavailable_chantiers': chantiers, 'taches': instance.arr_taches is not None,
+        'sheets': instance.sheets,
+    }
+    if instance.arr_taches is not None:
+        taches_rows = [
+            (train_type, order, *tache) for train_type, taches_dict in [('ARR', instance.arr_taches_dict), ('DEP', instance.dep_taches_dict)]
+            for order, taches in taches_dict.items() for tache in taches
+        ]
+        envelopes = [
+            (instance.roulements.index(roulement), start, end) for roulement, periods in instance.envelopes_agents.items() for start, end in periods
+        ]
+        arrays |= {
+            'arr_taches': np.asarray(instance.arr_taches),
+            'dep_taches': np.asarray(instance.dep_taches),
+            'taches_dict_order': np.array([row[1] for row in taches_rows], dtype=np.int64),
+            'taches_dict_duree': np.array([row[2] for row in taches_rows]),
+            'taches_dict_text': np.array([(row[0], row[3], row[4]) for row in taches_rows], dtype=str).reshape(-1, 3),
+            'envelopes': np.array(envelopes, dtype=np.int64).reshape(-1, 3),
+            'nombre_agents': np.asarray(instance.nombre_agents),
+            'max_agents': np.array([instance.max_agents[key] for key in instance.max_agents], dtype=np.int64),
+        }
+        meta['max_agents'] = list(instance.max_agents)
+    for name, array in arrays.items():
+        np.save(folder / f'{name}.npy', array)
+    # meta.json is written last, its time is the time of the bundle
+    with open(folder / 'meta.json', 'w') as file:
+        json.dump(meta, file)
+    return folder
+
+
+def read_bundle(folder):
+    """Instance from a compiled bundle, the arrays being memory-mapped"""
+    folder = Path(folder)
+    with open(folder / 'meta.json') as file:
+        meta = json.load(file)
+    arrays = {path.stem: np.load(path, mmap_mode='r') for path in folder.glob('*.npy')}
+    trains_arr = list(zip(['ARR'] * len(arrays['trains_arr_id']), arrays['trains_arr_id'].tolist(), arrays['trains_arr_minute'].tolist()))
+    trains_dep = list(zip(['DEP'] * len(arrays['trains_dep_id']), arrays['trains_dep_id'].tolist(), arrays['trains_dep_minute'].tolist()))
+    trains_requis_dict = {train: [] for train in trains_dep}
+    for i, j in arrays['correspondances'].tolist():
+        trains_requis_dict[trains_dep[i]].append(trains_arr[j])
+    unavailable_periods, start_times = _periods_from_arrays(meta['unavailable_machines'], arrays['unavailable_machines'])
+    unavailable_periods_chantiers, start_times_chantiers = _periods_from_arrays(meta['unavailable_chantiers'], arrays['unavailable_chantiers'])
+    jours = meta['jours']
+    fields = dict(
+        j1=datetime.fromisoformat(meta['j1']), jours=jours, first_day=meta['first_day'],
+        trains=trains_arr + trains_dep, trains_arr=trains_arr, trains_dep=trains_dep,
+        minutes=list(range(0, 24 * 60 * (jours+1))), machines=meta['machines'], machines_durees=arrays['machines_durees'].tolist(),
+        minute_slots=list(range(0, 24 * 4 * (jours+1))), chantiers=meta['chantiers'],
+        unavailable_periods=unavailable_periods, start_times=start_times,
+        unavailable_periods_chantiers=unavailable_periods_chantiers, start_times_chantiers=start_times_chantiers,
+        trains_requis_dict=trains_requis_dict, max_voies=np.asarray(arrays['max_voies']), roulements=meta['roulements'], sheets=meta['sheets'],
+        train_table=TrainTable(arrays['trains_arr_id'], arrays['trains_arr_minute'], arrays['trains_dep_id'], arrays['trains_dep_minute']),
+        arr_taches=None, dep_taches=None, envelopes_agents=None, nombre_agents=None, max_agents=None, arr_taches_dict=None, dep_taches_dict=None,
+        tasks=None,
+    )
+    if meta['taches']:
+        taches_dicts = {'ARR': {}, 'DEP': {}}
+        for order, duree, (train_type, chantier, type_tache) in zip(
+            arrays['taches_dict_order'].tolist(), arrays['taches_dict_duree'].tolist(), arrays['taches_dict_text'].tolist()
+        ):
+            taches_dicts[train_type].setdefault(order, []).append([duree, chantier, type_tache])
+        envelopes_agents = {roulement: [] for roulement in meta['roulements']}
+        for roulement, start, end in arrays['envelopes'].tolist():
+            envelopes_agents[meta['roulements'][roulement]].append((start, end))
+        fields |= dict(
+            arr_taches=np.asarray(arrays['arr_taches']), dep_taches=np.asarray(arrays['dep_taches']), envelopes_agents=envelopes_agents,
+            nombre_agents=np.asarray(arrays['nombre_agents']),
+            max_agents={key: row.tolist() for key, row in zip(meta['max_agents'], arrays['max_agents'])},
+            arr_taches_dict=taches_dicts['ARR'], dep_taches_dict=taches_dicts['DEP'],
+            tasks=TaskCatalog(arrays['arr_taches'], arrays['dep_taches']),
+        )
+    return Instance(**fields)
+
+
+def is_fresh(fichier):
+    """True if the compiled bundle of fichier exists, is newer than it (or fichier was never written) and has the current format"""
+    meta_path = bundle_path(fichier) / 'meta.json'
+    if not meta_path.exists() or Path(fichier).exists() and meta_path.stat().st_mtime <= Path(fichier).stat().st_mtime:
+        return False
+    with open(meta_path) as file:
+        return json.load(file).get('format_version') == FORMAT_VERSION
+
+
+def load_instance(fichier, required=None):
+    """Instance of an xlsx file, read from its compiled bundle when it is fresher than the file, else parsed and compiled.
+    required: sheets the file must have, all the sheets of SHEETS if None, the others being read if the file has them"""
+    if is_fresh(fichier):
+        instance = read_bundle(bundle_path(fichier))
+        missing = [sheet for sheet in (SHEETS if required is None else required) if sheet not in instance.sheets]
+        if missing:
+            raise ValueError(f'Worksheets {missing} not found in {fichier}')
+        return instance
+    instance = parse_instance(fichier, required)
+    try:
+        compile_instance(fichier, instance)
+    except OSError as error:
+        print(f'Compiled instance not written: {error}')
+    return instance
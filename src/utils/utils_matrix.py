@@ -0,0 +1,189 @@
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB, QuadExpr
+
+
+def _term_values(term, n):
+    """Split a term (vars, index, coef, offset) into its variable part and constant part"""
+    variables, index, coef, offset = term
+    offset = np.broadcast_to(np.asarray(offset, dtype=float), (n,)).copy()
+    if variables is None:
+        return None, offset
+    return (variables, np.asarray(index), coef), offset
+
+
+def _add_sparse_rows(model, columns, blocks, sense, rhs, name):
+    """Assemble one coefficient per block and per row into a csr matrix and add it with addMConstr"""
+    n = len(rhs)
+    rows, cols, vals = [], [], []
+    for col_idx, coefs in blocks:
+        coefs = np.broadcast_to(np.asarray(coefs, dtype=float), (n,))
+        keep = coefs != 0
+        rows.append(np.arange(n)[keep])
+        cols.append(np.asarray(col_idx)[keep])
+        vals.append(coefs[keep])
+    A = sp.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n, len(columns))
+    )
+    return model.addMConstr(A, columns, sense, np.asarray(rhs, dtype=float), name=name)
+
+
+def _add_product_rows(model, term_var, occ, offset, sense, rhs, name):
+    """Add the rows coef*vars[index]*occ + offset*occ (sense) rhs, one per entry of occ, named name[i] as addMConstr names
+    them. Each row is a QuadExpr added with addQConstr: the same rows built as one MQuadExpr take 3 to 4 times longer."""
+    variables, index, coef = term_var
+    n = len(occ)
+    coef, offset, rhs = (np.broadcast_to(np.asarray(values, dtype=float), (n,)).tolist() for values in (coef, offset, rhs))
+    for i, (var, occ_var, var_coef, occ_coef, row_rhs) in enumerate(zip([variables[j] for j in np.asarray(index).tolist()], occ, coef, offset, rhs)):
+        expr = QuadExpr()
+        expr.addTerms(var_coef, var, occ_var)
+        expr.addTerms(occ_coef, occ_var)
+        model.addQConstr(expr, sense, row_rhs, name=f'{name}[{i}]')
+
+
+def add_pair_rows(model, first, second, coef, sense, rhs, name):
+    """Matrix version of the rows first[i] + coef[i]*second[i] (sense) rhs[i], first and second aligned lists of Vars"""
+    n = len(first)
+    if n == 0:
+        return
+    entries = np.arange(n)
+    return _add_sparse_rows(model, list(first) + list(second), [(entries, 1), (n + entries, coef)], sense, rhs, name)
+
+
+def add_occupation_rows(model, occ, x, y, slots, start, end, ref, M, name):
+    """Matrix version of the 5 rows relating an occupation binary to a [start, end] interval.
+
+    occ, x, y are aligned lists of Vars (one entry per (train, ..., slot)), slots the slot of each entry.
+    start and end are terms (vars, index, coef, offset) worth coef*vars[index] + offset, vars being None for constants.
+    ref is the term compared to the slot in the x row ('start' for chantier occupation, 'end' for tasks in progress).
+    M is the big-M of rows 2, 3 and 4: one number, or a tuple of 3 numbers or arrays (one value per entry).
+    Rows, in the same order as the tupledict builders:
+        start*occ <= slot
+        slot <= end*occ + M(1-occ)
+        slot - ref <= M*x
+        end - slot <= M*y
+        occ >= x + y - 1
+    """
+    n = len(occ)
+    if n == 0:
+        return
+    slots = np.asarray(slots, dtype=float)
+    M_end, M_ref, M_y = (np.broadcast_to(np.asarray(m, dtype=float), (n,)).copy() for m in (M if isinstance(M, tuple) else (M, M, M)))
+    start_var, start_offset = _term_values(start, n)
+    end_var, end_offset = _term_values(end, n)
+    ref_var, ref_offset = (start_var, start_offset) if ref == 'start' else (end_var, end_offset)
+
+    # columns: occ | x | y | unique vars of the start and end terms
+    entries = np.arange(n)
+    columns = list(occ) + list(x) + list(y)
+    term_cols = {}
+    for term_var in (start_var, end_var):
+        if term_var is not None and id(term_var[0]) not in term_cols:
+            term_cols[id(term_var[0])] = len(columns)
+            columns.extend(term_var[0])
+
+    # start*occ <= slot
+    if start_var is None:
+        _add_sparse_rows(model, columns, [(entries, start_offset)], GRB.LESS_EQUAL, slots, f'{name}_1')
+    else:
+        _add_product_rows(model, start_var, occ, start_offset, GRB.LESS_EQUAL, slots, f'{name}_1')
+
+    # slot <= end*occ + M(1-occ)
+    if end_var is None:
+        _add_sparse_rows(model, columns, [(entries, end_offset - M_end)], GRB.GREATER_EQUAL, slots - M_end, f'{name}_2')
+    else:
+        _add_product_rows(model, end_var, occ, end_offset - M_end, GRB.GREATER_EQUAL, slots - M_end, f'{name}_2')
+
+    # slot - ref <= M*x
+    blocks = [(n + entries, M_ref)]
+    if ref_var is not None:
+        blocks.append((term_cols[id(ref_var[0])] + ref_var[1], ref_var[2]))
+    _add_sparse_rows(model, columns, blocks, GRB.GREATER_EQUAL, slots - ref_offset, f'{name}_3')
+
+    # end - slot <= M*y
+    blocks = [(2 * n + entries, -M_y)]
+    if end_var is not None:
+        blocks.append((term_cols[id(end_var[0])] + end_var[1], end_var[2]))
+    _add_sparse_rows(model, columns, blocks, GRB.LESS_EQUAL, slots - end_offset, f'{name}_4')
+
+    # occ >= x + y - 1
+    _add_sparse_rows(model, columns, [(entries, 1), (n + entries, -1), (2 * n + entries, -1)], GRB.GREATER_EQUAL, -np.ones(n), f'{name}_5')
+
+
+def add_slot_sum_rows(model, variables, slots, minute_slots, sense, rhs, name, extra=None):
+    """Matrix version of one row per slot summing the given variables of that slot.
+
+    extra is an optional list of (vars, coefs) where vars[i] is added with coefs[i] to the row of minute_slots[i].
+    """
+    slot_pos = {slot: i for i, slot in enumerate(minute_slots)}
+    rows = np.fromiter((slot_pos[slot] for slot in slots), dtype=int, count=len(slots))
+    columns = list(variables)
+    row_idx, col_idx, vals = [rows], [np.arange(len(columns))], [np.ones(len(columns))]
+    for extra_vars, extra_coefs in extra or []:
+        extra_coefs = np.asarray(extra_coefs, dtype=float)
+        keep = extra_coefs != 0
+        row_idx.append(np.arange(len(minute_slots))[keep])
+        col_idx.append(len(columns) + np.arange(len(extra_vars))[keep])
+        vals.append(extra_coefs[keep])
+        columns.extend(extra_vars)
+    A = sp.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(row_idx), np.concatenate(col_idx))),
+        shape=(len(minute_slots), len(columns))
+    )
+    rhs = np.broadcast_to(np.asarray(rhs, dtype=float), (len(minute_slots),))
+    return model.addMConstr(A, columns, sense, rhs, name=name)
+
+
+def _canonical_rows(model):
+    """Return the constraints of a model as a sorted list of sense-normalised rows, independent of names and order"""
+    model.update()
+    rows = []
+    for constr in model.getConstrs():
+        row = model.getRow(constr)
+        terms = [(row.getVar(i).VarName, row.getCoeff(i)) for i in range(row.size())]
+        rows.append(_normalise(terms, [], constr.Sense, constr.RHS))
+    for qconstr in model.getQConstrs():
+        qrow = model.getQCRow(qconstr)
+        lin = qrow.getLinExpr()
+        terms = [(lin.getVar(i).VarName, lin.getCoeff(i)) for i in range(lin.size())]
+        qterms = [
+            (tuple(sorted((qrow.getVar1(i).VarName, qrow.getVar2(i).VarName))), qrow.getCoeff(i))
+            for i in range(qrow.size())
+        ]
+        rows.append(_normalise(terms, qterms, qconstr.QCSense, qconstr.QCRHS))
+    return sorted(rows)
+
+
+def _normalise(terms, qterms, sense, rhs):
+    """Turn >= rows into <= rows and drop zero coefficients so both build paths compare equal"""
+    sign = -1 if sense == GRB.GREATER_EQUAL else 1
+    sense = GRB.LESS_EQUAL if sense == GRB.GREATER_EQUAL else sense
+    merged = {}
+    for key, coef in terms + qterms:
+        merged[key] = merged.get(key, 0) + coef
+    coefs = tuple(sorted((str(key), round(sign * coef, 9)) for key, coef in merged.items() if round(coef, 9) != 0))
+    return (sense, coefs, round(sign * rhs, 9))
+
+
+def compare_models(model_a, model_b):
+    """Check that two built models have the same constraints, whatever the build path used.
+    Returns the list of rows found in only one of the two models (empty if equivalent)."""
+    rows_a = _canonical_rows(model_a)
+    rows_b = _canonical_rows(model_b)
+    only_a, only_b = [], []
+    i = j = 0
+    while i < len(rows_a) and j < len(rows_b):
+        if rows_a[i] == rows_b[j]:
+            i += 1
+            j += 1
+        elif rows_a[i] < rows_b[j]:
+            only_a.append(rows_a[i])
+            i += 1
+        else:
+            only_b.append(rows_b[j])
+            j += 1
+    only_a.extend(rows_a[i:])
+    only_b.extend(rows_b[j:])
+    print(f'{len(rows_a)} rows vs {len(rows_b)} rows, {len(only_a)} only in the first model, {len(only_b)} only in the second')
+    return only_a + only_b
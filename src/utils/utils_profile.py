@@ -0,0 +1,157 @@
+import resource
+import time as tme
+import tracemalloc
+import pandas as pd
+
+# columns of the build profile, one row per builder
+COLUMNS = ['family', 'phase', 'time', 'python_peak_mb', 'rss_peak_delta_mb', 'variables', 'constraints', 'nonzeros']
+
+
+def _rss_peak_mb():
+    """Peak resident memory of the process (MB), Gurobi allocations included"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _model_size(model):
+    """(variables, linear and quadratic constraints, nonzeros) of a gurobipy model, pending changes applied"""
+    model.update()
+    return model.NumVars, model.NumConstrs + model.NumQConstrs + model.NumGenConstrs, model.NumNZs + model.NumQCNZs
+
+
+class BuildProfiler:
+    """Wall time, memory and model size added by each builder (define_*) of a model.
+
+    run(builder, *args) calls the builder and, if enabled, records its time, the peak of the Python allocations during
+    the call (tracemalloc), the growth of the peak resident memory of the process, and the variables, constraints and
+    nonzeros it added to the model (model.update() after each builder, its time being counted in the builder's).
+    Disabled, run only calls the builder."""
+
+    def __init__(self, model, enabled=False):
+        self.model = model
+        self.enabled = enabled
+        self.records = []
+
+    def run(self, builder, *args, phase='constraints'):
+        if not self.enabled:
+            return builder(*args)
+        size = _model_size(self.model)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        python_start = tracemalloc.get_traced_memory()[0]
+        rss_start = _rss_peak_mb()
+        start = tme.time()
+        result = builder(*args)
+        added = [after - before for after, before in zip(_model_size(self.model), size)]
+        self.records.append(dict(zip(COLUMNS, [
+            builder.__name__.removeprefix('define_'), phase, tme.time() - start,
+            (tracemalloc.get_traced_memory()[1] - python_start) / 2**20, _rss_peak_mb() - rss_start, *added
+        ])))
+        if not tracing:
+            tracemalloc.stop()
+        return result
+
+    def report(self):
+        """DataFrame of the records, the most expensive builders first"""
+        return pd.DataFrame(self.records, columns=COLUMNS).sort_values('time', ascending=False, ignore_index=True)
+
+
+def _slots(windows):
+    """Variables of add_window_vars over slot windows (first, last)"""
+    return sum(max(0, last - first + 1) for first, last in windows.values())
+
+
+def estimate_build(model):
+    """Variables, constraints and nonzeros of each builder of ModelJalon3, estimated from the dimensions of the instance
+    and the time windows of model (a ModelJalon3 built with dry_run=True, nothing added to the gurobipy model).
+
+    Exact for the variables and the constraints of the slot formulation, the nonzeros counting one per variable of a row
+    (a product start time * binary of the occupation rows counting as one). The pairs of the event formulation depend
+    on the overlaps of the windows, its builders are left empty (None)."""
+    A, D = len(model.trains_arr), len(model.trains_dep)
+    T, S = A + D, len(model.minute_slots)
+    oa, od = len(model.arr_orders), len(model.dep_orders)
+    E = {roulement: len(model.envelopes_agents.get(roulement, [])) for roulement in [
+        'roulement_reception', 'roulement_formation', 'roulement_depart', 'roulement_reception_depart', 'roulement_formation_depart'
+    ]}
+    e_rec, e_for, e_dep, e_rd, e_fd = E.values()
+    slot = model.capacity_mode == 'slot'
+    R, F, P = _slots(model.rec_slots), _slots(model.for_slots), _slots(model.dep_slots)
+    F_dep = _slots({key: window for key, window in model.for_slots.items() if key[0] == 'DEP'})
+    Ta = _slots(model.task_arr_slots)
+    Td_for = _slots({key: window for key, window in model.task_dep_slots.items() if key[3] in model.dep_orders[:-1]})
+    Td = _slots(model.task_dep_slots)
+    pairs = len(model.deb_pairs) + len(model.for_pairs) + len(model.deg_pairs)
+    machine_periods = len(model.d_periods) + len(model.e_periods) + len(model.f_periods)
+    chantier_periods = len(model.chant_d_periods) + len(model.chant_e_periods) + len(model.chant_f_periods)
+    task_periods = len(model.th_arr_periods) + len(model.th_dep_periods)
+    envelope_taches = e_rec*A*oa + (e_for + e_dep)*D*od + (e_rd + e_fd)*T*od
+    requis = sum(len(trains_requis) for trains_requis in model.trains_requis_dict.values())
+    # tasks assigned to an envelope, and (envelope, task) pairs placed by 21.1
+    tasks = A*oa + D*od
+    placements = e_rec*A*oa + e_for*D*(od - 1) + e_dep*D + e_rd*(A*(od - 1) + D) + e_fd*D*od
+    activity = sum(len(model.envelope_slots.slots(roulement, i)) for roulement in E for i in range(E[roulement]))
+
+    # (family, phase, variables, constraints, nonzeros)
+    rows = [
+        ('time_windows', 'variables', 0, 0, 0),
+        ('decision_variables', 'variables', A + 2*D + A*oa + D*od + 3 + envelope_taches + 1, 0, 0),
+        ('auxiliary_variables', 'variables', A*oa + D*od + (R + F + P + Ta + Td + 5*S if slot else 0) + sum(E.values()), 0, 0),
+        ('extra_variables', 'variables', machine_periods + 2*pairs + chantier_periods + task_periods + 2*envelope_taches
+            + (2*(R + F + P) + 2*(Ta + Td) if slot else 0), 0, 0),
+        ('unavailability_machines_constraints', 'constraints', 0, 2*machine_periods, 4*machine_periods),
+        ('unavailability_chantier_constraints', 'constraints', 0, 2*(chantier_periods + task_periods), 4*(chantier_periods + task_periods)),
+        ('single_train_per_machine_constraints', 'constraints', 0, 3*pairs, 8*pairs),
+        ('task_time_slots_constraint', 'constraints', 0, A*len(model.arr_taches) + D*len(model.dep_taches), 2*(A*len(model.arr_taches) + D*len(model.dep_taches))),
+        ('arr_start_constraint', 'constraints', 0, A, A),
+        ('arr_tri_constraint', 'constraints', 0, A, 2*A),
+        ('tri_deb_constraint', 'constraints', 0, A, 2*A),
+        ('DEB_parallel_constraint', 'constraints', 0, A, 2*A),
+        ('for_after_deb_constraint', 'constraints', 0, requis, 2*requis),
+        ('FOR_parallel_constraint', 'constraints', 0, D, 2*D),
+        ('attelage_FOR_constraint', 'constraints', 0, D, 2*D),
+        ('DEG_attelage_constraint', 'constraints', 0, D, 2*D),
+        ('DEG_parallel_constraint', 'constraints', 0, D, 2*D),
+        ('frein_DEG_constraint', 'constraints', 0, D, 2*D),
+        ('dep_final_constraint', 'constraints', 0, D, D),
+    ]
+    if not slot:
+        rows += [('voies_events', 'constraints', None, None, None)]
+    elif model.build_mode == 'matrix':
+        rows += [
+            ('voies_matrix', 'constraints', 0, 6*S, R + F_dep + P + R + F + P + 3*S),
+            ('occupation_relation_matrix', 'constraints', 0, 5*(R + F + P), 10*(R + F + P)),
+            ('task_in_progress_matrix', 'constraints', 0, 5*(Ta + Td), 10*(Ta + Td)),
+        ]
+    else:
+        rows += [
+            ('max_voies_constraint', 'constraints', 0, 3*S, R + F_dep + P),
+            ('calculate_max_voies_used', 'constraints', 0, 3*S, R + F + P + 3*S),
+            ('REC_occupation_relation_constraints', 'constraints', 0, 5*R, 10*R),
+            ('FOR_occupation_relation_constraints', 'constraints', 0, 5*F, 10*F),
+            ('DEP_occupation_relation_constraints', 'constraints', 0, 5*P, 10*P),
+            ('task_in_progress_rec_relation_constraint', 'constraints', 0, 5*Ta, 10*Ta),
+            ('task_in_progress_for_relation_constraint', 'constraints', 0, 5*Td_for, 10*Td_for),
+            ('task_in_progress_dep_relation_constraint', 'constraints', 0, 5*(Td - Td_for), 10*(Td - Td_for)),
+        ]
+    rows += [
+        ('assign_task_to_envelope', 'constraints', 0, tasks, (e_rec + e_rd)*A*oa + (e_for + e_fd)*D*(od - 1) + (e_dep + e_rd + e_fd)*D),
+        ('all_placements_matrix' if model.build_mode == 'matrix' else 'all_placements', 'constraints', 0, 2*placements, 4*placements),
+    ]
+    if not slot:
+        rows += [('max_agent_events', 'constraints', None, None, None)]
+    else:
+        rows += [
+            ('all_envelope_activity', 'constraints', 0, activity, 2*activity),
+            ('max_agent_matrix' if model.build_mode == 'matrix' else 'max_agent_constraint', 'constraints', 0, 3*S, Ta + Td + 7*S),
+        ]
+    usage = e_rec*(A*oa + 1) + e_for*(D*(od - 1) + 1) + e_dep*(D + 1) + e_rd*(A*(od - 1) + D + 1) + e_fd*(D*od + 1)
+    rows += [
+        ('usage_relation_constraint', 'constraints', 0, 2*sum(E.values()), 2*usage),
+        ('total_usage', 'constraints', 0, 1, sum(E.values()) + 1),
+    ]
+    return pd.DataFrame(
+        [dict(zip(COLUMNS, [family, phase, None, None, None, variables, constraints, nonzeros])) for family, phase, variables, constraints, nonzeros in rows],
+        columns=COLUMNS
+    )
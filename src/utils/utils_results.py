@@ -0,0 +1,119 @@
+import os
+from datetime import date, datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from utils.utils_date import minutes_to_date2
+
+# formats of the results files, RESULTS_FORMAT in .env
+RESULTS_FORMATS = ('parquet', 'csv', 'xlsx')
+
+
+def machine_tasks_frame(trains_arr, trains_dep, a, b, c, machines, machines_durees, j1):
+    """'Taches machine' sheet of the models: the DEB of each arrival train, then the FOR and DEG of each departure train.
+    a, b, c are the start times aligned with trains_arr and trains_dep, all converted to dates in one call."""
+    machine = np.concatenate([np.zeros(len(trains_arr), dtype=np.int64), np.tile([1, 2], len(trains_dep))])
+    starts = np.concatenate([np.asarray(a, dtype=float), np.column_stack([np.asarray(b, dtype=float), np.asarray(c, dtype=float)]).reshape(-1)])
+    sillons = [train[1] for train in trains_arr] + [train[1] for train in trains_dep for _ in range(2)]
+    types = np.asarray(machines)[machine].tolist()
+    jours, horaires = minutes_to_date2(starts, j1)
+    jours = jours.tolist()
+    return pd.DataFrame({
+        'Id tâche': [f'{kind}_{sillon}_{jour}' for kind, sillon, jour in zip(types, sillons, jours)],
+        'Type de tâche': types,
+        'Jour': jours,
+        'Heure début': horaires,
+        'Durée': np.asarray(machines_durees)[machine],
+        'Sillon': sillons,
+    })
+
+
+def results_formats():
+    """Formats written by write_results: RESULTS_FORMAT in .env, comma separated, parquet if unset"""
+    formats = [name.strip() for name in os.getenv('RESULTS_FORMAT', 'parquet').split(',') if name.strip()]
+    unknown = set(formats) - set(RESULTS_FORMATS)
+    if unknown:
+        raise ValueError(f'Unknown RESULTS_FORMAT {sorted(unknown)}, expected {RESULTS_FORMATS}')
+    return formats
+
+
+def sheet_file(sheet):
+    """File name (without extension) of a sheet in the folder of a columnar results file"""
+    return sheet.lower().replace(' ', '_')
+
+
+def _cell(value):
+    """Value of a cell as pandas.to_excel writes it: numbers, bools and dates as is, missing values empty, anything else as str"""
+    if value is None or isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, (bool, int, float, str, date, datetime)):
+        return value
+    return str(value)
+
+
+def _flat(df):
+    """df with the cells of its object columns that are not scalars (task rows, train tuples) as str, for parquet and csv"""
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        df[column] = [_cell(value) for value in df[column].tolist()]
+    return df
+
+
+def write_xlsx(sheets, path):
+    """Write the sheets ({name: (DataFrame, index)}) in one xlsx file with the layout of DataFrame.to_excel, rows being
+    streamed to the file by an openpyxl write-only workbook instead of kept in memory"""
+    workbook = Workbook(write_only=True)
+    for name, (df, index) in sheets.items():
+        sheet = workbook.create_sheet(name)
+        columns = [df[column].tolist() for column in df.columns]
+        if index:
+            sheet.append([df.index.name] + [str(column) for column in df.columns])
+            columns = [df.index.tolist()] + columns
+        else:
+            sheet.append([str(column) for column in df.columns])
+        for row in zip(*columns):
+            sheet.append([_cell(value) for value in row])
+    workbook.save(path)
+
+
+def write_results(sheets, path, formats=None):
+    """Write the sheets ({name: (DataFrame, index)}) of a results file, path being its name without extension.
+
+    parquet and csv write one file per sheet in the folder path/ (sheet_file), xlsx writes path.xlsx with one sheet
+    per DataFrame as display_gantt and verify_train.py read it. parquet needs pyarrow, csv is written instead if it is
+    not installed. Returns the paths written."""
+    path = Path(path)
+    written = []
+    for name in formats or results_formats():
+        if name == 'xlsx':
+            write_xlsx(sheets, path.with_suffix('.xlsx'))
+            written.append(path.with_suffix('.xlsx'))
+            continue
+        path.mkdir(parents=True, exist_ok=True)
+        for sheet, (df, index) in sheets.items():
+            file = path / f'{sheet_file(sheet)}.{name}'
+            if name == 'parquet':
+                try:
+                    _flat(df).to_parquet(file, index=index)
+                except ImportError as error:
+                    print(f'{file} not written ({error}), csv instead')
+                    file = file.with_suffix('.csv')
+                    name = 'csv'
+            if name == 'csv':
+                _flat(df).to_csv(file, index=index)
+            written.append(file)
+    return written
+
+
+def read_results(path, sheet, index_col=None):
+    """DataFrame of a sheet of a results file written by write_results, path with or without the .xlsx extension.
+    The columnar files of the sheet are read first, the xlsx file if there are none (index_col for csv and xlsx)."""
+    path = Path(path)
+    folder = path.with_suffix('') if path.suffix == '.xlsx' else path
+    if (folder / f'{sheet_file(sheet)}.parquet').exists():
+        # the index of the sheet is stored in the parquet file
+        return pd.read_parquet(folder / f'{sheet_file(sheet)}.parquet')
+    if (folder / f'{sheet_file(sheet)}.csv').exists():
+        return pd.read_csv(folder / f'{sheet_file(sheet)}.csv', index_col=index_col)
+    return pd.read_excel(folder.with_suffix('.xlsx'), sheet_name=sheet, index_col=index_col)
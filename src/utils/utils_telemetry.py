@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import pandas as pd
+from gurobipy import GRB, GurobiError
+
+# formats of the telemetry time series, TELEMETRY in .env
+TELEMETRY_FORMATS = ('jsonl', 'csv')
+# columns of a record of the time series
+FIELDS = ['time', 'event', 'incumbent', 'bound', 'gap', 'nodes', 'solutions']
+
+
+def _finite(value):
+    """None for the infinite objectives and bounds Gurobi gives before the first incumbent or bound"""
+    return None if value is None or abs(value) >= GRB.INFINITY else value
+
+
+def mip_gap(incumbent, bound):
+    """Relative gap |bound - incumbent| / |incumbent| as Gurobi computes MIPGap, None without incumbent or bound"""
+    if incumbent is None or bound is None:
+        return None
+    if incumbent == 0:
+        return 0.0 if bound == 0 else float('inf')
+    return abs(bound - incumbent) / abs(incumbent)
+
+
+def chain_callbacks(*callbacks):
+    """One Gurobi callback calling each of callbacks (None ones skipped) in turn, None if there is none"""
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if len(callbacks) <= 1:
+        return callbacks[0] if callbacks else None
+
+    def callback(model, where):
+        for function in callbacks:
+            function(model, where)
+    return callback
+
+
+class SolverTelemetry:
+    """Time series of the progress of a Gurobi solve, recorded by a callback (the instance itself is the callback).
+
+    A record (time, incumbent objective, best bound, gap, node count, solutions) is kept at each new incumbent (MIPSOL)
+    and at most every interval seconds of the branch and bound (MIP), plus a 'final' record from the model attributes.
+    counters holds the last values, served in the Prometheus text format on http://localhost:port/metrics during the
+    solve if port is set. summary() gives the time to the first incumbent and to each gap of gap_targets."""
+
+    def __init__(self, fmt='jsonl', interval=1.0, port=None, gap_targets=(0.05,), sense=GRB.MINIMIZE):
+        if fmt not in TELEMETRY_FORMATS:
+            raise ValueError(f'Unknown telemetry format {fmt}, expected one of {TELEMETRY_FORMATS}')
+        self.fmt = fmt
+        self.interval = interval
+        self.port = port
+        self.gap_targets = gap_targets
+        self.sense = sense
+        self._lock = threading.Lock()
+        self._server = None
+        self._clear()
+
+    def _clear(self):
+        self.records = []
+        self.counters = {'runtime': 0.0, 'incumbent': None, 'bound': None, 'gap': None, 'nodes': 0, 'solutions': 0}
+        self.first_incumbent = None
+        self.gap_times = {gap: None for gap in self.gap_targets}
+        self._last = None
+
+    def start(self):
+        """Clear the records of a previous solve and serve the counters if a port is set, called before optimize"""
+        self._clear()
+        if self.port is not None and self._server is None:
+            self.serve(self.port)
+
+    def __call__(self, model, where):
+        if where == GRB.Callback.MIPSOL:
+            incumbent = _finite(model.cbGet(GRB.Callback.MIPSOL_OBJBST))
+            new = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            # the best objective may not count the new solution yet
+            incumbent = new if incumbent is None else self.sense * min(self.sense * incumbent, self.sense * new)
+            self._record(
+                'incumbent', model.cbGet(GRB.Callback.RUNTIME), incumbent, _finite(model.cbGet(GRB.Callback.MIPSOL_OBJBND)),
+                model.cbGet(GRB.Callback.MIPSOL_NODCNT), model.cbGet(GRB.Callback.MIPSOL_SOLCNT) + 1
+            )
+        elif where == GRB.Callback.MIP:
+            runtime = model.cbGet(GRB.Callback.RUNTIME)
+            if self._last is not None and runtime - self._last < self.interval:
+                return
+            self._record(
+                'progress', runtime, _finite(model.cbGet(GRB.Callback.MIP_OBJBST)), _finite(model.cbGet(GRB.Callback.MIP_OBJBND)),
+                model.cbGet(GRB.Callback.MIP_NODCNT), model.cbGet(GRB.Callback.MIP_SOLCNT)
+            )
+
+    def _record(self, event, runtime, incumbent, bound, nodes, solutions):
+        gap = mip_gap(incumbent, bound)
+        record = dict(zip(FIELDS, [runtime, event, incumbent, bound, gap, nodes, solutions]))
+        with self._lock:
+            self.records.append(record)
+            self.counters = {'runtime': runtime, 'incumbent': incumbent, 'bound': bound, 'gap': gap, 'nodes': nodes, 'solutions': solutions}
+            self._last = runtime
+            if incumbent is not None and self.first_incumbent is None:
+                self.first_incumbent = runtime
+            for target, reached in self.gap_times.items():
+                if reached is None and gap is not None and gap <= target:
+                    self.gap_times[target] = runtime
+
+    def finish(self, model):
+        """Add the final record from the attributes of the solved model and stop serving the counters"""
+        solutions = model.SolCount
+        incumbent = model.ObjVal if solutions > 0 else None
+        try:
+            bound, nodes = _finite(model.ObjBound), model.NodeCount
+        except GurobiError:
+            # no bound when the solve stopped before the root node
+            bound, nodes = None, 0
+        self._record('final', model.Runtime, incumbent, bound, nodes, solutions)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def summary(self):
+        """Times to the first incumbent and to the gap targets (None if not reached), and the final values of the solve"""
+        summary = {'time_to_first_incumbent': self.first_incumbent}
+        summary |= {f'time_to_gap_{100*target:g}%': reached for target, reached in self.gap_times.items()}
+        summary |= {f'final_{name}': value for name, value in self.counters.items()}
+        summary['records'] = len(self.records)
+        return summary
+
+    def save(self, path):
+        """Write the records to path.jsonl or path.csv and the summary to path_summary.json, path being without extension. Returns the paths written."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        records_path = path.with_suffix(f'.{self.fmt}')
+        if self.fmt == 'jsonl':
+            with open(records_path, 'w') as file:
+                file.writelines(json.dumps(record) + '\n' for record in self.records)
+        else:
+            pd.DataFrame(self.records, columns=FIELDS).to_csv(records_path, index=False)
+        summary_path = path.with_name(f'{path.name}_summary.json')
+        with open(summary_path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+        return [records_path, summary_path]
+
+    def metrics(self):
+        """Counters in the Prometheus text format, the values without incumbent or bound being left out"""
+        with self._lock:
+            counters = dict(self.counters)
+        return ''.join(f'gurobi_{name} {value}\n' for name, value in counters.items() if value is not None)
+
+    def serve(self, port):
+        """Serve metrics() on http://localhost:port/metrics from a daemon thread until finish()"""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = telemetry.metrics().encode()
+                self.send_response(200 if self.path == '/metrics' else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.end_headers()
+                if self.path == '/metrics':
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(('localhost', port), Handler)
+        except OSError as error:
+            print(f'Telemetry endpoint not served on port {port}: {error}')
+            return
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f'Telemetry served on http://localhost:{port}/metrics')
+
+
+def solver_telemetry():
+    """SolverTelemetry of the TELEMETRY, TELEMETRY_INTERVAL and TELEMETRY_PORT settings in .env, None if TELEMETRY is unset or 'none'"""
+    fmt = os.getenv('TELEMETRY', 'none')
+    if fmt == 'none':
+        return None
+    port = os.getenv('TELEMETRY_PORT')
+    return SolverTelemetry(fmt, float(os.getenv('TELEMETRY_INTERVAL', 1)), int(port) if port else None)
@@ -0,0 +1,166 @@
+import math
+from bisect import bisect_left, insort
+import numpy as np
+from gurobipy import GRB
+
+
+def is_free(start, intervals, duration, epsilon):
+    """True if a task of `duration` starting at `start` ends before or starts after every unavailable interval, as in constraints 1.x"""
+    return all(start + duration <= lo - epsilon or start >= hi + epsilon for lo, hi, *_ in intervals)
+
+
+class MachineTimeline:
+    """Start times already given to a machine, two trains needing `gap` minutes between their starts (constraint 2)"""
+
+    def __init__(self, gap):
+        self.gap = gap
+        self.starts = []
+
+    def fits(self, start):
+        i = bisect_left(self.starts, start)
+        return (i == len(self.starts) or self.starts[i] - start >= self.gap) and (i == 0 or start - self.starts[i-1] >= self.gap)
+
+    def add(self, start):
+        insort(self.starts, start)
+
+
+class SlotCounter:
+    """Number of trains a chantier holds at each 15 minutes slot, a train occupying the slots strictly inside [start, end]
+    (the ones the occupation constraints force to 1)"""
+
+    def __init__(self, nb_slots, capacity):
+        self.counts = np.zeros(nb_slots, dtype=int)
+        self.capacity = capacity
+
+    def _slots(self, start, end):
+        return max(0, math.floor(start / 15) + 1), max(0, math.ceil(end / 15))
+
+    def fits(self, start, end):
+        first, last = self._slots(start, end)
+        return bool((self.counts[first:last] < self.capacity).all())
+
+    def add(self, start, end):
+        first, last = self._slots(start, end)
+        self.counts[first:last] += 1
+
+
+def greedy_schedule(trains_arr, trains_dep, trains_requis_dict, windows, arr_durees, dep_durees, unavailability, max_voies,
+                    task_envelopes, nb_slots, gap, epsilon, assigned=None):
+    """Constructive schedule of ModelJalon3, without solver.
+
+    Arrival trains are placed by arrival time at the earliest DEB, then departure trains by departure time at the earliest
+    FOR and DEG after the DEB of their required arrivals, each start being tried on the 15 minutes grid of its window.
+    A start is kept if its machine and chantier are available, the machine is free (gap) and the chantiers have a voie
+    left (max_voies). Human tasks are chained with their durations and must fit in an envelope of their roulements, they
+    are then assigned to an envelope already used when possible.
+    windows: the a, b, c, th_arr and th_dep windows of the model, by variable name
+    unavailability: unavailable intervals (unavailable_intervals) of the machines DEB/FOR/DEG and chantiers WPY_REC/WPY_FOR/WPY_DEP
+    task_envelopes: {(train type, order): [(roulement, i, start, end)]} envelopes each task can be assigned to
+    assigned: {train+(order,): (roulement, i)} assignments already fixed
+    Returns {variable name: {key: value}} for a, b, c, th_arr, th_dep, the envelope of each task ('envelopes') and the
+    trains that could not be placed ('unplaced', given the earliest start of their windows)."""
+    unavailable = lambda resource: unavailability.get(resource, [])
+    timelines = {machine: MachineTimeline(gap) for machine in ['DEB', 'FOR', 'DEG']}
+    rec, for_, dep = (SlotCounter(nb_slots, capacity) for capacity in max_voies)
+    values = {name: {} for name in ['a', 'b', 'c', 'th_arr', 'th_dep']}
+    unplaced = []
+
+    def task_fits(key, start):
+        """Task key=train+(order,) starting at start: its chantier is available and an envelope covers it"""
+        duree = (arr_durees if key[0] == 'ARR' else dep_durees)[key[3]-1]
+        chantier = 'WPY_REC' if key[0] == 'ARR' else ('WPY_DEP' if key[3] == len(dep_durees) else 'WPY_FOR')
+        return is_free(start, unavailable(chantier), duree, epsilon) and any(
+            lo <= start and start + duree <= hi for _, _, lo, hi in task_envelopes.get((key[0], key[3]), [])
+        )
+
+    def machine_fits(machine, chantier, start):
+        return timelines[machine].fits(start) and is_free(start, unavailable(machine), 0, epsilon) and is_free(start, unavailable(chantier), 0, epsilon)
+
+    def grid(lo, hi, reverse=False):
+        lo = 15 * math.ceil(lo / 15)
+        return range(15 * math.floor(hi / 15), lo - 1, -15) if reverse else range(lo, hi + 1, 15)
+
+    def first_task(key, earliest=None, latest=None):
+        """Earliest (or latest if latest is given) start of a task in its window"""
+        lo, hi = windows['th_arr' if key[0] == 'ARR' else 'th_dep'][key]
+        starts = grid(lo, min(hi, latest), reverse=True) if latest is not None else grid(max(lo, earliest), hi)
+        return next((start for start in starts if task_fits(key, start)), None)
+
+    for train in sorted(trains_arr, key=lambda train: train[2]):
+        for a in grid(*windows['a'][train]):
+            if not (machine_fits('DEB', 'WPY_REC', a) and rec.fits(train[2], a + 15) and task_fits(train + (3,), a)):
+                continue
+            # reception and tri as late as possible before DEB
+            th2 = first_task(train + (2,), latest=a - arr_durees[1])
+            th1 = first_task(train + (1,), latest=th2 - arr_durees[0]) if th2 is not None else None
+            if th1 is None:
+                continue
+            values['th_arr'] |= {train + (1,): th1, train + (2,): th2, train + (3,): a}
+            break
+        else:
+            unplaced.append(train)
+            a = windows['a'][train][0]
+            values['th_arr'] |= {train + (order,): windows['th_arr'][train + (order,)][0] for order in [1, 2]} | {train + (3,): a}
+        values['a'][train] = a
+        timelines['DEB'].add(a)
+        rec.add(train[2], a + 15)
+
+    for train in sorted(trains_dep, key=lambda train: train[2]):
+        lo, hi = windows['b'][train]
+        lo = max([lo] + [values['a'][train_arr] + 15 for train_arr in trains_requis_dict.get(train, []) if train_arr in values['a']])
+        found = None
+        for b in grid(lo, hi):
+            if not (machine_fits('FOR', 'WPY_FOR', b) and task_fits(train + (1,), b)):
+                continue
+            th2 = first_task(train + (2,), earliest=b + dep_durees[0])
+            if th2 is None:
+                continue
+            for c in grid(max(windows['c'][train][0], th2 + dep_durees[1]), windows['c'][train][1]):
+                if not (machine_fits('DEG', 'WPY_FOR', c) and task_fits(train + (3,), c) and for_.fits(b, c + 15) and dep.fits(c, train[2])):
+                    continue
+                th4 = first_task(train + (4,), earliest=c + dep_durees[2])
+                if th4 is not None:
+                    found = b, th2, c, th4
+                    break
+            if found:
+                break
+        if found is None:
+            unplaced.append(train)
+            found = windows['b'][train][0], windows['th_dep'][train + (2,)][0], windows['c'][train][0], windows['th_dep'][train + (4,)][0]
+        b, th2, c, th4 = found
+        values['b'][train], values['c'][train] = b, c
+        values['th_dep'] |= {train + (1,): b, train + (2,): th2, train + (3,): c, train + (4,): th4}
+        timelines['FOR'].add(b)
+        timelines['DEG'].add(c)
+        for_.add(b, c + 15)
+        dep.add(c, train[2])
+
+    # envelopes: first one already used covering the task, else the first covering it
+    envelopes = dict(assigned or {})
+    used = set(envelopes.values())
+    tasks = sorted(values['th_arr'].items(), key=lambda item: item[1]) + sorted(values['th_dep'].items(), key=lambda item: item[1])
+    for key, start in tasks:
+        if key in envelopes:
+            continue
+        duree = (arr_durees if key[0] == 'ARR' else dep_durees)[key[3]-1]
+        candidates = [(roulement, i) for roulement, i, lo, hi in task_envelopes.get((key[0], key[3]), []) if lo <= start and start + duree <= hi]
+        if candidates:
+            envelopes[key] = next((candidate for candidate in candidates if candidate in used), candidates[0])
+            used.add(envelopes[key])
+    values['envelopes'] = envelopes
+    values['unplaced'] = unplaced
+    return values
+
+
+def incumbent_callback(model, where):
+    """Gurobi callback filling model._warm_start with the time of the first incumbent and whether the MIP start was accepted"""
+    if where == GRB.Callback.MESSAGE:
+        message = model.cbGet(GRB.Callback.MSG_STRING)
+        if 'Loaded user MIP start' in message:
+            model._warm_start['accepted'] = True
+        elif 'User MIP start' in message and model._warm_start['accepted'] is None:
+            model._warm_start['accepted'] = False
+    elif model._warm_start['first_incumbent'] is None and (
+        where == GRB.Callback.MIPSOL or (where == GRB.Callback.MIP and model.cbGet(GRB.Callback.MIP_SOLCNT) > 0)
+    ):
+        model._warm_start['first_incumbent'] = model.cbGet(GRB.Callback.RUNTIME)
@@ -0,0 +1,138 @@
+import math
+from bisect import bisect_left, bisect_right
+from gurobipy import GRB, tupledict
+
+
+def _round_window(lo, hi, horizon):
+    """Round a window to the 15 minutes grid the tasks start on and clip it to the horizon"""
+    lo = max(0, 15 * math.ceil(lo / 15))
+    hi = min(horizon, 15 * math.floor(hi / 15))
+    return lo, hi
+
+
+def machine_windows(trains_arr, trains_dep, trains_requis_dict, horizon, deb_duration, deb_delay, for_to_deg, deg_margin, slack=None):
+    """Earliest and latest start (in minutes) of DEB for the arrival trains and of FOR and DEG for the departure trains.
+
+    deb_delay: minimum time between arrival and DEB, for_to_deg: minimum time between FOR and DEG,
+    deg_margin: minimum time between DEG and departure. The bounds only follow from these delays and from
+    FOR starting after the DEB of the required arrival trains. Trains without correspondance have no such
+    bound and get `slack` minutes (whole horizon if None) of freedom around their sillon."""
+    slack = horizon if slack is None else slack
+    for_windows, deg_windows = {}, {}
+    for train in trains_dep:
+        deg_hi = train[2] - deg_margin
+        for_hi = deg_hi - for_to_deg
+        for_windows[train] = (None, for_hi)
+        deg_windows[train] = (None, deg_hi)
+
+    deb_windows = {}
+    for train in trains_arr:
+        deb_lo = train[2] + deb_delay
+        latest = [for_windows[train_dep][1] - deb_duration for train_dep, trains_requis in trains_requis_dict.items() if train in trains_requis]
+        deb_hi = min(latest) if latest else deb_lo + slack
+        deb_windows[train] = _round_window(deb_lo, deb_hi, horizon)
+
+    for train in trains_dep:
+        for_hi = for_windows[train][1]
+        earliest = [deb_windows[train_arr][0] + deb_duration for train_arr in trains_requis_dict.get(train, [])]
+        for_lo = max(earliest) if earliest else for_hi - slack
+        for_windows[train] = _round_window(for_lo, for_hi, horizon)
+        deg_windows[train] = _round_window(for_windows[train][0] + for_to_deg, deg_windows[train][1], horizon)
+    return deb_windows, for_windows, deg_windows
+
+
+def task_windows(trains, orders, durees, first_start, last_end, horizon):
+    """Earliest and latest start of each human task, the orders being chained one after the other.
+
+    first_start[train] is the earliest start of the first task and last_end[train] the latest end of the last one."""
+    windows = {}
+    for train in trains:
+        for order in orders:
+            lo = first_start[train] + sum(durees[:order-1])
+            hi = last_end[train] - sum(durees[order-1:len(orders)])
+            windows[train + (order,)] = _round_window(lo, hi, horizon)
+    return windows
+
+
+def slot_windows(minute_windows, nb_slots):
+    """Convert [start, end] windows in minutes into the inclusive range of 15 minutes slots they can cover"""
+    return {
+        key: (max(0, math.ceil(lo / 15)), min(nb_slots - 1, math.floor(hi / 15)))
+        for key, (lo, hi) in minute_windows.items()
+    }
+
+
+def add_window_vars(model, windows, name, vtype=GRB.BINARY):
+    """Create one variable per key and slot of its window only, instead of the full keys x minute_slots grid.
+    Keys are the window keys followed by the slot, as addVars(keys, minute_slots) would create them. The variables are
+    added by one addMVar with their names formatted as addVars does, faster than addVars creating them key by key."""
+    keys = [key + (slot,) for key, (first, last) in windows.items() for slot in range(first, last + 1)]
+    variables = model.addMVar(len(keys), vtype=vtype, name=[f"{name}[{','.join(map(str, key))}]" for key in keys])
+    return tupledict(zip(keys, variables.tolist()))
+
+
+def overlapping_pairs(trains, windows, gap, offsets=(0, 14)):
+    """Keys train1+train2+(offset,) of the machine disjunctions that are needed, train1 coming before train2 in `trains`.
+
+    A pair needs the disjunction at a given offset only if the two start windows are less than offset+gap apart,
+    otherwise the order of the two trains is already fixed by the bounds of their windows (with offset+gap = 0 the
+    disjunction always holds). Trains are swept by earliest start so each train is only compared to the ones whose
+    window can still overlap its own."""
+    position = {train: i for i, train in enumerate(trains)}
+    by_start = sorted(trains, key=lambda train: windows[train][0])
+    keys = []
+    for i, train1 in enumerate(by_start):
+        hi1 = windows[train1][1]
+        for train2 in by_start[i+1:]:
+            lo2 = windows[train2][0]
+            if lo2 >= hi1 + max(offsets) + gap:
+                break
+            first, second = (train1, train2) if position[train1] < position[train2] else (train2, train1)
+            keys.extend(first + second + (offset,) for offset in offsets if max(lo2 - hi1, 0) < offset + gap)
+    return keys
+
+
+def unavailable_intervals(periods):
+    """Flatten the periods of one machine or chantier, as returned by unavailable_machines/unavailable_chantiers, into
+    (start, end, occurrence, period) sorted by start. period is the start of the first occurrence, the second weekly
+    occurrence of a period being listed only if it exists."""
+    intervals = []
+    for start_time, end_time in periods:
+        intervals.append((start_time[0], end_time[0], 0, start_time[0]))
+        if start_time[1] != 0:
+            intervals.append((start_time[1], end_time[1], 1, start_time[0]))
+    return sorted(intervals)
+
+
+def split_unavailability(windows, intervals, epsilon, horizon, durations=None, keys=None):
+    """Compare the start window of each task to the sorted unavailable intervals of the resource it uses.
+
+    A task has to end before an interval starts or start after it ends. If only one side is possible its window is
+    tightened in place (bound change), if both are the (key, interval) pair is returned as it needs a disjunction.
+    Intervals that do not cut a start of the window (on the 15 minutes grid) are skipped, only the ones starting close
+    to it are looked at (bisect).
+    durations[key] is the duration of the task (0 if None), keys the subset of windows to look at (all if None)."""
+    starts = [interval[0] for interval in intervals]
+    longest = max((end - start for start, end, _, _ in intervals), default=0)
+    conflicts = []
+    for key in windows if keys is None else keys:
+        duration = durations[key] if durations is not None else 0
+        lo, hi = windows[key]
+        first = bisect_right(starts, lo - epsilon - longest)
+        last = bisect_left(starts, hi + duration + epsilon)
+        for interval in intervals[first:last]:
+            start, end = interval[:2]
+            lo, hi = windows[key]
+            # first start of the window the interval cuts, the starts being on the 15 minutes grid
+            cut = max(lo, 15 * (math.floor((start - epsilon - duration) / 15) + 1))
+            if cut > hi or cut >= end + epsilon:
+                continue
+            can_before = lo + duration <= start - epsilon
+            can_after = hi >= end + epsilon
+            if can_before == can_after:
+                conflicts.append((key, interval))
+            elif can_before:
+                windows[key] = _round_window(lo, start - epsilon - duration, horizon)
+            else:
+                windows[key] = _round_window(end + epsilon, hi, horizon)
+    return conflicts
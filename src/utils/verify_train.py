@@ -1,7 +1,7 @@
 import streamlit as st
-import pandas as pd
 from utils_date import minute_to_date2
-from utils_data import add_time_reference, format_trains, correspondance_for_depart
+from utils_data import MACHINE_SHEETS, add_time_reference, format_trains, correspondance_for_depart
+from utils_results import read_results
 
 # Mapping for file selection and their respective output files for DEB/DEG/FOR times
 FILE_MAP = {
@@ -15,11 +15,22 @@ st.title("Train Correspondance Tracker 🚆")
 selected_file_key = st.selectbox("Choisissez votre instance:", list(FILE_MAP.keys()))
 selected_file, results_file = FILE_MAP[selected_file_key]
 
+@st.cache_data
+def load_trains(fichier):
+    """Trains and correspondances of an instance, the workbook being read once per file instead of on every rerun"""
+    chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df, _, _, j1, jours, first_day = add_time_reference(fichier, MACHINE_SHEETS)
+    trains, trains_arr, trains_dep, *_ = format_trains(machines_df, sillons_arrivee_df, sillons_depart_df, chantiers_df, j1, jours, first_day)
+    return trains_arr, trains_dep, correspondances_df, j1
+
+@st.cache_data
+def load_results(results_file):
+    """Taches machine sheet of the results, columnar files if the model wrote some, else the xlsx file"""
+    return read_results(results_file, "Taches machine")
+
 # Load data
 st.write(f"🔄 Chargement des données pour: **{selected_file_key}**...")
-chantiers_df, machines_df, sillons_arrivee_df, sillons_depart_df, correspondances_df, j1, jours, first_day = add_time_reference(selected_file)
-trains, trains_arr, trains_dep, *_ = format_trains(machines_df, sillons_arrivee_df, sillons_depart_df, chantiers_df, j1, jours, first_day)
-results_df = pd.read_excel(results_file)
+trains_arr, trains_dep, correspondances_df, j1 = load_trains(selected_file)
+results_df = load_results(results_file)
 
 # Train number input
 train_num = st.number_input("Entrez le numéro du train de départ:", min_value=0, step=1, format="%d")
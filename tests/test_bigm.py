@@ -0,0 +1,134 @@
+import itertools
+from pathlib import Path
+import numpy as np
+import pytest
+from gurobipy import GRB
+from utils.utils_bigm import BigM
+from model_jalon1 import ModelJalon1
+from model_jalon2 import ModelJalon2
+from model_jalon3 import ModelJalon3
+
+DATA = Path(__file__).parent.parent / 'data'
+TOLERANCE = 1e-6
+
+
+def global_m(self, family, violation):
+    """BigM.__call__ of the global M: the model of one M for every row, the rows whose M is tightened differing from it"""
+    violation = np.asarray(violation, dtype=float)
+    return np.full(violation.shape, float(self.default)) if violation.ndim else float(self.default)
+
+
+def build(model_class, fichier, **options):
+    model = model_class(fichier=str(DATA / fichier), **options)
+    model.model.update()
+    return model.model
+
+
+def rows(model):
+    """(sense, rhs, {var index: coef}, {(var index, var index): coef}) of the linear then quadratic rows of model"""
+    result = []
+    for constr in model.getConstrs():
+        row = model.getRow(constr)
+        linear = {}
+        for i in range(row.size()):
+            linear[row.getVar(i).index] = linear.get(row.getVar(i).index, 0) + row.getCoeff(i)
+        result.append((constr.Sense, constr.RHS, linear, {}))
+    for qconstr in model.getQConstrs():
+        qrow = model.getQCRow(qconstr)
+        lin = qrow.getLinExpr()
+        linear, quadratic = {}, {}
+        for i in range(lin.size()):
+            linear[lin.getVar(i).index] = linear.get(lin.getVar(i).index, 0) + lin.getCoeff(i)
+        for i in range(qrow.size()):
+            key = (qrow.getVar1(i).index, qrow.getVar2(i).index)
+            quadratic[key] = quadratic.get(key, 0) + qrow.getCoeff(i)
+        result.append((qconstr.QCSense, qconstr.QCRHS, linear, quadratic))
+    return result
+
+
+def lhs_range(linear, quadratic, lb, ub):
+    """Smallest and largest value of the left-hand side over the box [lb, ub] of its variables"""
+    low = high = 0.0
+    for var, coef in linear.items():
+        low += min(coef * lb[var], coef * ub[var])
+        high += max(coef * lb[var], coef * ub[var])
+    for (var1, var2), coef in quadratic.items():
+        products = [coef * x * y for x in (lb[var1], ub[var1]) for y in (lb[var2], ub[var2])]
+        low += min(products)
+        high += max(products)
+    return low, high
+
+
+def holds(sense, rhs, low, high):
+    """True if a row with a left-hand side in [low, high] holds whatever its value"""
+    return high <= rhs + TOLERANCE if sense == GRB.LESS_EQUAL else low >= rhs - TOLERANCE
+
+
+def binary_bounds(variables, model_rows, lb, ub):
+    """Bounds of the binaries fixed to 1 - value when value violates a linear row whatever the other variables"""
+    lb, ub = lb.copy(), ub.copy()
+    forced = {}
+    for sense, rhs, linear, quadratic in model_rows:
+        if quadratic or sense == GRB.EQUAL:
+            continue
+        low, high = lhs_range(linear, {}, lb, ub)
+        for var, coef in linear.items():
+            if variables[var].VType != GRB.BINARY:
+                continue
+            # range of the row with the binary at value
+            own_low, own_high = min(coef * lb[var], coef * ub[var]), max(coef * lb[var], coef * ub[var])
+            for value in (0, 1):
+                if sense == GRB.LESS_EQUAL and low - own_low + coef * value > rhs + TOLERANCE:
+                    forced[var] = 1 - value
+                if sense == GRB.GREATER_EQUAL and high - own_high + coef * value < rhs - TOLERANCE:
+                    forced[var] = 1 - value
+    for var, value in forced.items():
+        lb[var] = ub[var] = value
+    return lb, ub
+
+
+CASES = [
+    pytest.param(ModelJalon1, 'instance_WPY_simple.xlsx', {}, id='jalon1'),
+    pytest.param(ModelJalon2, 'mini_instance.xlsx', {}, id='jalon2'),
+    pytest.param(ModelJalon3, 'instance_WPY_simple.xlsx', {'use_cache': False, 'build_mode': 'matrix', 'capacity_mode': 'slot'}, id='jalon3-matrix'),
+    pytest.param(ModelJalon3, 'instance_WPY_simple.xlsx', {'use_cache': False, 'build_mode': 'tupledict', 'capacity_mode': 'slot'}, id='jalon3-tupledict'),
+]
+
+
+@pytest.mark.parametrize('model_class, fichier, options', CASES)
+def test_big_m_covers_the_range_of_its_row(model_class, fichier, options):
+    """Each row whose big-M is tightened by BigM holds over the bounds of its variables for a value of its big-M binaries:
+    the tight M is at least the largest violation of the row, so that the row is switched off as with the global M."""
+    tight = build(model_class, fichier, **options)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(BigM, '__call__', global_m)
+        loose = build(model_class, fichier, **options)
+    tight_rows, loose_rows = rows(tight), rows(loose)
+    assert len(tight_rows) == len(loose_rows)
+
+    variables = tight.getVars()
+    lb = np.array([var.LB for var in variables])
+    ub = np.array([var.UB for var in variables])
+    lb, ub = binary_bounds(variables, tight_rows, lb, ub)
+
+    checked, invalid = 0, []
+    for (sense, rhs, linear, quadratic), (_, loose_rhs, loose_linear, loose_quadratic) in zip(tight_rows, loose_rows):
+        if linear == loose_linear and quadratic == loose_quadratic and rhs == loose_rhs:
+            continue
+        # binaries multiplied by M, whose coefficient changes with M
+        big_m_vars = sorted(var for var in linear.keys() | loose_linear.keys() if linear.get(var, 0) != loose_linear.get(var, 0))
+        assert big_m_vars and all(variables[var].VType == GRB.BINARY for var in big_m_vars)
+        # trains that cannot be scheduled (e.g. sillons before the horizon) have an empty box: no point to cut
+        row_vars = list(linear.keys() | {var for pair in quadratic for var in pair})
+        if (lb[row_vars] > ub[row_vars]).any():
+            continue
+        checked += 1
+        for values in itertools.product(*[range(int(lb[var]), int(ub[var]) + 1) for var in big_m_vars]):
+            row_lb, row_ub = lb.copy(), ub.copy()
+            row_lb[big_m_vars] = row_ub[big_m_vars] = values
+            if holds(sense, rhs, *lhs_range(linear, quadratic, row_lb, row_ub)):
+                break
+        else:
+            invalid.append((sense, rhs, {variables[var].VarName: coef for var, coef in linear.items()}))
+    assert checked > 0
+    assert not invalid, f'{len(invalid)} of {checked} big-M rows cut points of their bounds, e.g. {invalid[:3]}'
@@ -0,0 +1,200 @@
+import math
+from pathlib import Path
+import numpy as np
+import pytest
+from utils.utils_window import machine_windows, task_windows, slot_windows, overlapping_pairs, split_unavailability
+from utils.utils_matrix import compare_models
+from model_jalon3 import ModelJalon3
+
+DATA = Path(__file__).parent.parent / 'data'
+INSTANCE = str(DATA / 'instance_WPY_simple.xlsx')
+
+
+@pytest.fixture(scope='module')
+def model():
+    """ModelJalon3 of the simple instance with its data loaded, nothing built"""
+    return ModelJalon3(fichier=INSTANCE, dry_run=True, use_cache=False)
+
+
+def grid(lo, hi):
+    """Starts of the 15 minutes grid in [lo, hi]"""
+    return set(range(15 * math.ceil(lo / 15), hi + 1, 15))
+
+
+def propagate(domains, unary, precedences):
+    """Brute force reference of the windows: the values of each domain (set of starts) that satisfy the unary
+    constraints (key, test) and have a support in every precedence (x, y, k), start x + k <= start y, removed until
+    none is. For these difference constraints the values left are exactly the ones some feasible schedule takes."""
+    domains = {key: {value for value in values if all(test(value) for other, test in unary if other == key)} for key, values in domains.items()}
+    changed = True
+    while changed:
+        changed = False
+        for x, y, k in precedences:
+            if not domains[x] or not domains[y]:
+                continue
+            last_y, first_x = max(domains[y]), min(domains[x])
+            kept_x = {value for value in domains[x] if value + k <= last_y}
+            kept_y = {value for value in domains[y] if first_x + k <= value}
+            if kept_x != domains[x] or kept_y != domains[y]:
+                domains[x], domains[y] = kept_x, kept_y
+                changed = True
+    return domains
+
+
+def assert_windows(windows, domains):
+    """Each window is the hull of the feasible starts of its key, or empty (lo > hi) if there are none"""
+    for key, values in domains.items():
+        lo, hi = windows[key]
+        if values:
+            assert (lo, hi) == (min(values), max(values)), key
+        else:
+            assert lo > hi, key
+
+
+def machine_args(model):
+    """Arguments of machine_windows as ModelJalon3 gives them"""
+    return (
+        model.trains_arr, model.trains_dep, model.trains_requis_dict, max(model.minutes), model.machines_durees[0],
+        sum(model.arr_durees[:-1]), sum(model.dep_durees[:2]), sum(model.dep_durees[2:]), model.window_slack
+    )
+
+
+def test_machine_windows(model):
+    """DEB starts after the arrival and its tasks, FOR after the DEB of its required trains, DEG after FOR and before
+    the departure: the windows are the feasible starts of these precedences."""
+    horizon = max(model.minutes)
+    deb_duration, deb_delay, for_to_deg, deg_margin = machine_args(model)[4:8]
+    deb_windows, for_windows, deg_windows = machine_windows(*machine_args(model))
+
+    domains = {('a', train): grid(0, horizon) for train in model.trains_arr}
+    domains |= {(name, train): grid(0, horizon) for train in model.trains_dep for name in 'bc'}
+    unary = [(('a', train), lambda value, train=train: value >= train[2] + deb_delay) for train in model.trains_arr]
+    unary += [(('c', train), lambda value, train=train: value <= train[2] - deg_margin) for train in model.trains_dep]
+    precedences = [(('a', train), ('b', train_dep), deb_duration) for train_dep, trains in model.trains_requis_dict.items() for train in trains]
+    precedences += [(('b', train), ('c', train), for_to_deg) for train in model.trains_dep]
+    domains = propagate(domains, unary, precedences)
+
+    windows = {('a', train): window for train, window in deb_windows.items()}
+    windows |= {('b', train): window for train, window in for_windows.items()}
+    windows |= {('c', train): window for train, window in deg_windows.items()}
+    assert_windows(windows, domains)
+
+
+@pytest.mark.parametrize('side', ['arr', 'dep'])
+def test_task_windows(model, side):
+    """The human tasks of a train are chained from its first start to its last end: the windows are the feasible
+    starts of the chain."""
+    horizon = max(model.minutes)
+    deb_windows, for_windows, _ = machine_windows(*machine_args(model))
+    if side == 'arr':
+        trains, orders, durees = model.trains_arr, model.arr_orders, model.arr_durees
+        first_start = {train: train[2] for train in trains}
+        last_end = {train: deb_windows[train][1] + durees[-1] for train in trains}
+    else:
+        trains, orders, durees = model.trains_dep, model.dep_orders, model.dep_durees
+        first_start = {train: for_windows[train][0] for train in trains}
+        last_end = {train: train[2] for train in trains}
+    windows = task_windows(trains, orders, durees, first_start, last_end, horizon)
+
+    domains = {train + (order,): grid(0, horizon) for train in trains for order in orders}
+    unary = [(train + (orders[0],), lambda value, train=train: value >= first_start[train]) for train in trains]
+    unary += [(train + (orders[-1],), lambda value, train=train: value + durees[-1] <= last_end[train]) for train in trains]
+    precedences = [(train + (order,), train + (order + 1,), durees[order - 1]) for train in trains for order in orders[:-1]]
+    assert_windows(windows, propagate(domains, unary, precedences))
+
+
+def test_slot_windows(model):
+    """The slots of a window are the ones starting in it, within the horizon"""
+    nb_slots = len(model.minute_slots)
+    windows = task_windows(
+        model.trains_dep, model.dep_orders, model.dep_durees, {train: train[2] - 600 for train in model.trains_dep},
+        {train: train[2] for train in model.trains_dep}, max(model.minutes)
+    )
+    minute_windows = {key: (lo, hi + model.dep_durees[key[3]-1]) for key, (lo, hi) in windows.items()}
+    minute_windows |= {('edge', 'before'): (-100, 40), ('edge', 'after'): (10000, 20000), ('edge', 'empty'): (50, 55)}
+    slots = slot_windows(minute_windows, nb_slots)
+    assert slots.keys() == minute_windows.keys()
+    for key, (lo, hi) in minute_windows.items():
+        first, last = slots[key]
+        assert list(range(first, last + 1)) == [slot for slot in range(nb_slots) if lo <= 15 * slot <= hi], key
+
+
+@pytest.mark.parametrize('gap', [0, 1])
+@pytest.mark.parametrize('machine', ['deb', 'for', 'deg'])
+def test_overlapping_pairs(model, machine, gap):
+    """A pair gets the disjunction of an offset only if two starts of its windows are closer than offset + gap, that is
+    if the disjunction cuts a point of the windows. The bounds are on the 15 minutes grid, so the closest starts are too."""
+    windows = dict(zip(['deb', 'for', 'deg'], machine_windows(*machine_args(model))))[machine]
+    trains = model.trains_arr if machine == 'deb' else model.trains_dep
+    keys = overlapping_pairs(trains, windows, gap)
+    assert len(keys) == len(set(keys))
+
+    expected = []
+    for i, train1 in enumerate(trains):
+        for train2 in trains[i+1:]:
+            starts1, starts2 = sorted(grid(*windows[train1])), sorted(grid(*windows[train2]))
+            if not starts1 or not starts2:
+                continue
+            distance = np.abs(np.subtract.outer(starts1, starts2)).min()
+            expected.extend(train1 + train2 + (offset,) for offset in (0, 14) if distance < offset + gap)
+    assert expected
+    assert sorted(keys) == sorted(expected)
+
+
+def task_cases(model):
+    """(windows, intervals, durations, keys) given to split_unavailability by ModelJalon3 on the simple instance"""
+    horizon = max(model.minutes)
+    deb_windows, for_windows, deg_windows = machine_windows(*machine_args(model))
+    th_dep_windows = task_windows(
+        model.trains_dep, model.dep_orders, model.dep_durees, {train: for_windows[train][0] for train in model.trains_dep},
+        {train: train[2] for train in model.trains_dep}, horizon
+    )
+    machine, chantier = model.machine_intervals, model.chantier_intervals
+    keys = [key for key in th_dep_windows if key[3] in model.dep_orders[:-1]]
+    # intervals ending on the earliest or latest start, starting on the latest one, inside and around the FOR windows
+    edges = [
+        sorted({(start, end, 0, start) for start, end in (edge(lo, hi) for lo, hi in for_windows.values())}) for edge in [
+            lambda lo, hi: (lo - 30, lo), lambda lo, hi: (hi - 30, hi), lambda lo, hi: (hi, hi + 30),
+            lambda lo, hi: (lo + 15, lo + 30), lambda lo, hi: (lo - 15, hi + 15),
+        ]
+    ]
+    return [
+        (deb_windows, machine['DEB'], None, None),
+        (for_windows, machine['FOR'], None, None),
+        (deg_windows, machine['DEG'], None, None),
+        (for_windows, chantier['WPY_FOR'], None, None),
+        (th_dep_windows, chantier['WPY_FOR'], {key: model.dep_durees[key[3]-1] for key in keys}, keys),
+    ] + [(for_windows, intervals, None, None) for intervals in edges]
+
+
+@pytest.mark.parametrize('epsilon', [0, 1])
+@pytest.mark.parametrize('case', range(10))
+def test_split_unavailability(model, case, epsilon):
+    """A window keeps every start avoiding the unavailable intervals, and the intervals it still meets are the ones
+    returned as needing a disjunction."""
+    windows, intervals, durations, keys = task_cases(model)[case]
+    tightened = dict(windows)
+    conflicts = split_unavailability(tightened, intervals, epsilon, max(model.minutes), durations, keys)
+    assert len(conflicts) == len(set(conflicts))
+    conflicting = {}
+    for key, interval in conflicts:
+        conflicting.setdefault(key, []).append(interval)
+
+    for key in windows if keys is None else keys:
+        duration = durations[key] if durations is not None else 0
+        avoids = lambda start, interval: start + duration <= interval[0] - epsilon or start >= interval[1] + epsilon
+        starts = grid(*tightened[key])
+        assert {start for start in grid(*windows[key]) if all(avoids(start, interval) for interval in intervals)} <= starts, key
+        for interval in intervals:
+            if interval in conflicting.get(key, []):
+                assert not all(avoids(start, interval) for start in grid(*windows[key])), (key, interval)
+            else:
+                assert all(avoids(start, interval) for start in starts), (key, interval)
+
+
+@pytest.mark.parametrize('capacity_mode', ['slot', 'event'])
+def test_matrix_build_matches_tupledict(capacity_mode):
+    """The matrix build gives the same rows as the tupledict build"""
+    tupledict = ModelJalon3('tupledict', fichier=INSTANCE, capacity_mode=capacity_mode, use_cache=False)
+    matrix = ModelJalon3('matrix', fichier=INSTANCE, capacity_mode=capacity_mode, use_cache=False)
+    assert compare_models(tupledict.model, matrix.model) == []